@@ -16,6 +16,20 @@ class Settings(BaseSettings):
 
     session_secret: str = "CHANGE_ME"
     cookie_https_only: bool = False
+    debug: bool = False
+
+    thumb_cache_max_mb: int = 256
+    max_concurrent_exports: int = 4
+    upload_session_ttl_hours: int = 24
+    pdf_workers: int = 2
+    pdf_cache_max_mb: int = 512
+    import_max_mb: int = 20
+    # 0 disables the overdue-task reminder job
+    task_reminder_interval_seconds: int = 300
+    # /metrics answers "Authorization: Bearer <token>" and admin sessions; without it, admins only
+    metrics_token: str = ""
+    # records the queries of every request for /admin/profiler and logs likely N+1s
+    sql_profiler: bool = False
 
 
 settings = Settings()
@@ -0,0 +1,145 @@
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict
+from app.core.config import settings
+from app.data.sqlite import conn
+
+# Open stays older than this are listed as stuck.
+STUCK_AFTER_DAYS = 30
+# End states: students resting there are done, not stuck.
+TERMINAL_STATUSES = ("Refusé", "Voyage effectué")
+# Ways out of the funnel rather than steps of it; left out of the stage-to-stage conversion.
+EXIT_STATUSES = ("Refusé",)
+# How long the computed funnel is served from memory before the next incremental refresh.
+FUNNEL_CACHE_SECONDS = 300
+
+_cache: Dict[str, Any] = {"at": 0.0, "data": None}
+
+# Each history row opens a stay in its target status; the next row of the same
+# student (LEAD over the per-student timeline) closes it.
+_STAYS_SQL = """
+    INSERT INTO status_stays(history_id, student_id, status_id, entered_at, left_at, next_status_id)
+    SELECT id, student_id, to_status_id, changed_at,
+           LEAD(changed_at) OVER w, LEAD(to_status_id) OVER w
+    FROM student_status_history
+    {where}
+    WINDOW w AS (PARTITION BY student_id ORDER BY changed_at, id)
+"""
+
+
+def refresh_status_stays(c) -> int:
+    """Bring status_stays up to date with student_status_history; returns the students recomputed.
+
+    Only students with history rows past the stored watermark are rebuilt, so a
+    refresh costs in proportion to what changed since the previous one.
+    """
+    row = c.execute("SELECT value FROM analytics_state WHERE name='status_stays_history_id'").fetchone()
+    watermark = row["value"] if row else 0
+    top = c.execute("SELECT COALESCE(MAX(id), 0) AS m FROM student_status_history").fetchone()["m"]
+    if top == watermark:
+        return 0
+
+    if watermark == 0:
+        c.execute("DELETE FROM status_stays")
+        c.execute(_STAYS_SQL.format(where=""))
+        touched = c.execute("SELECT COUNT(DISTINCT student_id) AS n FROM status_stays").fetchone()["n"]
+    else:
+        c.execute("DROP TABLE IF EXISTS temp.touched_students")
+        c.execute(
+            "CREATE TEMP TABLE touched_students AS SELECT DISTINCT student_id FROM student_status_history WHERE id > ?",
+            (watermark,),
+        )
+        c.execute("DELETE FROM status_stays WHERE student_id IN (SELECT student_id FROM temp.touched_students)")
+        c.execute(_STAYS_SQL.format(where="WHERE student_id IN (SELECT student_id FROM temp.touched_students)"))
+        touched = c.execute("SELECT COUNT(*) AS n FROM temp.touched_students").fetchone()["n"]
+        c.execute("DROP TABLE temp.touched_students")
+
+    c.execute(
+        "INSERT INTO analytics_state(name, value) VALUES('status_stays_history_id', ?) "
+        "ON CONFLICT(name) DO UPDATE SET value=excluded.value",
+        (top,),
+    )
+    return touched
+
+
+def _compute_funnel(c, now: datetime) -> Dict[str, Any]:
+    cutoff = (now - timedelta(days=STUCK_AFTER_DAYS)).isoformat(timespec="seconds")
+    now = now.isoformat(timespec="seconds")
+    stages = [
+        dict(r)
+        for r in c.execute(
+            """
+            SELECT st.id, st.name, st.sort_order,
+                   COUNT(DISTINCT ss.student_id) AS reached,
+                   SUM(ss.history_id IS NOT NULL AND ss.left_at IS NULL) AS current,
+                   AVG(CASE WHEN ss.left_at IS NOT NULL
+                            THEN julianday(ss.left_at) - julianday(ss.entered_at) END) AS avg_days,
+                   MAX(CASE WHEN ss.left_at IS NOT NULL
+                            THEN julianday(ss.left_at) - julianday(ss.entered_at) END) AS max_days,
+                   AVG(CASE WHEN ss.left_at IS NULL
+                            THEN julianday(?) - julianday(ss.entered_at) END) AS current_avg_days
+            FROM statuses st
+            LEFT JOIN status_stays ss ON ss.status_id = st.id
+            WHERE st.active = 1
+            GROUP BY st.id
+            ORDER BY st.sort_order, st.name
+            """,
+            (now,),
+        )
+    ]
+    previous = None
+    for stage in stages:
+        stage["current"] = stage["current"] or 0
+        stage["conversion"] = None
+        if stage["name"] in EXIT_STATUSES:
+            continue
+        if previous and previous["reached"]:
+            stage["conversion"] = stage["reached"] / previous["reached"]
+        previous = stage
+
+    marks = ",".join("?" * len(TERMINAL_STATUSES))
+    stuck = [
+        dict(r)
+        for r in c.execute(
+            f"""
+            SELECT s.id, s.full_name, s.agent_name, st.name AS status_name, ss.entered_at,
+                   julianday(?) - julianday(ss.entered_at) AS days
+            FROM status_stays ss
+            JOIN students s ON s.id = ss.student_id AND s.status_id = ss.status_id
+            JOIN statuses st ON st.id = ss.status_id
+            WHERE ss.left_at IS NULL
+              AND ss.entered_at < ?
+              AND st.name NOT IN ({marks})
+            ORDER BY ss.entered_at
+            LIMIT 200
+            """,
+            (now, cutoff, *TERMINAL_STATUSES),
+        )
+    ]
+    return {"available": True, "stages": stages, "stuck": stuck, "stuck_after_days": STUCK_AFTER_DAYS, "computed_at": now}
+
+
+async def funnel_analytics(db: Any, *, force: bool = False) -> Dict[str, Any]:
+    """Stage reach, conversion, time spent per status and stuck students.
+
+    Served from memory for FUNNEL_CACHE_SECONDS; a miss first folds new history
+    rows into status_stays, then aggregates over that table.
+    """
+    if not force and _cache["data"] is not None and time.monotonic() - _cache["at"] < FUNNEL_CACHE_SECONDS:
+        return _cache["data"]
+
+    if settings.db_backend != "sqlite":
+        # status_stays only exists in SQLite; the page says so instead of showing an empty funnel.
+        return {"available": False, "stages": [], "stuck": [], "stuck_after_days": STUCK_AFTER_DAYS, "computed_at": None}
+
+    now = datetime.utcnow()
+    c = conn()
+    try:
+        refresh_status_stays(c)
+        c.commit()
+        data = _compute_funnel(c, now)
+    finally:
+        c.close()
+
+    _cache.update(at=time.monotonic(), data=data)
+    return data
@@ -0,0 +1,131 @@
+import time
+from typing import Any, Dict, List, Optional
+from app.core.config import settings
+from app.data.sqlite import conn
+
+CATALOG_KINDS = ("statuses", "users", "partners")
+# Writes made by another worker are picked up within this delay; this worker's own
+# writes are seen on the next read.
+VERSION_CHECK_SECONDS = 2.0
+
+_SQLITE_LOADERS = {
+    "statuses": "SELECT id, name, active, sort_order FROM statuses ORDER BY sort_order ASC, name ASC",
+    "users": "SELECT id, full_name, email, role, active FROM users ORDER BY full_name",
+    "partners": "SELECT * FROM partners ORDER BY name ASC",
+}
+
+
+class Catalog:
+    """Reference rows kept in memory, with id lookups keyed on ``str(id)``."""
+
+    def __init__(self) -> None:
+        self.rows: Dict[str, List[Dict[str, Any]]] = {k: [] for k in CATALOG_KINDS}
+        self.by_id: Dict[str, Dict[str, Dict[str, Any]]] = {k: {} for k in CATALOG_KINDS}
+        self.versions: Dict[str, int] = {}
+        self.stale = set(CATALOG_KINDS)
+        self.checked_at = 0.0
+
+    def _set(self, kind: str, rows: List[Dict[str, Any]], version: int) -> None:
+        self.rows[kind] = rows
+        self.by_id[kind] = {str(r.get("id", r.get("_id"))): r for r in rows}
+        self.versions[kind] = version
+
+    def get(self, kind: str, row_id: Any) -> Optional[Dict[str, Any]]:
+        return self.by_id[kind].get(str(row_id)) if row_id is not None else None
+
+    def search(self, kind: str, prefix: str, fields: tuple, *, limit: int = 10, rows=None) -> List[Dict[str, Any]]:
+        """Rows where a word of one of ``fields`` starts with ``prefix`` (case-insensitive)."""
+        needle = prefix.strip().lower()
+        if not needle:
+            return []
+        found = []
+        for r in self.rows[kind] if rows is None else rows:
+            if any(w.startswith(needle) for f in fields for w in str(r.get(f) or "").lower().split()):
+                found.append(r)
+                if len(found) >= limit:
+                    break
+        return found
+
+    def status_name(self, status_id: Any) -> Optional[str]:
+        row = self.get("statuses", status_id)
+        return row["name"] if row else None
+
+    def user_name(self, user_id: Any) -> Optional[str]:
+        row = self.get("users", user_id)
+        return row["full_name"] if row else None
+
+    def partner_name(self, partner_id: Any) -> Optional[str]:
+        row = self.get("partners", partner_id)
+        return row["name"] if row else None
+
+
+catalog = Catalog()
+
+
+def bump_catalog_version(c, kind: str) -> None:
+    """Record a write to ``kind`` on the writer's connection, so every worker reloads it."""
+    c.execute(
+        "INSERT INTO catalog_versions(name, version) VALUES(?, 1) "
+        "ON CONFLICT(name) DO UPDATE SET version = version + 1",
+        (kind,),
+    )
+    catalog.stale.add(kind)
+
+
+async def bump_catalog_version_mongo(db: Any, kind: str) -> None:
+    await db.catalog_versions.update_one({"_id": kind}, {"$inc": {"version": 1}}, upsert=True)
+    catalog.stale.add(kind)
+
+
+async def _read_versions(db: Any) -> Dict[str, int]:
+    if settings.db_backend != "sqlite":
+        return {d["_id"]: d["version"] async for d in db.catalog_versions.find({})}
+    c = conn()
+    try:
+        return {r["name"]: r["version"] for r in c.execute("SELECT name, version FROM catalog_versions")}
+    finally:
+        c.close()
+
+
+async def _reload(db: Any, kinds: set) -> None:
+    if "statuses" in kinds and settings.db_backend == "sqlite":
+        from app.data.statuses import _seed_default_statuses
+
+        _seed_default_statuses()
+        catalog.stale.discard("statuses")
+
+    if settings.db_backend != "sqlite":
+        versions = await _read_versions(db)
+        for kind in kinds:
+            if kind == "statuses":
+                rows = [s async for s in db.statuses.find({}).sort("sort_order", 1)]
+            elif kind == "users":
+                rows = [u async for u in db.users.find({}, {"password_hash": 0}).sort("full_name", 1)]
+            else:
+                # Placeholder for mongo
+                rows = []
+            catalog._set(kind, rows, versions.get(kind, 0))
+        return
+
+    c = conn()
+    try:
+        # Versions are read before the rows: a write landing in between leaves an older
+        # version recorded, which only triggers one more reload.
+        versions = {r["name"]: r["version"] for r in c.execute("SELECT name, version FROM catalog_versions")}
+        for kind in kinds:
+            catalog._set(kind, [dict(r) for r in c.execute(_SQLITE_LOADERS[kind])], versions.get(kind, 0))
+    finally:
+        c.close()
+
+
+async def get_catalog(db: Any) -> Catalog:
+    """The reference catalog, reloading only the kinds whose version stamp moved."""
+    now = time.monotonic()
+    if now - catalog.checked_at >= VERSION_CHECK_SECONDS:
+        versions = await _read_versions(db)
+        catalog.stale.update(k for k in CATALOG_KINDS if versions.get(k, 0) != catalog.versions.get(k))
+        catalog.checked_at = now
+    if catalog.stale:
+        kinds, catalog.stale = set(catalog.stale), set()
+        await _reload(db, kinds)
+    return catalog
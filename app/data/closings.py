@@ -0,0 +1,212 @@
+import re
+from calendar import monthrange
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional
+from app.core.config import settings
+from app.data.sqlite import conn
+
+# A period is a day (YYYY-MM-DD) or a month (YYYY-MM). Closing one freezes its cash
+# totals per payment mode, currency and agent into cash_closings; from then on the
+# payments dated inside it can no longer be added, confirmed or deleted.
+
+_DAY_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+_MONTH_RE = re.compile(r"^\d{4}-\d{2}$")
+
+
+def _next_day(day: str) -> str:
+    return (date.fromisoformat(day) + timedelta(days=1)).isoformat()
+
+
+class PeriodClosed(ValueError):
+    """A write would change the received payments of a closed accounting period."""
+
+
+def period_bounds(period: str) -> tuple[str, str, str]:
+    """``(kind, first_day, last_day)`` of a day or month period; ValueError when malformed."""
+    period = (period or "").strip()
+    if _DAY_RE.match(period):
+        datetime.strptime(period, "%Y-%m-%d")
+        return "day", period, period
+    if _MONTH_RE.match(period):
+        year, month = (int(x) for x in period.split("-"))
+        if not 1 <= month <= 12:
+            raise ValueError(period)
+        return "month", f"{period}-01", f"{period}-{monthrange(year, month)[1]:02d}"
+    raise ValueError(period)
+
+
+def ensure_open(c, payment_date: Optional[str]) -> None:
+    """Raise PeriodClosed when ``payment_date`` falls in a closed day or month."""
+    day = (payment_date or "")[:10]
+    if not day:
+        return
+    row = c.execute("SELECT period FROM closed_periods WHERE period IN (?, ?) LIMIT 1", (day, day[:7])).fetchone()
+    if row:
+        raise PeriodClosed(row["period"])
+
+
+async def is_period_closed(db: Any, payment_date: Optional[str]) -> bool:
+    if settings.db_backend != "sqlite":
+        # close_period refuses to run on Mongo, so no period there is ever closed.
+        return False
+    c = conn()
+    try:
+        ensure_open(c, payment_date)
+        return False
+    except PeriodClosed:
+        return True
+    finally:
+        c.close()
+
+
+_TOTALS_SQL = """
+    SELECT p.payment_mode, p.currency, s.agent_user_id, s.agent_name,
+           COUNT(*) AS payment_count, COALESCE(SUM(p.amount), 0) AS total
+    FROM payments p
+    JOIN students s ON s.id = p.student_id
+    WHERE p.payment_status = 'received' AND p.payment_date >= ? AND p.payment_date < ?
+    GROUP BY p.payment_mode, p.currency, s.agent_user_id, s.agent_name
+    ORDER BY p.currency, p.payment_mode, s.agent_name
+"""
+
+
+def _freeze(c, period: str, kind: str, first: str, last: str, closed_by_user_id: Optional[int], now: str) -> None:
+    rows = c.execute(_TOTALS_SQL, (first, _next_day(last))).fetchall()
+    c.execute(
+        """
+        INSERT INTO closed_periods(period, kind, date_from, date_to, payment_count, closed_at, closed_by_user_id)
+        VALUES(?,?,?,?,?,?,?)
+        """,
+        (period, kind, first, last, sum(r["payment_count"] for r in rows), now, closed_by_user_id),
+    )
+    c.executemany(
+        """
+        INSERT INTO cash_closings(period, payment_mode, currency, agent_user_id, agent_name, payment_count, total)
+        VALUES(?,?,?,?,?,?,?)
+        """,
+        [
+            (period, r["payment_mode"], r["currency"], r["agent_user_id"], r["agent_name"], r["payment_count"], r["total"])
+            for r in rows
+        ],
+    )
+
+
+async def close_period(db: Any, period: str, *, closed_by_user_id: Optional[int]) -> None:
+    """Freeze the cash totals of a past day or month.
+
+    Closing a month also closes each of its days still open. Refused (ValueError
+    with a message for the user) while the period is not over, is already closed
+    or still has payments waiting for confirmation.
+    """
+    kind, first, last = period_bounds(period)
+    if settings.db_backend != "sqlite":
+        raise ValueError("Clôture indisponible sur ce backend")
+
+    today = datetime.utcnow().strftime("%Y-%m-%d")
+    if last >= today:
+        raise ValueError("La période n'est pas terminée")
+    now = datetime.utcnow().isoformat(timespec="seconds")
+    c = conn()
+    try:
+        c.execute("BEGIN IMMEDIATE")
+        if c.execute("SELECT 1 FROM closed_periods WHERE period = ?", (period,)).fetchone():
+            raise ValueError("Période déjà clôturée")
+        pending = c.execute(
+            "SELECT COUNT(*) AS n FROM payments WHERE payment_status = 'pending' AND payment_date >= ? AND payment_date < ?",
+            (first, _next_day(last)),
+        ).fetchone()["n"]
+        if pending:
+            raise ValueError(f"{pending} paiement(s) en attente de validation sur cette période")
+
+        if kind == "month":
+            closed_days = {
+                r["period"]
+                for r in c.execute("SELECT period FROM closed_periods WHERE period >= ? AND period <= ?", (first, last))
+            }
+            for n in range(1, int(last[-2:]) + 1):
+                day = f"{period}-{n:02d}"
+                if day not in closed_days:
+                    _freeze(c, day, "day", day, day, closed_by_user_id, now)
+        _freeze(c, period, kind, first, last, closed_by_user_id, now)
+        c.commit()
+    except Exception:
+        c.rollback()
+        raise
+    finally:
+        c.close()
+
+
+async def _mongo_totals(db: Any, date_from: str, date_to_exclusive: str) -> List[Dict[str, Any]]:
+    """Mongo counterpart of _TOTALS_SQL."""
+    cur = db.payments.aggregate(
+        [
+            {"$match": {"payment_status": "received", "payment_date": {"$gte": date_from, "$lt": date_to_exclusive}}},
+            {"$lookup": {"from": "students", "localField": "student_id", "foreignField": "_id", "as": "s"}},
+            {"$unwind": "$s"},
+            {
+                "$group": {
+                    "_id": {
+                        "payment_mode": "$payment_mode",
+                        "currency": "$currency",
+                        "agent_user_id": "$s.agent_user_id",
+                        "agent_name": "$s.agent_name",
+                    },
+                    "payment_count": {"$sum": 1},
+                    "total": {"$sum": "$amount"},
+                }
+            },
+            {"$sort": {"_id.currency": 1, "_id.payment_mode": 1, "_id.agent_name": 1}},
+        ]
+    )
+    return [{**g["_id"], "payment_count": g["payment_count"], "total": g["total"]} async for g in cur]
+
+
+async def cash_totals(db: Any, period: str) -> Dict[str, Any]:
+    """Cash totals of a period per mode, currency and agent.
+
+    Closed periods are read from their frozen rows; open ones are summed from
+    the payments table.
+    """
+    kind, first, last = period_bounds(period)
+    result: Dict[str, Any] = {"period": period, "kind": kind, "date_from": first, "date_to": last, "closing": None, "rows": [], "totals_by_currency": {}}
+    if settings.db_backend != "sqlite":
+        # Nothing is ever closed on Mongo (see close_period): always the live sums.
+        result["rows"] = await _mongo_totals(db, first, _next_day(last))
+    else:
+        c = conn()
+        try:
+            closing = c.execute("SELECT * FROM closed_periods WHERE period = ?", (period,)).fetchone()
+            if closing:
+                result["closing"] = dict(closing)
+                rows = c.execute(
+                    "SELECT * FROM cash_closings WHERE period = ? ORDER BY currency, payment_mode, agent_name", (period,)
+                ).fetchall()
+            else:
+                rows = c.execute(_TOTALS_SQL, (first, _next_day(last))).fetchall()
+        finally:
+            c.close()
+        result["rows"] = [dict(r) for r in rows]
+
+    for r in result["rows"]:
+        result["totals_by_currency"][r["currency"]] = result["totals_by_currency"].get(r["currency"], 0) + int(r["total"])
+    return result
+
+
+async def list_closed_periods(db: Any, limit: int = 60) -> List[Dict[str, Any]]:
+    if settings.db_backend != "sqlite":
+        return []
+    c = conn()
+    try:
+        cur = c.execute(
+            """
+            SELECT cp.*, u.full_name AS closed_by_name
+            FROM closed_periods cp
+            LEFT JOIN users u ON u.id = cp.closed_by_user_id
+            ORDER BY cp.date_from DESC, cp.kind DESC
+            LIMIT ?
+            """,
+            (limit,),
+        )
+        return [dict(r) for r in cur.fetchall()]
+    finally:
+        c.close()
@@ -0,0 +1,203 @@
+import re
+from typing import Any, Dict, List, Optional
+from pymongo import UpdateOne
+from app.core.config import settings
+from app.data.sqlite import conn
+
+# National numbers here are 9 digits; keeping only the last 9 makes "+221 77 …",
+# "00221 77 …" and "77 …" (or "+33 6 …" and "06 …") fall on the same key.
+PHONE_KEY_DIGITS = 9
+
+
+def phone_key(phone: Optional[str]) -> Optional[str]:
+    """Comparable form of a phone number, or None when it has no digits."""
+    digits = re.sub(r"\D", "", str(phone or ""))
+    return digits[-PHONE_KEY_DIGITS:] or None
+
+
+def email_key(email: Optional[str]) -> Optional[str]:
+    key = (email or "").strip().lower()
+    return key or None
+
+
+def backfill_contact_keys(c, table: str) -> None:
+    """Fill phone_key/email_key for rows written before the columns existed."""
+    c.create_function("_phone_key", 1, phone_key, deterministic=True)
+    c.create_function("_email_key", 1, email_key, deterministic=True)
+    c.execute(f"UPDATE {table} SET phone_key = _phone_key(phone), email_key = _email_key(email)")
+
+
+async def backfill_mongo_contact_keys(db: Any, batch_size: int = 500) -> int:
+    """Mongo counterpart of backfill_contact_keys, for student documents written before the keys.
+
+    Only documents still missing ``phone_key`` are read, so it is cheap to re-run.
+    Returns the number of documents updated.
+    """
+    if settings.db_backend == "sqlite":
+        return 0
+
+    updated = 0
+    ops = []
+    async for s in db.students.find({"phone_key": {"$exists": False}}, {"phone": 1, "email": 1}):
+        ops.append(UpdateOne({"_id": s["_id"]}, {"$set": {"phone_key": phone_key(s.get("phone")), "email_key": email_key(s.get("email"))}}))
+        if len(ops) >= batch_size:
+            updated += (await db.students.bulk_write(ops, ordered=False)).modified_count
+            ops = []
+    if ops:
+        updated += (await db.students.bulk_write(ops, ordered=False)).modified_count
+    return updated
+
+
+_MATCH_SQL = """
+    SELECT '{kind}' AS kind, id, full_name, phone, email, agent_name, agent_user_id, created_at,
+           CASE WHEN phone_key = :phone THEN 'phone' ELSE 'email' END AS matched_on
+    FROM {table}
+    WHERE (phone_key = :phone OR email_key = :email) AND id != :exclude
+    LIMIT :limit
+"""
+
+
+async def find_contact_duplicates(
+    db: Any,
+    *,
+    phone: Optional[str],
+    email: Optional[str],
+    exclude_student_id: Optional[int] = None,
+    exclude_prospect_id: Optional[int] = None,
+    agent_user_id: Any = None,
+    limit: int = 10,
+) -> List[Dict[str, Any]]:
+    """Students and prospects sharing the phone or email key, for a warning before creating.
+
+    Both lookups are equality probes on the partial key indexes. With
+    ``agent_user_id``, matches that agent cannot open (other agents' students and
+    prospects) only tell that the contact exists elsewhere: no name, contact
+    details or id.
+    """
+    keys = {"phone": phone_key(phone), "email": email_key(email)}
+    if not keys["phone"] and not keys["email"]:
+        return []
+
+    if settings.db_backend != "sqlite":
+        ors = [{f"{k}_key": v} for k, v in keys.items() if v]
+        cur = db.students.find({"$or": ors, "_id": {"$ne": exclude_student_id}}).limit(limit)
+        matches = [
+            {**s, "kind": "student", "id": str(s["_id"]), "matched_on": "phone" if s.get("phone_key") == keys["phone"] else "email"}
+            async for s in cur
+        ]
+    else:
+        c = conn()
+        try:
+            matches = []
+            for kind, table, exclude in (("student", "students", exclude_student_id), ("prospect", "prospects", exclude_prospect_id)):
+                rows = c.execute(
+                    _MATCH_SQL.format(kind=kind, table=table),
+                    {**keys, "exclude": exclude if exclude is not None else -1, "limit": limit},
+                ).fetchall()
+                matches.extend(dict(r) for r in rows)
+        finally:
+            c.close()
+
+    if agent_user_id is None:
+        return matches
+    return [_visible_match(m, agent_user_id) for m in matches]
+
+
+def _visible_match(match: Dict[str, Any], agent_user_id: Any) -> Dict[str, Any]:
+    owner = match.get("agent_user_id")
+    # Unassigned prospects are the shared pool every agent sees in the prospect list.
+    if str(owner) == str(agent_user_id) or (owner is None and match["kind"] == "prospect"):
+        return match
+    return {"kind": match["kind"], "matched_on": match["matched_on"], "other_agent": True}
+
+
+async def duplicate_report(db: Any) -> List[List[Dict[str, Any]]]:
+    """Groups of students/prospects that probably are the same person.
+
+    Records are blocked on their phone and email keys: only records sharing a key
+    are ever compared, and records linked through either key are merged into one
+    group (union-find), so the cost is a sort of the keys rather than all pairs.
+    Largest groups first.
+    """
+    if settings.db_backend != "sqlite":
+        return _group_duplicates(await _mongo_duplicate_rows(db))
+
+    c = conn()
+    try:
+        rows = [
+            dict(r)
+            for r in c.execute(
+                """
+                WITH dup_phone AS (
+                    SELECT phone_key FROM (SELECT phone_key FROM students UNION ALL SELECT phone_key FROM prospects)
+                    WHERE phone_key IS NOT NULL GROUP BY phone_key HAVING COUNT(*) > 1
+                ), dup_email AS (
+                    SELECT email_key FROM (SELECT email_key FROM students UNION ALL SELECT email_key FROM prospects)
+                    WHERE email_key IS NOT NULL GROUP BY email_key HAVING COUNT(*) > 1
+                )
+                SELECT 'student' AS kind, id, full_name, phone, email, agent_name, created_at, phone_key, email_key
+                FROM students
+                WHERE phone_key IN dup_phone OR email_key IN dup_email
+                UNION ALL
+                SELECT 'prospect' AS kind, id, full_name, phone, email, agent_name, created_at, phone_key, email_key
+                FROM prospects
+                WHERE phone_key IN dup_phone OR email_key IN dup_email
+                """
+            )
+        ]
+    finally:
+        c.close()
+    return _group_duplicates(rows)
+
+
+async def _mongo_duplicate_rows(db: Any) -> List[Dict[str, Any]]:
+    """Students and prospects holding a phone or email key that appears more than once across both."""
+    dup_keys = {}
+    for field in ("phone_key", "email_key"):
+        stage = [{"$match": {field: {"$ne": None}}}, {"$project": {field: 1}}]
+        groups = await db.students.aggregate(
+            [
+                *stage,
+                {"$unionWith": {"coll": "prospects", "pipeline": stage}},
+                {"$group": {"_id": f"${field}", "n": {"$sum": 1}}},
+                {"$match": {"n": {"$gt": 1}}},
+            ]
+        ).to_list(None)
+        dup_keys[field] = [g["_id"] for g in groups]
+    if not dup_keys["phone_key"] and not dup_keys["email_key"]:
+        return []
+
+    q = {"$or": [{"phone_key": {"$in": dup_keys["phone_key"]}}, {"email_key": {"$in": dup_keys["email_key"]}}]}
+    fields = ("full_name", "phone", "email", "agent_name", "created_at", "phone_key", "email_key")
+    rows = []
+    for kind, collection in (("student", db.students), ("prospect", db.prospects)):
+        async for d in collection.find(q, {f: 1 for f in fields}):
+            rows.append({"kind": kind, "id": str(d["_id"]), **{f: d.get(f) for f in fields}})
+    return rows
+
+
+def _group_duplicates(rows: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    parent = list(range(len(rows)))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    first_by_key: Dict[tuple, int] = {}
+    for i, r in enumerate(rows):
+        for key in (("phone", r["phone_key"]), ("email", r["email_key"])):
+            if key[1] is None:
+                continue
+            j = first_by_key.setdefault(key, i)
+            parent[find(i)] = find(j)
+
+    groups: Dict[int, List[Dict[str, Any]]] = {}
+    for i, r in enumerate(rows):
+        groups.setdefault(find(i), []).append(r)
+    return sorted(
+        (sorted(g, key=lambda r: r["created_at"] or "") for g in groups.values() if len(g) > 1),
+        key=len,
+        reverse=True,
+    )
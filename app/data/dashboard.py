@@ -5,9 +5,8 @@ from app.data.sqlite import conn
 
 async def dashboard_stats(db: Any, user: dict | None = None) -> Dict[str, Any]:
     role = (user or {}).get("role")
-    agent_name = (user or {}).get("full_name")
-    user_id = (user or {}).get("id")
-    is_agent = role == "agent" and bool(agent_name)
+    user_id = (user or {}).get("id") or (str(user["_id"]) if user and user.get("_id") else None)
+    is_agent = role == "agent" and user_id is not None
     
     now = datetime.utcnow()
     today_str = now.strftime("%Y-%m-%d")
@@ -16,7 +15,7 @@ async def dashboard_stats(db: Any, user: dict | None = None) -> Dict[str, Any]:
         # Simplified MongoDB implementation for Phase 2
         total_students = await db.students.count_documents({})
         if is_agent:
-            total_students = await db.students.count_documents({"agent_name": agent_name})
+            total_students = await db.students.count_documents({"agent_user_id": user_id})
             
         return {
             "scope_label": "Mes données" if is_agent else "Global",
@@ -53,12 +52,12 @@ async def dashboard_stats(db: Any, user: dict | None = None) -> Dict[str, Any]:
             cur4 = c.execute("SELECT COUNT(1) AS c FROM tasks WHERE status != 'completed' AND due_date < ?", (today_str,))
             overdue_tasks = int(cur4.fetchone()["c"])
         else:
-            cur = c.execute("SELECT COUNT(1) AS c FROM students WHERE agent_name=?", (agent_name,))
+            cur = c.execute("SELECT COUNT(1) AS c FROM students WHERE agent_user_id=?", (user_id,))
             total = int(cur.fetchone()["c"])
 
             cur2 = c.execute(
-                "SELECT COUNT(1) AS c FROM students s JOIN statuses st ON st.id = s.status_id WHERE st.name = ? AND s.agent_name = ?",
-                ("Accepté", agent_name)
+                "SELECT COUNT(1) AS c FROM students s JOIN statuses st ON st.id = s.status_id WHERE st.name = ? AND s.agent_user_id = ?",
+                ("Accepté", user_id)
             )
             accepted = int(cur2.fetchone()["c"])
 
@@ -67,9 +66,9 @@ async def dashboard_stats(db: Any, user: dict | None = None) -> Dict[str, Any]:
                 SELECT COALESCE(SUM(p.amount),0) AS total
                 FROM payments p
                 JOIN students s ON s.id = p.student_id
-                WHERE p.payment_status='received' AND substr(p.payment_date, 1, 7) = ? AND s.agent_name = ?
+                WHERE p.payment_status='received' AND substr(p.payment_date, 1, 7) = ? AND s.agent_user_id = ?
                 """,
-                (now.strftime("%Y-%m"), agent_name)
+                (now.strftime("%Y-%m"), user_id)
             )
             revenue_month = int(cur3.fetchone()["total"])
             
@@ -86,9 +85,9 @@ async def dashboard_stats(db: Any, user: dict | None = None) -> Dict[str, Any]:
             LEFT JOIN students s ON s.status_id = st.id
         """
         if is_agent:
-            status_query += " AND s.agent_name = ?"
+            status_query += " AND s.agent_user_id = ?"
             status_query += " GROUP BY st.id ORDER BY st.sort_order"
-            cur_status = c.execute(status_query, (agent_name,))
+            cur_status = c.execute(status_query, (user_id,))
         else:
             status_query += " GROUP BY st.id ORDER BY st.sort_order"
             cur_status = c.execute(status_query)
@@ -111,9 +110,9 @@ async def dashboard_stats(db: Any, user: dict | None = None) -> Dict[str, Any]:
                     SELECT COALESCE(SUM(p.amount),0) as total
                     FROM payments p
                     JOIN students s ON s.id = p.student_id
-                    WHERE p.payment_status='received' AND substr(p.payment_date, 1, 7) = ? AND s.agent_name = ?
+                    WHERE p.payment_status='received' AND substr(p.payment_date, 1, 7) = ? AND s.agent_user_id = ?
                     """,
-                    (ym, agent_name)
+                    (ym, user_id)
                 )
             else:
                 cur_rev = c.execute(
@@ -127,10 +126,11 @@ async def dashboard_stats(db: Any, user: dict | None = None) -> Dict[str, Any]:
         if not is_agent:
             cur_ranking = c.execute(
                 """
-                SELECT agent_name, COUNT(id) as total
-                FROM students 
-                GROUP BY agent_name 
-                ORDER BY total DESC 
+                SELECT COALESCE(u.full_name, MAX(s.agent_name)) AS agent_name, COUNT(s.id) as total
+                FROM students s
+                LEFT JOIN users u ON u.id = s.agent_user_id
+                GROUP BY s.agent_user_id, CASE WHEN s.agent_user_id IS NULL THEN s.agent_name END
+                ORDER BY total DESC
                 LIMIT 5
                 """
             )
@@ -1,7 +1,9 @@
+import asyncio
 from datetime import datetime
 from typing import Any
 
 from app.core.config import settings
+from app.data.events import record_event
 from app.data.sqlite import conn
 
 
@@ -13,13 +15,16 @@ async def list_student_documents(db: Any, student_id: int):
     if settings.db_backend != "sqlite":
         cur = db.student_documents.find({"student_id": student_id}).sort("uploaded_at", -1)
         return [d async for d in cur]
+    return await asyncio.to_thread(_list_student_documents_sqlite, student_id)
 
+
+def _list_student_documents_sqlite(student_id: int):
     c = conn()
     try:
         cur = c.execute(
             """
             SELECT id, student_id, doc_type, original_filename, stored_filename, stored_path,
-                   size_bytes, uploaded_by_user_id, uploaded_at
+                   size_bytes, sha256, uploaded_by_user_id, uploaded_at
             FROM student_documents
             WHERE student_id=?
             ORDER BY uploaded_at DESC
@@ -40,7 +45,7 @@ async def get_student_document(db: Any, document_id: int):
         cur = c.execute(
             """
             SELECT id, student_id, doc_type, original_filename, stored_filename, stored_path,
-                   size_bytes, uploaded_by_user_id, uploaded_at
+                   size_bytes, sha256, uploaded_by_user_id, uploaded_at
             FROM student_documents
             WHERE id=?
             LIMIT 1
@@ -63,6 +68,7 @@ async def add_student_document(
     stored_path: str,
     size_bytes: int,
     uploaded_by_user_id: int | None,
+    sha256: str | None = None,
 ):
     if settings.db_backend != "sqlite":
         result = await db.student_documents.insert_one(
@@ -73,18 +79,20 @@ async def add_student_document(
                 "stored_filename": stored_filename,
                 "stored_path": stored_path,
                 "size_bytes": size_bytes,
+                "sha256": sha256,
                 "uploaded_by_user_id": uploaded_by_user_id,
                 "uploaded_at": _now_iso(),
             }
         )
         return str(result.inserted_id)
 
+    now = _now_iso()
     c = conn()
     try:
         cur = c.execute(
             """
-            INSERT INTO student_documents(student_id, doc_type, original_filename, stored_filename, stored_path, size_bytes, uploaded_by_user_id, uploaded_at)
-            VALUES(?,?,?,?,?,?,?,?)
+            INSERT INTO student_documents(student_id, doc_type, original_filename, stored_filename, stored_path, size_bytes, sha256, uploaded_by_user_id, uploaded_at)
+            VALUES(?,?,?,?,?,?,?,?,?)
             """,
             (
                 student_id,
@@ -93,23 +101,50 @@ async def add_student_document(
                 stored_filename,
                 stored_path,
                 int(size_bytes),
+                sha256,
                 uploaded_by_user_id,
-                _now_iso(),
+                now,
             ),
         )
+        document_id = int(cur.lastrowid)
+        record_event(
+            c,
+            type="document",
+            occurred_at=now,
+            actor_user_id=uploaded_by_user_id,
+            student_id=student_id,
+            from_val=doc_type.strip(),
+            to_val=original_filename,
+            ref_id=document_id,
+        )
         c.commit()
-        return int(cur.lastrowid)
+        return document_id
     finally:
         c.close()
 
 
-async def delete_student_document(db: Any, document_id: int):
+async def delete_student_document(db: Any, document_id: int, *, deleted_by_user_id: Any = None):
     if settings.db_backend != "sqlite":
         await db.student_documents.delete_one({"_id": document_id})
         return
 
     c = conn()
     try:
+        doc = c.execute(
+            "SELECT student_id, doc_type, original_filename FROM student_documents WHERE id=?", (document_id,)
+        ).fetchone()
+        if not doc:
+            return
+        record_event(
+            c,
+            type="document_deleted",
+            occurred_at=_now_iso(),
+            actor_user_id=deleted_by_user_id,
+            student_id=doc["student_id"],
+            from_val=doc["doc_type"],
+            to_val=doc["original_filename"],
+            ref_id=document_id,
+        )
         c.execute("DELETE FROM student_documents WHERE id=?", (document_id,))
         c.commit()
     finally:
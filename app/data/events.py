@@ -0,0 +1,130 @@
+import sqlite3
+from typing import Any, Dict, List, Optional
+from app.core.config import settings
+from app.data.sqlite import conn
+
+EVENT_TYPES = (
+    "status", "payment", "payment_confirmed", "payment_deleted", "task", "document", "document_deleted", "user", "prospect",
+)
+
+
+def record_event(
+    c: sqlite3.Connection,
+    *,
+    type: str,
+    occurred_at: str,
+    actor_user_id: Optional[int] = None,
+    student_id: Optional[int] = None,
+    from_val: Optional[str] = None,
+    to_val: Optional[str] = None,
+    ref_id: Optional[int] = None,
+) -> None:
+    """Append an event on the caller's connection; it is committed with the caller's own write.
+
+    Actor and student names are copied in so the log reads without joins and
+    survives later renames or deletions.
+    """
+    c.execute(
+        """
+        INSERT INTO events(type, occurred_at, actor_user_id, actor_name, student_id, student_name, from_val, to_val, ref_id)
+        VALUES(?, ?, ?, (SELECT full_name FROM users WHERE id=?), ?, (SELECT full_name FROM students WHERE id=?), ?, ?, ?)
+        """,
+        (type, occurred_at, actor_user_id, actor_user_id, student_id, student_id, from_val, to_val, ref_id),
+    )
+
+
+_STATUS_EVENT_SQL = """
+    INSERT INTO events(type, occurred_at, actor_user_id, actor_name, student_id, student_name, from_val, to_val, ref_id)
+    VALUES('status', ?, ?, (SELECT full_name FROM users WHERE id=?), ?, (SELECT full_name FROM students WHERE id=?),
+           (SELECT name FROM statuses WHERE id=?), (SELECT name FROM statuses WHERE id=?), ?)
+"""
+
+
+def record_status_event(
+    c: sqlite3.Connection,
+    *,
+    occurred_at: str,
+    actor_user_id: Optional[int],
+    student_id: int,
+    from_status_id: Optional[int],
+    to_status_id: Optional[int],
+    ref_id: Optional[int] = None,
+) -> None:
+    c.execute(
+        _STATUS_EVENT_SQL,
+        (occurred_at, actor_user_id, actor_user_id, student_id, student_id, from_status_id, to_status_id, ref_id),
+    )
+
+
+def record_status_events(c: sqlite3.Connection, rows: List[Dict[str, Any]]) -> None:
+    """Batch form of record_status_event; each row carries the same keys as its arguments."""
+    c.executemany(
+        _STATUS_EVENT_SQL,
+        [
+            (
+                r["occurred_at"],
+                r.get("actor_user_id"),
+                r.get("actor_user_id"),
+                r["student_id"],
+                r["student_id"],
+                r.get("from_status_id"),
+                r.get("to_status_id"),
+                r.get("ref_id"),
+            )
+            for r in rows
+        ],
+    )
+
+
+async def list_events(
+    db: Any,
+    *,
+    limit: int = 50,
+    before: Optional[tuple[str, int]] = None,
+    type: Optional[str] = None,
+    actor_user_id: Optional[int] = None,
+    student_id: Optional[int] = None,
+) -> tuple[List[Dict[str, Any]], Optional[tuple[str, int]]]:
+    """Newest-first page of events, plus the keyset cursor of the next page (None on the last one).
+
+    ``before`` is the ``(occurred_at, id)`` of the last row already shown; paging
+    by key rather than OFFSET keeps every page an index range scan.
+    """
+    if settings.db_backend != "sqlite":
+        # Placeholder for mongo
+        return [], None
+
+    where, params = [], []
+    if type:
+        where.append("type = ?")
+        params.append(type)
+    if actor_user_id is not None:
+        where.append("actor_user_id = ?")
+        params.append(actor_user_id)
+    if student_id is not None:
+        where.append("student_id = ?")
+        params.append(student_id)
+    if before:
+        where.append("(occurred_at, id) < (?, ?)")
+        params.extend(before)
+
+    query = """
+        SELECT id, type, occurred_at AS timestamp, actor_user_id, actor_name AS user_name,
+               student_id, student_name, from_val, to_val, ref_id
+        FROM events
+    """
+    if where:
+        query += " WHERE " + " AND ".join(where)
+    query += " ORDER BY occurred_at DESC, id DESC LIMIT ?"
+    params.append(limit + 1)
+
+    c = conn()
+    try:
+        rows = [dict(r) for r in c.execute(query, params).fetchall()]
+    finally:
+        c.close()
+
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, (rows[-1]["timestamp"], rows[-1]["id"])
+    return rows, None
@@ -0,0 +1,82 @@
+import json
+import time
+from typing import Any, Dict, List, Optional
+
+from app.core.config import settings
+from app.data.sqlite import conn
+
+_COLUMNS = (
+    "id", "kind", "filename", "dry_run", "status", "progress", "rows", "valid", "inserted",
+    "duplicates", "error_count", "errors", "message", "owner_id", "path", "started_at", "finished_at",
+)
+
+
+async def save_import_job(db: Any, job: Dict[str, Any]) -> None:
+    """Write the current state of an import job; ``updated_at`` doubles as its heartbeat."""
+    doc = {k: job.get(k) for k in _COLUMNS}
+    doc["updated_at"] = time.time()
+
+    if settings.db_backend != "sqlite":
+        await db.import_jobs.replace_one({"_id": doc["id"]}, doc, upsert=True)
+        return
+
+    doc["dry_run"] = int(bool(doc["dry_run"]))
+    doc["errors"] = json.dumps(doc["errors"] or [], ensure_ascii=False)
+    cols = ", ".join(doc)
+    marks = ", ".join(f":{k}" for k in doc)
+    c = conn()
+    try:
+        c.execute(f"INSERT OR REPLACE INTO import_jobs({cols}) VALUES({marks})", doc)
+        c.commit()
+    finally:
+        c.close()
+
+
+async def get_import_job_row(db: Any, job_id: str) -> Optional[Dict[str, Any]]:
+    if settings.db_backend != "sqlite":
+        doc = await db.import_jobs.find_one({"_id": job_id})
+        if doc:
+            doc.pop("_id", None)
+        return doc
+
+    c = conn()
+    try:
+        row = c.execute("SELECT * FROM import_jobs WHERE id = ?", (job_id,)).fetchone()
+    finally:
+        c.close()
+    if not row:
+        return None
+    job = dict(row)
+    job["dry_run"] = bool(job["dry_run"])
+    job["errors"] = json.loads(job["errors"])
+    return job
+
+
+async def prune_import_jobs(db: Any, keep: int) -> List[str]:
+    """Drop all but the ``keep`` most recent finished jobs; returns the files no remaining job uses."""
+    if settings.db_backend != "sqlite":
+        cur = db.import_jobs.find({"status": {"$ne": "running"}}, {"path": 1}).sort("started_at", -1).skip(keep)
+        old = [(d["_id"], d["path"]) async for d in cur]
+        if not old:
+            return []
+        await db.import_jobs.delete_many({"_id": {"$in": [jid for jid, _p in old]}})
+        paths = {p for _jid, p in old}
+        still_used = set(await db.import_jobs.distinct("path", {"path": {"$in": list(paths)}}))
+        return sorted(paths - still_used)
+
+    c = conn()
+    try:
+        old = c.execute(
+            "SELECT id, path FROM import_jobs WHERE status != 'running' ORDER BY started_at DESC LIMIT -1 OFFSET ?",
+            (keep,),
+        ).fetchall()
+        if not old:
+            return []
+        c.executemany("DELETE FROM import_jobs WHERE id = ?", [(r["id"],) for r in old])
+        paths = {r["path"] for r in old}
+        marks = ",".join("?" for _ in paths)
+        still_used = {r["path"] for r in c.execute(f"SELECT DISTINCT path FROM import_jobs WHERE path IN ({marks})", list(paths))}
+        c.commit()
+        return sorted(paths - still_used)
+    finally:
+        c.close()
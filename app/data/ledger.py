@@ -0,0 +1,101 @@
+from typing import Any, Iterable, List, Optional
+from pymongo import UpdateOne
+from app.core.config import settings
+from app.data.sqlite import conn
+
+# students.paid_total is the sum of the student's received payments and
+# students.balance is total_amount - paid_total. Both are kept up to date by the
+# writes below, inside the transaction of the write that moves them.
+
+_PAID_SQL = "(SELECT COALESCE(SUM(amount), 0) FROM payments WHERE student_id = students.id AND payment_status = 'received')"
+
+
+def add_paid(c, student_id: int, amount: int) -> None:
+    """Count a received payment of ``amount`` (negative to take one back) on the student's ledger."""
+    c.execute(
+        "UPDATE students SET paid_total = paid_total + ?, balance = balance - ? WHERE id = ?",
+        (int(amount), int(amount), student_id),
+    )
+
+
+def recompute_ledger(c, student_ids: Optional[Iterable[int]] = None) -> int:
+    """Recompute paid_total/balance from payments; returns the number of students that had drifted.
+
+    Only drifted rows are written, so running it on a consistent database is a read.
+    """
+    where = f"(paid_total != {_PAID_SQL} OR balance != total_amount - {_PAID_SQL})"
+    params: list = []
+    if student_ids is not None:
+        ids = list(student_ids)
+        if not ids:
+            return 0
+        where += f" AND id IN ({','.join('?' * len(ids))})"
+        params.extend(ids)
+    cur = c.execute(
+        f"UPDATE students SET paid_total = {_PAID_SQL}, balance = total_amount - {_PAID_SQL} WHERE {where}",
+        params,
+    )
+    return cur.rowcount
+
+
+async def backfill_mongo_ledger(db: Any, batch_size: int = 500) -> int:
+    """Give Mongo students written before the ledger their paid_total/balance.
+
+    Only documents missing one of the fields are read, so it is cheap to re-run.
+    Returns the number of documents updated.
+    """
+    if settings.db_backend == "sqlite":
+        return 0
+
+    updated = 0
+    ids: List[Any] = []
+    async for s in db.students.find({"$or": [{"paid_total": {"$exists": False}}, {"balance": {"$exists": False}}]}, {"_id": 1}):
+        ids.append(s["_id"])
+        if len(ids) >= batch_size:
+            updated += await _backfill_ledger_batch(db, ids)
+            ids = []
+    if ids:
+        updated += await _backfill_ledger_batch(db, ids)
+    return updated
+
+
+async def _backfill_ledger_batch(db: Any, ids: List[Any]) -> int:
+    paid = {}
+    async for g in db.payments.aggregate(
+        [
+            {"$match": {"student_id": {"$in": ids}, "payment_status": "received"}},
+            {"$group": {"_id": "$student_id", "paid": {"$sum": "$amount"}}},
+        ]
+    ):
+        paid[g["_id"]] = int(g["paid"] or 0)
+    ops = [
+        UpdateOne(
+            {"_id": sid},
+            [{"$set": {"paid_total": paid.get(sid, 0), "balance": {"$subtract": [{"$ifNull": ["$total_amount", 0]}, paid.get(sid, 0)]}}}],
+        )
+        for sid in ids
+    ]
+    return (await db.students.bulk_write(ops, ordered=False)).modified_count
+
+
+async def repair_ledger(db: Any) -> int:
+    """Rebuild every student's paid_total/balance; returns the number of students corrected."""
+    if settings.db_backend != "sqlite":
+        fixed = 0
+        async for s in db.students.find({}, {"total_amount": 1, "paid_total": 1, "balance": 1}):
+            paid = 0
+            async for p in db.payments.find({"student_id": s["_id"], "payment_status": "received"}, {"amount": 1}):
+                paid += int(p.get("amount", 0) or 0)
+            balance = int(s.get("total_amount") or 0) - paid
+            if s.get("paid_total") != paid or s.get("balance") != balance:
+                await db.students.update_one({"_id": s["_id"]}, {"$set": {"paid_total": paid, "balance": balance}})
+                fixed += 1
+        return fixed
+
+    c = conn()
+    try:
+        fixed = recompute_ledger(c)
+        c.commit()
+        return fixed
+    finally:
+        c.close()
@@ -0,0 +1,36 @@
+import time
+from app.data.sqlite import conn
+
+
+def try_acquire_lock(name: str, owner: str, ttl_seconds: float) -> bool:
+    """Take or renew the lease on ``name`` for ``owner``; False while another owner holds it.
+
+    The lease is a row of scheduler_locks: it is granted when the row is missing,
+    expired or already ours, in a single upsert, so two workers racing for it
+    cannot both win.
+    """
+    now = time.time()
+    c = conn()
+    try:
+        c.execute(
+            """
+            INSERT INTO scheduler_locks(name, owner, expires_at) VALUES(?, ?, ?)
+            ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+            WHERE scheduler_locks.owner = excluded.owner OR scheduler_locks.expires_at < ?
+            """,
+            (name, owner, now + ttl_seconds, now),
+        )
+        c.commit()
+        row = c.execute("SELECT owner FROM scheduler_locks WHERE name = ?", (name,)).fetchone()
+        return row is not None and row["owner"] == owner
+    finally:
+        c.close()
+
+
+def release_lock(name: str, owner: str) -> None:
+    c = conn()
+    try:
+        c.execute("DELETE FROM scheduler_locks WHERE name = ? AND owner = ?", (name, owner))
+        c.commit()
+    finally:
+        c.close()
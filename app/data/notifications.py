@@ -37,6 +37,32 @@ async def create_notification(
             "created_at": now
         })
 
+async def create_notifications(db: Any, notifications: List[Dict[str, Any]]):
+    """Insert many notifications at once; each item has the arguments of create_notification."""
+    if not notifications:
+        return
+    now = datetime.utcnow().isoformat()
+    if settings.db_backend == "sqlite":
+        c = conn()
+        try:
+            c.executemany(
+                """
+                INSERT INTO notifications (user_id, title, message, type, link, created_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                [
+                    (n["user_id"], n["title"], n["message"], n.get("type", "info"), n.get("link"), now)
+                    for n in notifications
+                ],
+            )
+            c.commit()
+        finally:
+            c.close()
+    else:
+        await db.notifications.insert_many(
+            [{"type": "info", "link": None, **n, "is_read": False, "created_at": now} for n in notifications]
+        )
+
 async def list_notifications(db: Any, user_id: int, limit: int = 10, unread_only: bool = False):
     if settings.db_backend == "sqlite":
         c = conn()
@@ -1,23 +1,24 @@
 from typing import Any, List, Dict, Optional
 from datetime import datetime
 from app.core.config import settings
+from app.data.catalog import bump_catalog_version, get_catalog
 from app.data.sqlite import conn
 
 async def list_partners(db: Any, search: Optional[str] = None) -> List[Dict[str, Any]]:
     if settings.db_backend != "sqlite": return []
-    c = conn()
-    try:
-        query = "SELECT * FROM partners"
-        params = []
-        if search:
-            query += " WHERE name LIKE ? OR country LIKE ? OR contact_person LIKE ?"
-            s = f"%{search}%"
-            params = [s, s, s]
-        query += " ORDER BY name ASC"
-        cur = c.execute(query, params)
-        return [dict(r) for r in cur.fetchall()]
-    finally:
-        c.close()
+    partners = (await get_catalog(db)).rows["partners"]
+    if search:
+        needle = search.lower()
+        partners = [
+            p for p in partners
+            if any(needle in (p.get(f) or "").lower() for f in ("name", "country", "contact_person"))
+        ]
+    return partners
+
+async def search_partners(db: Any, prefix: str, *, limit: int = 10) -> List[Dict[str, Any]]:
+    """Partners with a name or country word starting with ``prefix``, for typeahead pickers."""
+    if settings.db_backend != "sqlite": return []
+    return (await get_catalog(db)).search("partners", prefix, ("name", "country"), limit=limit)
 
 async def create_partner(
     db: Any,
@@ -39,6 +40,7 @@ async def create_partner(
             """,
             (name, country, contact_person, email, phone, website, notes, datetime.utcnow().isoformat())
         )
+        bump_catalog_version(c, "partners")
         c.commit()
         return cur.lastrowid
     finally:
@@ -49,6 +51,7 @@ async def delete_partner(db: Any, partner_id: int):
     c = conn()
     try:
         c.execute("DELETE FROM partners WHERE id = ?", (partner_id,))
+        bump_catalog_version(c, "partners")
         c.commit()
     finally:
         c.close()
@@ -1,7 +1,11 @@
+import asyncio
 from datetime import datetime
-from typing import Any
+from typing import Any, AsyncIterator
 
 from app.core.config import settings
+from app.data.closings import PeriodClosed, ensure_open
+from app.data.events import record_event
+from app.data.ledger import add_paid
 from app.data.sqlite import conn
 
 
@@ -9,14 +13,14 @@ def _now_iso() -> str:
     return datetime.utcnow().isoformat(timespec="seconds")
 
 
-async def list_payments(db: Any, *, agent_name: str | None = None):
+async def list_payments(db: Any, *, agent_user_id: Any = None):
     if settings.db_backend != "sqlite":
-        if not agent_name:
+        if agent_user_id is None:
             cur = db.payments.find({}).sort("payment_date", -1)
             return [p async for p in cur]
 
         student_ids = []
-        async for s in db.students.find({"agent_name": agent_name}, {"_id": 1}):
+        async for s in db.students.find({"agent_user_id": agent_user_id}, {"_id": 1}):
             student_ids.append(s.get("_id"))
         if not student_ids:
             return []
@@ -25,7 +29,7 @@ async def list_payments(db: Any, *, agent_name: str | None = None):
 
     c = conn()
     try:
-        if not agent_name:
+        if agent_user_id is None:
             cur = c.execute(
                 """
                 SELECT p.*, s.full_name AS student_name
@@ -40,16 +44,82 @@ async def list_payments(db: Any, *, agent_name: str | None = None):
                 SELECT p.*, s.full_name AS student_name
                 FROM payments p
                 JOIN students s ON s.id = p.student_id
-                WHERE s.agent_name = ?
+                WHERE s.agent_user_id = ?
                 ORDER BY p.payment_date DESC, p.id DESC
                 """,
-                (agent_name,),
+                (agent_user_id,),
             )
         return [dict(r) for r in cur.fetchall()]
     finally:
         c.close()
 
 
+async def iter_payments(
+    db: Any,
+    *,
+    agent_user_id: Any = None,
+    date_from: str | None = None,
+    date_to: str | None = None,
+    batch_size: int = 1000,
+) -> AsyncIterator[dict]:
+    """Stream payments in id order, one batch in memory at a time.
+
+    Same agent scoping as list_payments; ``date_from``/``date_to`` bound payment_date inclusively.
+    """
+    if settings.db_backend != "sqlite":
+        q: dict = {}
+        if agent_user_id is not None:
+            student_ids = [s["_id"] async for s in db.students.find({"agent_user_id": agent_user_id}, {"_id": 1})]
+            q["student_id"] = {"$in": student_ids}
+        if date_from or date_to:
+            q["payment_date"] = {}
+            if date_from:
+                q["payment_date"]["$gte"] = date_from
+            if date_to:
+                q["payment_date"]["$lte"] = date_to
+        async for p in db.payments.find(q).sort("_id", 1).batch_size(batch_size):
+            yield p
+        return
+
+    where = ""
+    params: list = []
+    if agent_user_id is not None:
+        where += " AND s.agent_user_id = ?"
+        params.append(agent_user_id)
+    if date_from:
+        where += " AND p.payment_date >= ?"
+        params.append(date_from)
+    if date_to:
+        where += " AND p.payment_date <= ?"
+        params.append(date_to)
+
+    # Keyset batches on short-lived connections rather than one open cursor: a long-running
+    # SELECT would hold SQLite's shared lock and block every writer until the download ends.
+    last_id = 0
+    while True:
+        c = conn()
+        try:
+            cur = c.execute(
+                f"""
+                SELECT p.*, s.full_name AS student_name, s.agent_name
+                FROM payments p
+                JOIN students s ON s.id = p.student_id
+                WHERE p.id > ?{where}
+                ORDER BY p.id
+                LIMIT ?
+                """,
+                (last_id, *params, batch_size),
+            )
+            rows = cur.fetchmany(batch_size)
+        finally:
+            c.close()
+        if not rows:
+            return
+        last_id = rows[-1]["id"]
+        for r in rows:
+            yield dict(r)
+
+
 async def get_payment(db: Any, payment_id: int):
     if settings.db_backend != "sqlite":
         doc = await db.payments.find_one({"_id": payment_id})
@@ -68,7 +138,10 @@ async def list_payments_by_student(db: Any, student_id: int):
     if settings.db_backend != "sqlite":
         cur = db.payments.find({"student_id": student_id}).sort("payment_date", -1)
         return [p async for p in cur]
+    return await asyncio.to_thread(_list_payments_by_student_sqlite, student_id)
 
+
+def _list_payments_by_student_sqlite(student_id: int):
     c = conn()
     try:
         cur = c.execute(
@@ -98,6 +171,7 @@ async def create_payment(
     receipt_original_filename: str | None,
     receipt_stored_path: str | None,
     created_by_user_id: int | None,
+    receipt_sha256: str | None = None,
 ):
     if settings.db_backend != "sqlite":
         result = await db.payments.insert_one(
@@ -111,19 +185,24 @@ async def create_payment(
                 "payment_status": payment_status,
                 "receipt_original_filename": receipt_original_filename,
                 "receipt_stored_path": receipt_stored_path,
+                "receipt_sha256": receipt_sha256,
                 "created_by_user_id": created_by_user_id,
                 "created_at": _now_iso(),
             }
         )
+        if payment_status.strip() == "received":
+            await db.students.update_one({"_id": student_id}, {"$inc": {"paid_total": int(amount), "balance": -int(amount)}})
         return str(result.inserted_id)
 
+    now = _now_iso()
     c = conn()
     try:
+        ensure_open(c, payment_date.strip())
         cur = c.execute(
             """
             INSERT INTO payments(student_id, payment_type, amount, currency, payment_mode, payment_date, payment_status,
-                                 receipt_original_filename, receipt_stored_path, created_by_user_id, created_at)
-            VALUES(?,?,?,?,?,?,?,?,?,?,?)
+                                 receipt_original_filename, receipt_stored_path, receipt_sha256, created_by_user_id, created_at)
+            VALUES(?,?,?,?,?,?,?,?,?,?,?,?)
             """,
             (
                 student_id,
@@ -135,36 +214,31 @@ async def create_payment(
                 payment_status.strip(),
                 receipt_original_filename,
                 receipt_stored_path,
+                receipt_sha256,
                 created_by_user_id,
-                _now_iso(),
+                now,
             ),
         )
+        payment_id = int(cur.lastrowid)
+        if payment_status.strip() == "received":
+            add_paid(c, student_id, int(amount))
+        record_event(
+            c,
+            type="payment",
+            occurred_at=now,
+            actor_user_id=created_by_user_id,
+            student_id=student_id,
+            from_val=payment_type.strip(),
+            to_val=f"{int(amount)} {currency.strip()}",
+            ref_id=payment_id,
+        )
         c.commit()
-        return int(cur.lastrowid)
+        return payment_id
     finally:
         c.close()
 
 
-async def totals_by_student(db: Any, student_id: int):
-    if settings.db_backend != "sqlite":
-        # simplistic placeholder for mongo mode
-        paid = 0
-        async for p in db.payments.find({"student_id": student_id, "payment_status": "received"}):
-            paid += int(p.get("amount", 0) or 0)
-        return {"paid": paid}
-
-    c = conn()
-    try:
-        cur = c.execute(
-            "SELECT COALESCE(SUM(amount),0) AS paid FROM payments WHERE student_id=? AND payment_status='received'",
-            (student_id,),
-        )
-        paid = int(cur.fetchone()["paid"])
-        return {"paid": paid}
-    finally:
-        c.close()
-
-async def get_daily_payment_count(db: Any, agent_name: str) -> int:
+async def get_daily_payment_count(db: Any, agent_user_id: Any) -> int:
     if settings.db_backend != "sqlite": return 0
     today = datetime.utcnow().strftime("%Y-%m-%d")
     c = conn()
@@ -174,52 +248,161 @@ async def get_daily_payment_count(db: Any, agent_name: str) -> int:
             SELECT COUNT(*) as count 
             FROM payments p
             JOIN students s ON s.id = p.student_id
-            WHERE s.agent_name = ? AND p.created_at LIKE ?
+            WHERE s.agent_user_id = ? AND p.created_at LIKE ?
             """,
-            (agent_name, f"{today}%")
+            (agent_user_id, f"{today}%")
         )
         return cur.fetchone()["count"]
     finally:
         c.close()
 
-async def confirm_payment(db: Any, payment_id: int):
+async def confirm_payment(db: Any, payment_id: int, confirmed_by_user_id: int | None = None):
+    """Mark a payment received; raises PeriodClosed when its date is in a closed period."""
     if settings.db_backend != "sqlite": return
     c = conn()
     try:
-        c.execute("UPDATE payments SET payment_status = 'received' WHERE id = ?", (payment_id,))
+        row = c.execute("SELECT payment_date FROM payments WHERE id = ?", (payment_id,)).fetchone()
+        if row:
+            ensure_open(c, row["payment_date"])
+        cur = c.execute(
+            "UPDATE payments SET payment_status = 'received' WHERE id = ? AND payment_status != 'received'",
+            (payment_id,),
+        )
+        if cur.rowcount:
+            row = c.execute("SELECT student_id, payment_type, amount, currency FROM payments WHERE id = ?", (payment_id,)).fetchone()
+            add_paid(c, row["student_id"], row["amount"])
+            record_event(
+                c,
+                type="payment_confirmed",
+                occurred_at=_now_iso(),
+                actor_user_id=confirmed_by_user_id,
+                student_id=row["student_id"],
+                from_val=row["payment_type"],
+                to_val=f"{row['amount']} {row['currency']}",
+                ref_id=payment_id,
+            )
+        c.commit()
+    finally:
+        c.close()
+
+async def confirm_payments(
+    db: Any, payment_ids: list[int], confirmed_by_user_id: int | None = None
+) -> tuple[list[dict], list[dict]]:
+    """Confirm many payments in one transaction.
+
+    Missing, already received or closed-period payments are skipped and reported. Returns
+    ``(confirmed, failures)``: the confirmed payment rows (with student_name) and
+    ``{payment_id, reason}`` failures.
+    """
+    payment_ids = list(dict.fromkeys(payment_ids))
+    if settings.db_backend != "sqlite" or not payment_ids:
+        return [], []
+    now = _now_iso()
+    c = conn()
+    try:
+        c.execute("BEGIN IMMEDIATE")
+        found = {}
+        for i in range(0, len(payment_ids), 500):
+            chunk = payment_ids[i : i + 500]
+            marks = ",".join("?" * len(chunk))
+            for r in c.execute(
+                f"""
+                SELECT p.id, p.student_id, p.payment_type, p.amount, p.currency, p.payment_status,
+                       p.payment_date, p.created_by_user_id, s.full_name AS student_name
+                FROM payments p
+                JOIN students s ON s.id = p.student_id
+                WHERE p.id IN ({marks})
+                """,
+                chunk,
+            ):
+                found[r["id"]] = dict(r)
+
+        confirmed, failures = [], []
+        for pid in payment_ids:
+            p = found.get(pid)
+            if p is None:
+                failures.append({"payment_id": pid, "reason": "introuvable"})
+            elif p["payment_status"] == "received":
+                failures.append({"payment_id": pid, "reason": "déjà confirmé"})
+            else:
+                try:
+                    ensure_open(c, p["payment_date"])
+                    confirmed.append(p)
+                except PeriodClosed:
+                    failures.append({"payment_id": pid, "reason": "période clôturée"})
+
+        if confirmed:
+            c.executemany(
+                "UPDATE payments SET payment_status = 'received' WHERE id = ?", [(p["id"],) for p in confirmed]
+            )
+            for p in confirmed:
+                add_paid(c, p["student_id"], p["amount"])
+                record_event(
+                    c,
+                    type="payment_confirmed",
+                    occurred_at=now,
+                    actor_user_id=confirmed_by_user_id,
+                    student_id=p["student_id"],
+                    from_val=p["payment_type"],
+                    to_val=f"{p['amount']} {p['currency']}",
+                    ref_id=p["id"],
+                )
         c.commit()
+        return confirmed, failures
+    except Exception:
+        c.rollback()
+        raise
     finally:
         c.close()
 
-async def list_pending_payments(db: Any, agent_id: int | None = None, filter_date: str | None = None):
+
+def _pending_where(agent_id: int | None, filter_date: str | None) -> tuple[str, list]:
+    # payment_status = 'pending' is the predicate of idx_payments_pending, so the
+    # queue is read from that index whatever the size of the payments history.
+    where = "p.payment_status = 'pending'"
+    params: list = []
+    if agent_id:
+        where += " AND p.student_id IN (SELECT id FROM students WHERE agent_user_id = ?)"
+        params.append(agent_id)
+    if filter_date:
+        where += " AND p.payment_date = ?"
+        params.append(filter_date)
+    return where, params
+
+
+async def list_pending_payments(
+    db: Any,
+    agent_id: int | None = None,
+    filter_date: str | None = None,
+    *,
+    limit: int | None = None,
+    offset: int = 0,
+):
     if settings.db_backend != "sqlite": return []
+    where, params = _pending_where(agent_id, filter_date)
+    query = f"""
+        SELECT p.*, s.full_name as student_name, s.agent_name
+        FROM payments p
+        JOIN students s ON s.id = p.student_id
+        WHERE {where}
+        ORDER BY p.payment_date DESC, p.id DESC
+    """
+    if limit is not None:
+        query += " LIMIT ? OFFSET ?"
+        params += [limit, offset]
     c = conn()
     try:
-        query = """
-            SELECT p.*, s.full_name as student_name, s.agent_name
-            FROM payments p
-            JOIN students s ON s.id = p.student_id
-            WHERE p.payment_status = 'pending'
-        """
-        params = []
-        if agent_id:
-            query += " AND s.agent_name IN (SELECT full_name FROM users WHERE id = ?)"
-            params.append(agent_id)
-        if filter_date:
-            query += " AND p.payment_date = ?"
-            params.append(filter_date)
-            
-        query += " ORDER BY p.payment_date DESC"
         cur = c.execute(query, params)
         return [dict(r) for r in cur.fetchall()]
     finally:
         c.close()
 
-async def count_pending_payments(db: Any) -> int:
+async def count_pending_payments(db: Any, agent_id: int | None = None, filter_date: str | None = None) -> int:
     if settings.db_backend != "sqlite": return 0
+    where, params = _pending_where(agent_id, filter_date)
     c = conn()
     try:
-        cur = c.execute("SELECT COUNT(*) as count FROM payments WHERE payment_status = 'pending'")
+        cur = c.execute(f"SELECT COUNT(*) as count FROM payments p WHERE {where}", params)
         return cur.fetchone()["count"]
     finally:
         c.close()
@@ -1,12 +1,17 @@
-from typing import Any, List, Optional
-from datetime import datetime
+from typing import Any, AsyncIterator, List, Optional
+from datetime import date, datetime, timedelta
 from app.core.config import settings
+from app.data.contacts import email_key, phone_key
+from app.data.events import record_event
 from app.data.sqlite import conn
 
 def _now_iso() -> str:
     return datetime.utcnow().isoformat(timespec="seconds")
 
-async def list_prospects(db: Any, *, agent_name: Optional[str] = None, search: Optional[str] = None):
+def _next_day(day: str) -> str:
+    return (date.fromisoformat(day) + timedelta(days=1)).isoformat()
+
+async def list_prospects(db: Any, *, agent_user_id: Any = None, search: Optional[str] = None):
     if settings.db_backend != "sqlite":
         # Placeholder for mongo
         return []
@@ -15,9 +20,9 @@ async def list_prospects(db: Any, *, agent_name: Optional[str] = None, search: O
     try:
         query = "SELECT * FROM prospects WHERE 1=1"
         params = []
-        if agent_name:
-            query += " AND (agent_name = ? OR agent_name IS NULL)"
-            params.append(agent_name)
+        if agent_user_id is not None:
+            query += " AND (agent_user_id = ? OR agent_user_id IS NULL)"
+            params.append(agent_user_id)
         if search:
             query += " AND (full_name LIKE ? OR phone LIKE ? OR email LIKE ?)"
             s_val = f"%{search}%"
@@ -29,6 +34,44 @@ async def list_prospects(db: Any, *, agent_name: Optional[str] = None, search: O
     finally:
         c.close()
 
+async def iter_prospects(
+    db: Any,
+    *,
+    agent_user_id: Any = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    batch_size: int = 1000,
+) -> AsyncIterator[dict]:
+    if settings.db_backend != "sqlite":
+        # Placeholder for mongo
+        return
+
+    where = ""
+    params: list = []
+    if agent_user_id is not None:
+        where += " AND (agent_user_id = ? OR agent_user_id IS NULL)"
+        params.append(agent_user_id)
+    if date_from:
+        where += " AND created_at >= ?"
+        params.append(date_from)
+    if date_to:
+        where += " AND created_at < ?"
+        params.append(_next_day(date_to))
+
+    last_id = 0
+    while True:
+        c = conn()
+        try:
+            cur = c.execute(f"SELECT * FROM prospects WHERE id > ?{where} ORDER BY id LIMIT ?", (last_id, *params, batch_size))
+            rows = cur.fetchmany(batch_size)
+        finally:
+            c.close()
+        if not rows:
+            return
+        last_id = rows[-1]["id"]
+        for r in rows:
+            yield dict(r)
+
 async def get_prospect(db: Any, prospect_id: int):
     if settings.db_backend != "sqlite": return None
     c = conn()
@@ -48,7 +91,9 @@ async def create_prospect(
     country_interest: Optional[str] = None,
     source: Optional[str] = None,
     agent_name: Optional[str] = None,
-    notes: Optional[str] = None
+    notes: Optional[str] = None,
+    agent_user_id: Any = None,
+    created_by_user_id: Any = None,
 ):
     if settings.db_backend != "sqlite": return None
     now = _now_iso()
@@ -56,16 +101,87 @@ async def create_prospect(
     try:
         cur = c.execute(
             """
-            INSERT INTO prospects (full_name, phone, email, country_interest, source, agent_name, notes, created_at, updated_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            INSERT INTO prospects (full_name, phone, email, phone_key, email_key, country_interest, source, agent_name, agent_user_id, notes, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             """,
-            (full_name.strip(), phone.strip(), email, country_interest, source, agent_name, notes, now, now)
+            (full_name.strip(), phone.strip(), email, phone_key(phone), email_key(email), country_interest, source, agent_name, agent_user_id, notes, now, now)
+        )
+        record_event(
+            c,
+            type="prospect",
+            occurred_at=now,
+            actor_user_id=created_by_user_id,
+            from_val=source,
+            to_val=full_name.strip(),
+            ref_id=cur.lastrowid,
         )
         c.commit()
         return cur.lastrowid
     finally:
         c.close()
 
+async def bulk_create_prospects(db: Any, rows: list[dict], *, created_by_user_id: Any = None) -> int:
+    """Insert already-validated prospects in one transaction; rows use create_prospect's keywords."""
+    if settings.db_backend != "sqlite": return 0
+    if not rows:
+        return 0
+    now = _now_iso()
+    c = conn()
+    try:
+        # IMMEDIATE takes the write lock up front, so the new ids are exactly those above the current maximum.
+        c.execute("BEGIN IMMEDIATE")
+        last_id = c.execute("SELECT COALESCE(MAX(id), 0) AS m FROM prospects").fetchone()["m"]
+        c.executemany(
+            """
+            INSERT INTO prospects (full_name, phone, email, phone_key, email_key, country_interest, source, agent_name, agent_user_id, notes, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            [
+                (
+                    r["full_name"],
+                    r["phone"],
+                    r.get("email"),
+                    phone_key(r["phone"]),
+                    email_key(r.get("email")),
+                    r.get("country_interest"),
+                    r.get("source"),
+                    r.get("agent_name"),
+                    r.get("agent_user_id"),
+                    r.get("notes"),
+                    now,
+                    now,
+                )
+                for r in rows
+            ],
+        )
+        ids = [row["id"] for row in c.execute("SELECT id FROM prospects WHERE id > ? ORDER BY id", (last_id,))]
+        for pid, r in zip(ids, rows):
+            record_event(
+                c,
+                type="prospect",
+                occurred_at=now,
+                actor_user_id=created_by_user_id,
+                from_val=r.get("source"),
+                to_val=r["full_name"],
+                ref_id=pid,
+            )
+        c.commit()
+        return len(rows)
+    except Exception:
+        c.rollback()
+        raise
+    finally:
+        c.close()
+
+async def list_prospect_contacts(db: Any) -> list[tuple[str, str]]:
+    """(phone_key, email_key) of every prospect, for duplicate checks."""
+    if settings.db_backend != "sqlite": return []
+    c = conn()
+    try:
+        return [(r["phone_key"], r["email_key"]) for r in c.execute("SELECT phone_key, email_key FROM prospects")]
+    finally:
+        c.close()
+
 async def update_prospect_status(db: Any, prospect_id: int, status: str):
     if settings.db_backend != "sqlite": return
     now = _now_iso()
@@ -85,14 +201,14 @@ async def delete_prospect(db: Any, prospect_id: int):
     finally:
         c.close()
 
-async def get_daily_prospect_count(db: Any, agent_name: str) -> int:
+async def get_daily_prospect_count(db: Any, agent_user_id: Any) -> int:
     if settings.db_backend != "sqlite": return 0
     today = datetime.utcnow().strftime("%Y-%m-%d")
     c = conn()
     try:
         cur = c.execute(
-            "SELECT COUNT(*) as count FROM prospects WHERE agent_name = ? AND created_at LIKE ?",
-            (agent_name, f"{today}%")
+            "SELECT COUNT(*) as count FROM prospects WHERE agent_user_id = ? AND created_at LIKE ?",
+            (agent_user_id, f"{today}%")
         )
         return cur.fetchone()["count"]
     finally:
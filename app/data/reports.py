@@ -1,61 +1,162 @@
+import json
 from typing import Any, Dict, List
-from datetime import datetime
+from datetime import date, datetime, timedelta
 from app.core.config import settings
 from app.data.sqlite import conn
 
-async def daily_report_data(db: Any, date_str: str | None = None) -> Dict[str, Any]:
-    if not date_str:
-        date_str = datetime.utcnow().strftime("%Y-%m-%d")
-        
+# Upper bound on a single report, so a typo in the year cannot scan the whole history.
+MAX_REPORT_DAYS = 366
+
+
+def _next_day(date_str: str) -> str:
+    return (date.fromisoformat(date_str) + timedelta(days=1)).isoformat()
+
+
+def _days(date_from: str, date_to: str) -> List[str]:
+    start, end = date.fromisoformat(date_from), date.fromisoformat(date_to)
+    return [(start + timedelta(days=i)).isoformat() for i in range((end - start).days + 1)]
+
+
+def _compute_days(c, date_from: str, date_to: str) -> Dict[str, Dict[str, Any]]:
+    """Build per-day reports for [date_from, date_to] from the raw tables.
+
+    Bounds are half-open ISO ranges (``>= day`` / ``< next day``) so each query is an
+    index range scan on the date column instead of a substr() over every row.
+    """
+    lo, hi = date_from, _next_day(date_to)
+    days = {d: {"date": d, "students": [], "payments": [], "status_changes": []} for d in _days(date_from, date_to)}
+
+    # 1. New Students
+    cur_students = c.execute(
+        "SELECT * FROM students WHERE created_at >= ? AND created_at < ? ORDER BY created_at DESC",
+        (lo, hi)
+    )
+    for r in cur_students.fetchall():
+        days[r["created_at"][:10]]["students"].append(dict(r))
+
+    # 2. Payments
+    cur_payments = c.execute(
+        """
+        SELECT p.*, s.full_name as student_name
+        FROM payments p
+        JOIN students s ON s.id = p.student_id
+        WHERE p.payment_date >= ? AND p.payment_date < ? AND p.payment_status = 'received'
+        ORDER BY p.id DESC
+        """,
+        (lo, hi)
+    )
+    for r in cur_payments.fetchall():
+        days[r["payment_date"][:10]]["payments"].append(dict(r))
+
+    # 3. Status Changes
+    cur_history = c.execute(
+        """
+        SELECT h.*, s.full_name as student_name, st_from.name as from_name, st_to.name as to_name
+        FROM student_status_history h
+        JOIN students s ON s.id = h.student_id
+        LEFT JOIN statuses st_from ON st_from.id = h.from_status_id
+        LEFT JOIN statuses st_to ON st_to.id = h.to_status_id
+        WHERE h.changed_at >= ? AND h.changed_at < ?
+        ORDER BY h.changed_at DESC
+        """,
+        (lo, hi)
+    )
+    for r in cur_history.fetchall():
+        days[r["changed_at"][:10]]["status_changes"].append(dict(r))
+
+    for d in days.values():
+        d["total_received"] = sum(int(p["amount"]) for p in d["payments"])
+    return days
+
+
+async def report_range_data(db: Any, date_from: str, date_to: str) -> Dict[str, Any]:
+    """Activity report over an inclusive range of days.
+
+    Days inside a closed accounting period are frozen into ``report_snapshots`` the
+    first time one is needed and later reads come from there, so they cost one row
+    read per day. Open days are always computed: payment_date is typed in by the
+    user, so a payment can still be backdated into any day that is not closed.
+    """
+    label = date_from if date_from == date_to else f"{date_from} au {date_to}"
+
     if settings.db_backend != "sqlite":
         # Placeholder for mongo
-        return {"date": date_str, "students": [], "payments": [], "status_changes": []}
+        return {"date": label, "date_from": date_from, "date_to": date_to, "students": [], "payments": [], "status_changes": [], "total_received": 0, "days": []}
 
     c = conn()
     try:
-        # 1. New Students
-        cur_students = c.execute(
-            "SELECT * FROM students WHERE substr(created_at, 1, 10) = ? ORDER BY created_at DESC",
-            (date_str,)
-        )
-        students = [dict(r) for r in cur_students.fetchall()]
-
-        # 2. Payments
-        cur_payments = c.execute(
-            """
-            SELECT p.*, s.full_name as student_name
-            FROM payments p
-            JOIN students s ON s.id = p.student_id
-            WHERE substr(p.payment_date, 1, 10) = ? AND p.payment_status = 'received'
-            ORDER BY p.id DESC
-            """,
-            (date_str,)
+        cur = c.execute(
+            "SELECT report_date, payload FROM report_snapshots WHERE report_date >= ? AND report_date <= ?",
+            (date_from, date_to)
         )
-        payments = [dict(r) for r in cur_payments.fetchall()]
-
-        # 3. Status Changes
-        cur_history = c.execute(
-            """
-            SELECT h.*, s.full_name as student_name, st_from.name as from_name, st_to.name as to_name
-            FROM student_status_history h
-            JOIN students s ON s.id = h.student_id
-            LEFT JOIN statuses st_from ON st_from.id = h.from_status_id
-            LEFT JOIN statuses st_to ON st_to.id = h.to_status_id
-            WHERE substr(h.changed_at, 1, 10) = ?
-            ORDER BY h.changed_at DESC
-            """,
-            (date_str,)
-        )
-        status_changes = [dict(r) for r in cur_history.fetchall()]
+        days = {r["report_date"]: json.loads(r["payload"]) for r in cur.fetchall()}
+
+        missing = [d for d in _days(date_from, date_to) if d not in days]
+        if missing:
+            computed = _compute_days(c, missing[0], missing[-1])
+            # Closing a month also closes each of its days, so day rows are enough.
+            closed = {
+                r["period"]
+                for r in c.execute(
+                    "SELECT period FROM closed_periods WHERE kind = 'day' AND period >= ? AND period <= ?",
+                    (missing[0], missing[-1]),
+                )
+            }
+            now = datetime.utcnow().isoformat(timespec="seconds")
+            frozen = []
+            for d in missing:
+                days[d] = computed[d]
+                if d in closed:
+                    frozen.append((d, json.dumps(computed[d], ensure_ascii=False), now))
+            if frozen:
+                # OR IGNORE: a concurrent request may have frozen the same day first.
+                c.executemany(
+                    "INSERT OR IGNORE INTO report_snapshots (report_date, payload, created_at) VALUES (?, ?, ?)",
+                    frozen
+                )
+                c.commit()
+    finally:
+        c.close()
+
+    ordered = [days[d] for d in sorted(days, reverse=True)]
+    return {
+        "date": label,
+        "date_from": date_from,
+        "date_to": date_to,
+        "students": [s for d in ordered for s in d["students"]],
+        "payments": [p for d in ordered for p in d["payments"]],
+        "status_changes": [h for d in ordered for h in d["status_changes"]],
+        "total_received": sum(d["total_received"] for d in ordered),
+        "days": [
+            {
+                "date": d["date"],
+                "students": len(d["students"]),
+                "payments": len(d["payments"]),
+                "status_changes": len(d["status_changes"]),
+                "total_received": d["total_received"],
+            }
+            for d in ordered
+        ],
+    }
+
+
+async def daily_report_data(db: Any, date_str: str | None = None) -> Dict[str, Any]:
+    if not date_str:
+        date_str = datetime.utcnow().strftime("%Y-%m-%d")
+    return await report_range_data(db, date_str, date_str)
 
-        total_received = sum(int(p["amount"]) for p in payments)
 
-        return {
-            "date": date_str,
-            "students": students,
-            "payments": payments,
-            "status_changes": status_changes,
-            "total_received": total_received
-        }
+async def delete_report_snapshots(db: Any, date_from: str, date_to: str) -> int:
+    """Drop frozen days so they are rebuilt from the raw tables on next view."""
+    if settings.db_backend != "sqlite":
+        return 0
+    c = conn()
+    try:
+        cur = c.execute(
+            "DELETE FROM report_snapshots WHERE report_date >= ? AND report_date <= ?",
+            (date_from, date_to)
+        )
+        c.commit()
+        return cur.rowcount
     finally:
         c.close()
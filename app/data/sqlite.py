@@ -1,10 +1,53 @@
 import sqlite3
+import sys
+import time
 
 from app.core.config import settings
+from app.metrics import db_latency
+from app.profiler import current_profile, record_query
 
 
-def _conn() -> sqlite3.Connection:
-    conn = sqlite3.connect(settings.sqlite_path, check_same_thread=False)
+class TimedConnection(sqlite3.Connection):
+    """Connection that reports its open-to-close time under the data function that opened it.
+
+    While a request is being profiled (SQL_PROFILER), each statement run through
+    execute/executemany is also timed into that request's profile.
+    """
+
+    operation = "unknown"
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._opened_at = time.perf_counter()
+
+    def execute(self, sql, *args):
+        if current_profile.get() is None:
+            return super().execute(sql, *args)
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, *args)
+        finally:
+            record_query(sql, (time.perf_counter() - start) * 1000)
+
+    def executemany(self, sql, *args):
+        if current_profile.get() is None:
+            return super().executemany(sql, *args)
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, *args)
+        finally:
+            record_query(sql, (time.perf_counter() - start) * 1000)
+
+    def close(self) -> None:
+        super().close()
+        if self._opened_at is not None:
+            db_latency.observe(time.perf_counter() - self._opened_at, operation=self.operation)
+            self._opened_at = None
+
+
+def _conn(operation: str = "unknown") -> sqlite3.Connection:
+    conn = sqlite3.connect(settings.sqlite_path, check_same_thread=False, factory=TimedConnection)
+    conn.operation = operation
     conn.row_factory = sqlite3.Row
     return conn
 
@@ -13,7 +56,10 @@ def init_sqlite() -> None:
     if settings.db_backend != "sqlite":
         return
 
-    conn = _conn()
+    from app.data.contacts import backfill_contact_keys
+    from app.data.ledger import recompute_ledger
+
+    conn = _conn("init_sqlite")
     try:
         conn.execute(
             """
@@ -41,6 +87,7 @@ def init_sqlite() -> None:
               payment_status TEXT NOT NULL,
               receipt_original_filename TEXT,
               receipt_stored_path TEXT,
+              receipt_sha256 TEXT,
               created_by_user_id INTEGER,
               created_at TEXT NOT NULL,
               FOREIGN KEY(student_id) REFERENCES students(id)
@@ -66,13 +113,18 @@ def init_sqlite() -> None:
               full_name TEXT NOT NULL,
               phone TEXT NOT NULL,
               email TEXT NOT NULL,
+              phone_key TEXT,
+              email_key TEXT,
               country TEXT NOT NULL,
               study_level TEXT NOT NULL,
               program_choice TEXT NOT NULL,
               university TEXT NOT NULL,
               status_id INTEGER,
               agent_name TEXT NOT NULL,
+              agent_user_id INTEGER REFERENCES users(id),
               total_amount INTEGER NOT NULL DEFAULT 0,
+              paid_total INTEGER NOT NULL DEFAULT 0,
+              balance INTEGER NOT NULL DEFAULT 0,
               currency TEXT NOT NULL DEFAULT 'FCFA',
               notes TEXT,
               created_at TEXT NOT NULL,
@@ -89,6 +141,25 @@ def init_sqlite() -> None:
             conn.execute("ALTER TABLE students ADD COLUMN total_amount INTEGER NOT NULL DEFAULT 0")
         if "currency" not in cols:
             conn.execute("ALTER TABLE students ADD COLUMN currency TEXT NOT NULL DEFAULT 'FCFA'")
+        if "agent_user_id" not in cols:
+            conn.execute("ALTER TABLE students ADD COLUMN agent_user_id INTEGER REFERENCES users(id)")
+        if "phone_key" not in cols:
+            conn.execute("ALTER TABLE students ADD COLUMN phone_key TEXT")
+            conn.execute("ALTER TABLE students ADD COLUMN email_key TEXT")
+            backfill_contact_keys(conn, "students")
+        if "paid_total" not in cols:
+            conn.execute("ALTER TABLE students ADD COLUMN paid_total INTEGER NOT NULL DEFAULT 0")
+            conn.execute("ALTER TABLE students ADD COLUMN balance INTEGER NOT NULL DEFAULT 0")
+            recompute_ledger(conn)
+        # Rows written before agents were linked by id (or by name-only imports) are matched on the
+        # display name; the earliest account wins if two users share a name.
+        conn.execute(
+            """
+            UPDATE students
+            SET agent_user_id = (SELECT u.id FROM users u WHERE u.full_name = students.agent_name ORDER BY u.id LIMIT 1)
+            WHERE agent_user_id IS NULL
+            """
+        )
 
         conn.execute(
             """
@@ -114,6 +185,7 @@ def init_sqlite() -> None:
               stored_filename TEXT NOT NULL,
               stored_path TEXT NOT NULL,
               size_bytes INTEGER NOT NULL,
+              sha256 TEXT,
               uploaded_by_user_id INTEGER,
               uploaded_at TEXT NOT NULL,
               FOREIGN KEY(student_id) REFERENCES students(id)
@@ -121,6 +193,16 @@ def init_sqlite() -> None:
             """
         )
 
+        cur = conn.execute("PRAGMA table_info(student_documents);")
+        cols = {row[1] for row in cur.fetchall()}
+        if "sha256" not in cols:
+            conn.execute("ALTER TABLE student_documents ADD COLUMN sha256 TEXT")
+
+        cur = conn.execute("PRAGMA table_info(payments);")
+        cols = {row[1] for row in cur.fetchall()}
+        if "receipt_sha256" not in cols:
+            conn.execute("ALTER TABLE payments ADD COLUMN receipt_sha256 TEXT")
+
         conn.execute(
             """
             CREATE TABLE IF NOT EXISTS partners (
@@ -150,12 +232,18 @@ def init_sqlite() -> None:
               student_id INTEGER,
               created_at TEXT NOT NULL,
               completed_at TEXT,
+              overdue_notified_at TEXT,
               FOREIGN KEY(assigned_to_user_id) REFERENCES users(id),
               FOREIGN KEY(student_id) REFERENCES students(id)
             );
             """
         )
 
+        cur = conn.execute("PRAGMA table_info(tasks);")
+        cols = {row[1] for row in cur.fetchall()}
+        if "overdue_notified_at" not in cols:
+            conn.execute("ALTER TABLE tasks ADD COLUMN overdue_notified_at TEXT")
+
         conn.execute(
             """
             CREATE TABLE IF NOT EXISTS prospects (
@@ -163,10 +251,13 @@ def init_sqlite() -> None:
               full_name TEXT NOT NULL,
               phone TEXT NOT NULL,
               email TEXT,
+              phone_key TEXT,
+              email_key TEXT,
               country_interest TEXT,
               source TEXT,
               status TEXT DEFAULT 'new',
               agent_name TEXT,
+              agent_user_id INTEGER REFERENCES users(id),
               notes TEXT,
               created_at TEXT NOT NULL,
               updated_at TEXT NOT NULL
@@ -174,6 +265,22 @@ def init_sqlite() -> None:
             """
         )
 
+        cur = conn.execute("PRAGMA table_info(prospects);")
+        cols = {row[1] for row in cur.fetchall()}
+        if "agent_user_id" not in cols:
+            conn.execute("ALTER TABLE prospects ADD COLUMN agent_user_id INTEGER REFERENCES users(id)")
+        if "phone_key" not in cols:
+            conn.execute("ALTER TABLE prospects ADD COLUMN phone_key TEXT")
+            conn.execute("ALTER TABLE prospects ADD COLUMN email_key TEXT")
+            backfill_contact_keys(conn, "prospects")
+        conn.execute(
+            """
+            UPDATE prospects
+            SET agent_user_id = (SELECT u.id FROM users u WHERE u.full_name = prospects.agent_name ORDER BY u.id LIMIT 1)
+            WHERE agent_user_id IS NULL AND agent_name IS NOT NULL
+            """
+        )
+
         conn.execute(
             """
             CREATE TABLE IF NOT EXISTS daily_reports (
@@ -190,6 +297,117 @@ def init_sqlite() -> None:
             """
         )
 
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS report_snapshots (
+              report_date TEXT PRIMARY KEY,
+              payload TEXT NOT NULL,
+              created_at TEXT NOT NULL
+            );
+            """
+        )
+
+        # closed accounting periods (a day or a month) and their frozen cash totals
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS closed_periods (
+              period TEXT PRIMARY KEY,
+              kind TEXT NOT NULL,
+              date_from TEXT NOT NULL,
+              date_to TEXT NOT NULL,
+              payment_count INTEGER NOT NULL DEFAULT 0,
+              closed_at TEXT NOT NULL,
+              closed_by_user_id INTEGER REFERENCES users(id)
+            );
+            """
+        )
+        # Snapshots used to be taken of any past day; only closed days are frozen now,
+        # since a payment can still be backdated into an open one.
+        conn.execute("DELETE FROM report_snapshots WHERE report_date NOT IN (SELECT period FROM closed_periods)")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS cash_closings (
+              period TEXT NOT NULL REFERENCES closed_periods(period),
+              payment_mode TEXT NOT NULL,
+              currency TEXT NOT NULL,
+              agent_user_id INTEGER,
+              agent_name TEXT NOT NULL,
+              payment_count INTEGER NOT NULL,
+              total INTEGER NOT NULL
+            );
+            """
+        )
+
+        # one row per stay of a student in a status, derived from student_status_history
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS status_stays (
+              history_id INTEGER PRIMARY KEY,
+              student_id INTEGER NOT NULL,
+              status_id INTEGER,
+              entered_at TEXT NOT NULL,
+              left_at TEXT,
+              next_status_id INTEGER
+            );
+            """
+        )
+
+        # bumped by every write to a cached reference table (see app/data/catalog.py)
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS catalog_versions (
+              name TEXT PRIMARY KEY,
+              version INTEGER NOT NULL
+            );
+            """
+        )
+
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS analytics_state (
+              name TEXT PRIMARY KEY,
+              value INTEGER NOT NULL
+            );
+            """
+        )
+
+        # leases electing the single worker that runs each periodic job
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS scheduler_locks (
+              name TEXT PRIMARY KEY,
+              owner TEXT NOT NULL,
+              expires_at REAL NOT NULL
+            );
+            """
+        )
+
+        # progress and report of bulk imports, shared by every worker
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS import_jobs (
+              id TEXT PRIMARY KEY,
+              kind TEXT NOT NULL,
+              filename TEXT NOT NULL,
+              dry_run INTEGER NOT NULL,
+              status TEXT NOT NULL,
+              progress REAL NOT NULL DEFAULT 0,
+              rows INTEGER NOT NULL DEFAULT 0,
+              valid INTEGER NOT NULL DEFAULT 0,
+              inserted INTEGER NOT NULL DEFAULT 0,
+              duplicates INTEGER NOT NULL DEFAULT 0,
+              error_count INTEGER NOT NULL DEFAULT 0,
+              errors TEXT NOT NULL DEFAULT '[]',
+              message TEXT,
+              owner_id TEXT,
+              path TEXT NOT NULL,
+              started_at TEXT NOT NULL,
+              finished_at TEXT,
+              updated_at REAL NOT NULL
+            );
+            """
+        )
+
         conn.execute(
             """
             CREATE TABLE IF NOT EXISTS notifications (
@@ -206,30 +424,206 @@ def init_sqlite() -> None:
             """
         )
 
+        cur = conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='events'")
+        events_is_new = cur.fetchone() is None
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS events (
+              id INTEGER PRIMARY KEY AUTOINCREMENT,
+              type TEXT NOT NULL,
+              occurred_at TEXT NOT NULL,
+              actor_user_id INTEGER,
+              actor_name TEXT,
+              student_id INTEGER,
+              student_name TEXT,
+              from_val TEXT,
+              to_val TEXT,
+              ref_id INTEGER
+            );
+            """
+        )
+        if events_is_new:
+            _backfill_events(conn)
+
         conn.execute(
             "CREATE INDEX IF NOT EXISTS idx_students_status ON students(status_id);"
         )
 
+        # (student_id, timestamp, id) serves both per-student lookups and the newest-first timeline;
+        # they supersede the former single-column student_id indexes.
+        conn.execute("DROP INDEX IF EXISTS idx_student_documents_student;")
+        conn.execute("DROP INDEX IF EXISTS idx_payments_student;")
+
         conn.execute(
-            "CREATE INDEX IF NOT EXISTS idx_student_documents_student ON student_documents(student_id);"
+            "CREATE INDEX IF NOT EXISTS idx_student_documents_student_time ON student_documents(student_id, uploaded_at, id);"
         )
 
         conn.execute(
-            "CREATE INDEX IF NOT EXISTS idx_payments_student ON payments(student_id);"
+            "CREATE INDEX IF NOT EXISTS idx_payments_student_time ON payments(student_id, created_at, id);"
+        )
+
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_status_history_student_time ON student_status_history(student_id, changed_at, id);"
+        )
+
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_tasks_student_time ON tasks(student_id, created_at, id);"
         )
 
         conn.execute(
             "CREATE INDEX IF NOT EXISTS idx_tasks_assigned ON tasks(assigned_to_user_id);"
         )
 
+        # overdue scan: status equality then a due_date range
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_tasks_status_due ON tasks(status, due_date);"
+        )
+
         conn.execute(
             "CREATE INDEX IF NOT EXISTS idx_prospects_status ON prospects(status);"
         )
 
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_students_agent ON students(agent_user_id);"
+        )
+
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_prospects_agent ON prospects(agent_user_id);"
+        )
+
+        # duplicate lookups on normalized contacts; rows without a phone/email stay out of the index
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_students_phone_key ON students(phone_key) WHERE phone_key IS NOT NULL;"
+        )
+
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_students_email_key ON students(email_key) WHERE email_key IS NOT NULL;"
+        )
+
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_prospects_phone_key ON prospects(phone_key) WHERE phone_key IS NOT NULL;"
+        )
+
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_prospects_email_key ON prospects(email_key) WHERE email_key IS NOT NULL;"
+        )
+
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_status_stays_student ON status_stays(student_id);"
+        )
+
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_status_stays_status ON status_stays(status_id, left_at);"
+        )
+
+        # name-prefix typeahead: range scan on the case-folded name
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_students_name ON students(full_name COLLATE NOCASE);"
+        )
+
+        # "balance > 0" filters and balance sorting on the students list
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_students_balance ON students(balance);"
+        )
+
+        # accounting queue: only the few pending rows are indexed
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_payments_pending ON payments(payment_date, id) WHERE payment_status = 'pending';"
+        )
+
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_cash_closings_period ON cash_closings(period);"
+        )
+
+        # range scans for date-bounded reports
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_students_created ON students(created_at);"
+        )
+
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_payments_date ON payments(payment_date);"
+        )
+
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_status_history_changed ON student_status_history(changed_at);"
+        )
+
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_events_time ON events(occurred_at, id);"
+        )
+
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_events_actor ON events(actor_user_id, occurred_at, id);"
+        )
+
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_events_student ON events(student_id, occurred_at, id);"
+        )
+
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_events_type ON events(type, occurred_at, id);"
+        )
+
         conn.commit()
     finally:
         conn.close()
 
 
+def _backfill_events(conn: sqlite3.Connection) -> None:
+    """Seed the event log from the tables it replaces, oldest first."""
+    conn.execute(
+        """
+        INSERT INTO events(type, occurred_at, actor_user_id, actor_name, student_id, student_name, from_val, to_val, ref_id)
+        SELECT type, ts, actor_id, actor_name, student_id, student_name, from_val, to_val, ref_id FROM (
+            SELECT 'status' AS type, h.changed_at AS ts, h.changed_by_user_id AS actor_id, u.full_name AS actor_name,
+                   h.student_id, s.full_name AS student_name, st_from.name AS from_val, st_to.name AS to_val, h.id AS ref_id
+            FROM student_status_history h
+            LEFT JOIN students s ON s.id = h.student_id
+            LEFT JOIN statuses st_from ON st_from.id = h.from_status_id
+            LEFT JOIN statuses st_to ON st_to.id = h.to_status_id
+            LEFT JOIN users u ON u.id = h.changed_by_user_id
+
+            UNION ALL
+
+            SELECT 'payment', p.created_at, p.created_by_user_id, u.full_name,
+                   p.student_id, s.full_name, p.payment_type, CAST(p.amount AS TEXT) || ' ' || p.currency, p.id
+            FROM payments p
+            LEFT JOIN students s ON s.id = p.student_id
+            LEFT JOIN users u ON u.id = p.created_by_user_id
+
+            UNION ALL
+
+            SELECT 'task', t.completed_at, t.assigned_to_user_id, u.full_name,
+                   t.student_id, s.full_name, t.title, 'Terminé', t.id
+            FROM tasks t
+            LEFT JOIN students s ON s.id = t.student_id
+            LEFT JOIN users u ON u.id = t.assigned_to_user_id
+            WHERE t.status = 'completed' AND t.completed_at IS NOT NULL
+
+            UNION ALL
+
+            SELECT 'document', d.uploaded_at, d.uploaded_by_user_id, u.full_name,
+                   d.student_id, s.full_name, d.doc_type, d.original_filename, d.id
+            FROM student_documents d
+            LEFT JOIN students s ON s.id = d.student_id
+            LEFT JOIN users u ON u.id = d.uploaded_by_user_id
+        )
+        ORDER BY ts
+        """
+    )
+
+
+def check_sqlite() -> None:
+    """Raise unless the database file can be read and its write lock taken."""
+    c = conn()
+    try:
+        c.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        c.execute("BEGIN IMMEDIATE")
+        c.rollback()
+    finally:
+        c.close()
+
+
 def conn():
-    return _conn()
+    # Data functions open one connection each, so the caller's name labels its timing.
+    return _conn(sys._getframe(1).f_code.co_name)
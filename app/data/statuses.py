@@ -1,7 +1,7 @@
 from datetime import datetime
 from typing import Any
 
-from app.core.config import settings
+from app.data.catalog import bump_catalog_version, get_catalog
 from app.data.sqlite import conn
 
 
@@ -28,38 +28,16 @@ def _seed_default_statuses() -> None:
                 "INSERT INTO statuses(name, active, sort_order) VALUES(?,?,?)",
                 (name, active, sort_order),
             )
+        bump_catalog_version(c, "statuses")
         c.commit()
     finally:
         c.close()
 
 
 async def list_statuses(db: Any):
-    if settings.db_backend != "sqlite":
-        cur = db.statuses.find({"active": True}).sort("sort_order", 1)
-        return [s async for s in cur]
-
-    _seed_default_statuses()
-    c = conn()
-    try:
-        cur = c.execute(
-            "SELECT id, name, active, sort_order FROM statuses WHERE active=1 ORDER BY sort_order ASC, name ASC"
-        )
-        return [dict(r) for r in cur.fetchall()]
-    finally:
-        c.close()
+    """Active statuses in display order, from the in-memory catalog."""
+    return [s for s in (await get_catalog(db)).rows["statuses"] if s.get("active")]
 
 
 async def get_status_by_id(db: Any, status_id: int):
-    if settings.db_backend != "sqlite":
-        return await db.statuses.find_one({"_id": status_id})
-
-    c = conn()
-    try:
-        cur = c.execute(
-            "SELECT id, name, active, sort_order FROM statuses WHERE id=? LIMIT 1",
-            (status_id,),
-        )
-        row = cur.fetchone()
-        return dict(row) if row else None
-    finally:
-        c.close()
+    return (await get_catalog(db)).get("statuses", status_id)
@@ -1,7 +1,12 @@
-from datetime import datetime
-from typing import Any, Optional
+import asyncio
+import re
+from datetime import date, datetime, timedelta
+from typing import Any, AsyncIterator, Optional
 
 from app.core.config import settings
+from app.data.closings import PeriodClosed
+from app.data.contacts import email_key, phone_key
+from app.data.events import record_event, record_status_event, record_status_events
 from app.data.sqlite import conn
 
 
@@ -9,20 +14,34 @@ def _now_iso() -> str:
     return datetime.utcnow().isoformat(timespec="seconds")
 
 
-async def list_students(db: Any, *, status_id: Optional[int] = None, agent_name: Optional[str] = None, search: Optional[str] = None):
+def _next_day(day: str) -> str:
+    return (date.fromisoformat(day) + timedelta(days=1)).isoformat()
+
+
+async def list_students(
+    db: Any,
+    *,
+    status_id: Optional[int] = None,
+    agent_user_id: Any = None,
+    search: Optional[str] = None,
+    balance_due: bool = False,
+):
+    """Students, newest first; with ``balance_due`` only those still owing, largest balance first."""
     if settings.db_backend != "sqlite":
         q = {}
         if status_id is not None:
             q["status_id"] = status_id
-        if agent_name:
-            q["agent_name"] = agent_name
+        if balance_due:
+            q["balance"] = {"$gt": 0}
+        if agent_user_id is not None:
+            q["agent_user_id"] = agent_user_id
         if search:
             q["$or"] = [
                 {"full_name": {"$regex": search, "$options": "i"}},
                 {"email": {"$regex": search, "$options": "i"}},
                 {"phone": {"$regex": search, "$options": "i"}}
             ]
-        cur = db.students.find(q).sort("created_at", -1)
+        cur = db.students.find(q).sort(*(("balance", -1) if balance_due else ("created_at", -1)))
         return [s async for s in cur]
 
     c = conn()
@@ -39,22 +58,120 @@ async def list_students(db: Any, *, status_id: Optional[int] = None, agent_name:
             query += " AND s.status_id = ?"
             params.append(status_id)
             
-        if agent_name:
-            query += " AND s.agent_name = ?"
-            params.append(agent_name)
+        if agent_user_id is not None:
+            query += " AND s.agent_user_id = ?"
+            params.append(agent_user_id)
             
         if search:
             query += " AND (s.full_name LIKE ? OR s.email LIKE ? OR s.phone LIKE ?)"
             s_val = f"%{search}%"
             params.extend([s_val, s_val, s_val])
-            
-        query += " ORDER BY s.created_at DESC"
+
+        if balance_due:
+            # Range on idx_students_balance, read backwards for the ordering.
+            query += " AND s.balance > 0 ORDER BY s.balance DESC"
+        else:
+            query += " ORDER BY s.created_at DESC"
         cur = c.execute(query, params)
         return [dict(r) for r in cur.fetchall()]
     finally:
         c.close()
 
 
+async def search_students_by_prefix(db: Any, prefix: str, *, agent_user_id: Any = None, limit: int = 10):
+    """Students whose name starts with ``prefix`` (case-insensitive), for typeahead pickers.
+
+    The prefix becomes a range on idx_students_name, so only matching index entries
+    are visited whatever the size of the table.
+    """
+    prefix = prefix.strip()
+    if not prefix:
+        return []
+    if settings.db_backend != "sqlite":
+        q: dict = {"full_name": {"$regex": "^" + re.escape(prefix), "$options": "i"}}
+        if agent_user_id is not None:
+            q["agent_user_id"] = agent_user_id
+        cur = db.students.find(q, {"full_name": 1, "phone": 1, "agent_name": 1}).sort("full_name", 1).limit(limit)
+        return [{**s, "id": str(s["_id"])} async for s in cur]
+
+    c = conn()
+    try:
+        query = """
+            SELECT id, full_name, phone, agent_name
+            FROM students
+            WHERE full_name >= ? COLLATE NOCASE AND full_name < ? COLLATE NOCASE
+        """
+        params: list = [prefix, prefix + "\U0010ffff"]
+        if agent_user_id is not None:
+            query += " AND agent_user_id = ?"
+            params.append(agent_user_id)
+        query += " ORDER BY full_name COLLATE NOCASE LIMIT ?"
+        params.append(limit)
+        return [dict(r) for r in c.execute(query, params)]
+    finally:
+        c.close()
+
+
+async def iter_students(
+    db: Any,
+    *,
+    agent_user_id: Any = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    batch_size: int = 1000,
+) -> AsyncIterator[dict]:
+    """Stream students in id order for exports; ``date_from``/``date_to`` bound created_at (YYYY-MM-DD)."""
+    if settings.db_backend != "sqlite":
+        q: dict = {}
+        if agent_user_id is not None:
+            q["agent_user_id"] = agent_user_id
+        if date_from or date_to:
+            q["created_at"] = {}
+            if date_from:
+                q["created_at"]["$gte"] = date_from
+            if date_to:
+                q["created_at"]["$lt"] = _next_day(date_to)
+        async for s in db.students.find(q).sort("_id", 1).batch_size(batch_size):
+            yield s
+        return
+
+    where = ""
+    params: list = []
+    if agent_user_id is not None:
+        where += " AND s.agent_user_id = ?"
+        params.append(agent_user_id)
+    if date_from:
+        where += " AND s.created_at >= ?"
+        params.append(date_from)
+    if date_to:
+        where += " AND s.created_at < ?"
+        params.append(_next_day(date_to))
+
+    last_id = 0
+    while True:
+        c = conn()
+        try:
+            cur = c.execute(
+                f"""
+                SELECT s.*, st.name AS status_name
+                FROM students s
+                LEFT JOIN statuses st ON st.id = s.status_id
+                WHERE s.id > ?{where}
+                ORDER BY s.id
+                LIMIT ?
+                """,
+                (last_id, *params, batch_size),
+            )
+            rows = cur.fetchmany(batch_size)
+        finally:
+            c.close()
+        if not rows:
+            return
+        last_id = rows[-1]["id"]
+        for r in rows:
+            yield dict(r)
+
+
 async def set_student_status(
     db: Any,
     *,
@@ -90,31 +207,150 @@ async def set_student_status(
         from_status_id = row["status_id"]
 
         c.execute("UPDATE students SET status_id=?, updated_at=? WHERE id=?", (to_status_id, now, student_id))
-        c.execute(
+        cur = c.execute(
             """
             INSERT INTO student_status_history(student_id, from_status_id, to_status_id, changed_by_user_id, changed_at)
             VALUES(?,?,?,?,?)
             """,
             (student_id, from_status_id, to_status_id, changed_by_user_id, now),
         )
+        record_status_event(
+            c,
+            occurred_at=now,
+            actor_user_id=changed_by_user_id,
+            student_id=student_id,
+            from_status_id=from_status_id,
+            to_status_id=to_status_id,
+            ref_id=cur.lastrowid,
+        )
+        c.commit()
+    finally:
+        c.close()
+
+
+async def bulk_set_student_status(
+    db: Any,
+    *,
+    student_ids: list[Any],
+    to_status_id: Optional[int],
+    changed_by_user_id: Optional[int],
+    agent_user_id: Optional[Any] = None,
+) -> tuple[list[Any], list[dict]]:
+    """Move many students to one status in a single transaction.
+
+    Students that are missing, outside ``agent_user_id``'s scope or already in the
+    target status are skipped and reported; the others are all updated together.
+    Returns ``(updated_ids, failures)``, each failure being ``{student_id, full_name, reason}``.
+    """
+    student_ids = list(dict.fromkeys(student_ids))
+    if not student_ids:
+        return [], []
+    now = _now_iso()
+
+    def _split(found: dict) -> tuple[list, list[dict]]:
+        ok, failures = [], []
+        for sid in student_ids:
+            s = found.get(sid)
+            if s is None:
+                failures.append({"student_id": sid, "full_name": None, "reason": "introuvable"})
+            elif agent_user_id is not None and str(s.get("agent_user_id")) != str(agent_user_id):
+                failures.append({"student_id": sid, "full_name": s["full_name"], "reason": "non autorisé"})
+            elif s.get("status_id") == to_status_id:
+                failures.append({"student_id": sid, "full_name": s["full_name"], "reason": "déjà dans ce statut"})
+            else:
+                ok.append(sid)
+        return ok, failures
+
+    if settings.db_backend != "sqlite":
+        cur = db.students.find({"_id": {"$in": student_ids}}, {"full_name": 1, "status_id": 1, "agent_user_id": 1})
+        found = {s["_id"]: s async for s in cur}
+        ok, failures = _split(found)
+        if ok:
+            await db.students.update_many({"_id": {"$in": ok}}, {"$set": {"status_id": to_status_id, "updated_at": now}})
+            await db.student_status_history.insert_many(
+                [
+                    {
+                        "student_id": sid,
+                        "from_status_id": found[sid].get("status_id"),
+                        "to_status_id": to_status_id,
+                        "changed_by_user_id": changed_by_user_id,
+                        "changed_at": now,
+                    }
+                    for sid in ok
+                ]
+            )
+        return ok, failures
+
+    c = conn()
+    try:
+        c.execute("BEGIN IMMEDIATE")
+        found = {}
+        for i in range(0, len(student_ids), 500):
+            chunk = student_ids[i : i + 500]
+            marks = ",".join("?" * len(chunk))
+            for r in c.execute(f"SELECT id, full_name, status_id, agent_user_id FROM students WHERE id IN ({marks})", chunk):
+                found[r["id"]] = dict(r)
+        ok, failures = _split(found)
+        if ok:
+            c.executemany("UPDATE students SET status_id=?, updated_at=? WHERE id=?", [(to_status_id, now, sid) for sid in ok])
+            last_hist = c.execute("SELECT COALESCE(MAX(id), 0) AS m FROM student_status_history").fetchone()["m"]
+            c.executemany(
+                """
+                INSERT INTO student_status_history(student_id, from_status_id, to_status_id, changed_by_user_id, changed_at)
+                VALUES(?,?,?,?,?)
+                """,
+                [(sid, found[sid]["status_id"], to_status_id, changed_by_user_id, now) for sid in ok],
+            )
+            hist_ids = [
+                row["id"] for row in c.execute("SELECT id FROM student_status_history WHERE id > ? ORDER BY id", (last_hist,))
+            ]
+            record_status_events(
+                c,
+                [
+                    {
+                        "occurred_at": now,
+                        "actor_user_id": changed_by_user_id,
+                        "student_id": sid,
+                        "from_status_id": found[sid]["status_id"],
+                        "to_status_id": to_status_id,
+                        "ref_id": hist_id,
+                    }
+                    for hist_id, sid in zip(hist_ids, ok)
+                ],
+            )
         c.commit()
+        return ok, failures
+    except Exception:
+        c.rollback()
+        raise
     finally:
         c.close()
 
 
 async def set_student_financial(db: Any, *, student_id: int, total_amount: int, currency: str):
     if settings.db_backend != "sqlite":
+        # An update pipeline reads paid_total inside the write, so a concurrent $inc cannot slip in between.
         await db.students.update_one(
             {"_id": student_id},
-            {"$set": {"total_amount": int(total_amount or 0), "currency": (currency or "FCFA").strip(), "updated_at": _now_iso()}},
+            [
+                {
+                    "$set": {
+                        "total_amount": int(total_amount or 0),
+                        "balance": {"$subtract": [int(total_amount or 0), {"$ifNull": ["$paid_total", 0]}]},
+                        # $literal: inside a pipeline a value such as "$" would read as a field path
+                        "currency": {"$literal": (currency or "FCFA").strip()},
+                        "updated_at": _now_iso(),
+                    }
+                }
+            ],
         )
         return
 
     c = conn()
     try:
         c.execute(
-            "UPDATE students SET total_amount=?, currency=?, updated_at=? WHERE id=?",
-            (int(total_amount or 0), (currency or "FCFA").strip(), _now_iso(), student_id),
+            "UPDATE students SET total_amount=?, balance=? - paid_total, currency=?, updated_at=? WHERE id=?",
+            (int(total_amount or 0), int(total_amount or 0), (currency or "FCFA").strip(), _now_iso(), student_id),
         )
         c.commit()
     finally:
@@ -124,7 +360,11 @@ async def set_student_financial(db: Any, *, student_id: int, total_amount: int,
 async def get_student(db: Any, student_id: int):
     if settings.db_backend != "sqlite":
         return await db.students.find_one({"_id": student_id})
+    # In a worker thread, so page sections loaded alongside it overlap.
+    return await asyncio.to_thread(_get_student_sqlite, student_id)
 
+
+def _get_student_sqlite(student_id: int):
     c = conn()
     try:
         cur = c.execute(
@@ -159,19 +399,25 @@ async def create_student(
     changed_by_user_id: Optional[int],
     total_amount: int = 0,
     currency: str = "FCFA",
+    agent_user_id: Any = None,
 ):
     if settings.db_backend != "sqlite":
         doc = {
             "full_name": full_name.strip(),
             "phone": phone.strip(),
             "email": email.lower().strip(),
+            "phone_key": phone_key(phone),
+            "email_key": email_key(email),
             "country": country.strip(),
             "study_level": study_level.strip(),
             "program_choice": program_choice.strip(),
             "university": university.strip(),
             "status_id": status_id,
             "agent_name": agent_name.strip(),
+            "agent_user_id": agent_user_id,
             "total_amount": int(total_amount or 0),
+            "paid_total": 0,
+            "balance": int(total_amount or 0),
             "currency": currency.strip() if currency else "FCFA",
             "notes": (notes or "").strip(),
             "created_at": _now_iso(),
@@ -185,19 +431,24 @@ async def create_student(
     try:
         cur = c.execute(
             """
-            INSERT INTO students(full_name, phone, email, country, study_level, program_choice, university, status_id, agent_name, total_amount, currency, notes, created_at, updated_at)
-            VALUES(?,?,?,?,?,?,?,?,?,?,?,?,?,?)
+            INSERT INTO students(full_name, phone, email, phone_key, email_key, country, study_level, program_choice, university, status_id, agent_name, agent_user_id, total_amount, balance, currency, notes, created_at, updated_at)
+            VALUES(?,?,?,?,?,?,?,?,?,?,?,COALESCE(?, (SELECT id FROM users WHERE full_name = ? ORDER BY id LIMIT 1)),?,?,?,?,?,?)
             """,
             (
                 full_name.strip(),
                 phone.strip(),
                 email.lower().strip(),
+                phone_key(phone),
+                email_key(email),
                 country.strip(),
                 study_level.strip(),
                 program_choice.strip(),
                 university.strip(),
                 status_id,
                 agent_name.strip(),
+                agent_user_id,
+                agent_name.strip(),
+                int(total_amount or 0),
                 int(total_amount or 0),
                 (currency or "FCFA").strip(),
                 (notes or "").strip(),
@@ -208,13 +459,22 @@ async def create_student(
         student_id = int(cur.lastrowid)
 
         if status_id is not None:
-            c.execute(
+            cur = c.execute(
                 """
                 INSERT INTO student_status_history(student_id, from_status_id, to_status_id, changed_by_user_id, changed_at)
                 VALUES(?,?,?,?,?)
                 """,
                 (student_id, None, status_id, changed_by_user_id, now),
             )
+            record_status_event(
+                c,
+                occurred_at=now,
+                actor_user_id=changed_by_user_id,
+                student_id=student_id,
+                from_status_id=None,
+                to_status_id=status_id,
+                ref_id=cur.lastrowid,
+            )
 
         c.commit()
         return student_id
@@ -222,6 +482,152 @@ async def create_student(
         c.close()
 
 
+async def bulk_create_students(db: Any, rows: list[dict], *, changed_by_user_id: Any) -> list[Any]:
+    """Insert already-validated students in one transaction, with their initial status history.
+
+    Each row has the keyword arguments of create_student (minus the actor). Returns the new ids in order.
+    """
+    if not rows:
+        return []
+    now = _now_iso()
+
+    if settings.db_backend != "sqlite":
+        docs = [
+            {
+                **r,
+                "phone_key": phone_key(r["phone"]),
+                "email_key": email_key(r["email"]),
+                "paid_total": 0,
+                "balance": int(r.get("total_amount") or 0),
+                "created_at": now,
+                "updated_at": now,
+            }
+            for r in rows
+        ]
+        result = await db.students.insert_many(docs)
+        history = [
+            {
+                "student_id": sid,
+                "from_status_id": None,
+                "to_status_id": r["status_id"],
+                "changed_by_user_id": changed_by_user_id,
+                "changed_at": now,
+            }
+            for sid, r in zip(result.inserted_ids, rows)
+            if r.get("status_id") is not None
+        ]
+        if history:
+            await db.student_status_history.insert_many(history)
+        return [str(i) for i in result.inserted_ids]
+
+    c = conn()
+    try:
+        # IMMEDIATE takes the write lock up front, so the ids handed out by executemany
+        # are exactly those above the current maximum.
+        c.execute("BEGIN IMMEDIATE")
+        last_id = c.execute("SELECT COALESCE(MAX(id), 0) AS m FROM students").fetchone()["m"]
+        c.executemany(
+            """
+            INSERT INTO students(full_name, phone, email, phone_key, email_key, country, study_level, program_choice, university, status_id, agent_name, agent_user_id, total_amount, balance, currency, notes, created_at, updated_at)
+            VALUES(?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
+            """,
+            [
+                (
+                    r["full_name"],
+                    r["phone"],
+                    r["email"],
+                    phone_key(r["phone"]),
+                    email_key(r["email"]),
+                    r["country"],
+                    r["study_level"],
+                    r["program_choice"],
+                    r["university"],
+                    r.get("status_id"),
+                    r["agent_name"],
+                    r.get("agent_user_id"),
+                    int(r.get("total_amount") or 0),
+                    int(r.get("total_amount") or 0),
+                    r.get("currency") or "FCFA",
+                    r.get("notes") or "",
+                    now,
+                    now,
+                )
+                for r in rows
+            ],
+        )
+        ids = [row["id"] for row in c.execute("SELECT id FROM students WHERE id > ? ORDER BY id", (last_id,))]
+
+        with_status = [(sid, r["status_id"]) for sid, r in zip(ids, rows) if r.get("status_id") is not None]
+        if with_status:
+            first_hist = c.execute("SELECT COALESCE(MAX(id), 0) AS m FROM student_status_history").fetchone()["m"]
+            c.executemany(
+                """
+                INSERT INTO student_status_history(student_id, from_status_id, to_status_id, changed_by_user_id, changed_at)
+                VALUES(?,?,?,?,?)
+                """,
+                [(sid, None, status_id, changed_by_user_id, now) for sid, status_id in with_status],
+            )
+            hist_ids = [
+                row["id"] for row in c.execute("SELECT id FROM student_status_history WHERE id > ? ORDER BY id", (first_hist,))
+            ]
+            record_status_events(
+                c,
+                [
+                    {
+                        "occurred_at": now,
+                        "actor_user_id": changed_by_user_id,
+                        "student_id": sid,
+                        "to_status_id": status_id,
+                        "ref_id": hist_id,
+                    }
+                    for hist_id, (sid, status_id) in zip(hist_ids, with_status)
+                ],
+            )
+        c.commit()
+        return ids
+    except Exception:
+        c.rollback()
+        raise
+    finally:
+        c.close()
+
+
+async def list_student_contacts(db: Any) -> list[tuple[str, str]]:
+    """(phone_key, email_key) of every student, for duplicate checks."""
+    if settings.db_backend != "sqlite":
+        cur = db.students.find({}, {"phone_key": 1, "email_key": 1})
+        return [(s.get("phone_key"), s.get("email_key")) async for s in cur]
+
+    c = conn()
+    try:
+        return [(r["phone_key"], r["email_key"]) for r in c.execute("SELECT phone_key, email_key FROM students")]
+    finally:
+        c.close()
+
+
+async def backfill_agent_user_ids(db: Any) -> int:
+    """Link Mongo students written before agents were referenced by id to their account.
+
+    Documents without ``agent_user_id`` are matched on ``agent_name`` against the
+    users' full names, the earliest account winning when two users share a name
+    (the same rule as the SQLite migration in init_sqlite). Idempotent; returns
+    the number of documents updated.
+    """
+    if settings.db_backend == "sqlite":
+        return 0
+
+    updated = 0
+    async for u in db.users.find({}, {"full_name": 1}).sort("_id", 1):
+        if not u.get("full_name"):
+            continue
+        res = await db.students.update_many(
+            {"agent_user_id": None, "agent_name": u["full_name"]},
+            {"$set": {"agent_user_id": str(u["_id"])}},
+        )
+        updated += res.modified_count
+    return updated
+
+
 async def update_student(
     db: Any,
     *,
@@ -237,6 +643,7 @@ async def update_student(
     agent_name: str,
     notes: Optional[str],
     changed_by_user_id: Optional[int],
+    agent_user_id: Any = None,
 ):
     if settings.db_backend != "sqlite":
         await db.students.update_one(
@@ -246,12 +653,15 @@ async def update_student(
                     "full_name": full_name.strip(),
                     "phone": phone.strip(),
                     "email": email.lower().strip(),
+                    "phone_key": phone_key(phone),
+                    "email_key": email_key(email),
                     "country": country.strip(),
                     "study_level": study_level.strip(),
                     "program_choice": program_choice.strip(),
                     "university": university.strip(),
                     "status_id": status_id,
                     "agent_name": agent_name.strip(),
+                    "agent_user_id": agent_user_id,
                     "notes": (notes or "").strip(),
                     "updated_at": _now_iso(),
                 }
@@ -271,19 +681,25 @@ async def update_student(
         c.execute(
             """
             UPDATE students
-            SET full_name=?, phone=?, email=?, country=?, study_level=?, program_choice=?, university=?, status_id=?, agent_name=?, notes=?, updated_at=?
+            SET full_name=?, phone=?, email=?, phone_key=?, email_key=?, country=?, study_level=?, program_choice=?, university=?,
+                status_id=?, agent_name=?, agent_user_id=COALESCE(?, (SELECT id FROM users WHERE full_name = ? ORDER BY id LIMIT 1)),
+                notes=?, updated_at=?
             WHERE id=?
             """,
             (
                 full_name.strip(),
                 phone.strip(),
                 email.lower().strip(),
+                phone_key(phone),
+                email_key(email),
                 country.strip(),
                 study_level.strip(),
                 program_choice.strip(),
                 university.strip(),
                 status_id,
                 agent_name.strip(),
+                agent_user_id,
+                agent_name.strip(),
                 (notes or "").strip(),
                 now,
                 student_id,
@@ -291,53 +707,100 @@ async def update_student(
         )
 
         if old_status_id != status_id:
-            c.execute(
+            cur = c.execute(
                 """
                 INSERT INTO student_status_history(student_id, from_status_id, to_status_id, changed_by_user_id, changed_at)
                 VALUES(?,?,?,?,?)
                 """,
                 (student_id, old_status_id, status_id, changed_by_user_id, now),
             )
+            record_status_event(
+                c,
+                occurred_at=now,
+                actor_user_id=changed_by_user_id,
+                student_id=student_id,
+                from_status_id=old_status_id,
+                to_status_id=status_id,
+                ref_id=cur.lastrowid,
+            )
 
         c.commit()
     finally:
         c.close()
 
 
-async def delete_student(db: Any, student_id: int):
-    if settings.db_backend != "sqlite":
-        await db.students.delete_one({"_id": student_id})
-        return
-
-    c = conn()
-    try:
-        c.execute("DELETE FROM student_status_history WHERE student_id=?", (student_id,))
-        c.execute("DELETE FROM students WHERE id=?", (student_id,))
-        c.commit()
-    finally:
-        c.close()
-
+async def delete_student(db: Any, student_id: int, *, deleted_by_user_id: Any = None) -> list[dict]:
+    """Delete a student with its history, documents and payments.
 
-async def list_student_history(db: Any, student_id: int):
+    Returns the removed document and receipt rows so the caller can drop their files.
+    Raises PeriodClosed when one of the payments belongs to a closed accounting period.
+    """
     if settings.db_backend != "sqlite":
-        cur = db.student_status_history.find({"student_id": student_id}).sort("changed_at", -1)
-        return [h async for h in cur]
+        removed = [d async for d in db.student_documents.find({"student_id": student_id})]
+        async for p in db.payments.find({"student_id": student_id, "receipt_stored_path": {"$ne": None}}):
+            removed.append({"stored_path": p.get("receipt_stored_path"), "sha256": p.get("receipt_sha256")})
+        await db.student_documents.delete_many({"student_id": student_id})
+        await db.payments.delete_many({"student_id": student_id})
+        await db.student_status_history.delete_many({"student_id": student_id})
+        await db.students.delete_one({"_id": student_id})
+        return removed
 
     c = conn()
     try:
+        # Write lock first, so no payment or closing can land between the check and the deletes.
+        c.execute("BEGIN IMMEDIATE")
+        closed = c.execute(
+            """
+            SELECT cp.period
+            FROM payments p
+            JOIN closed_periods cp ON cp.period IN (substr(p.payment_date, 1, 10), substr(p.payment_date, 1, 7))
+            WHERE p.student_id=?
+            LIMIT 1
+            """,
+            (student_id,),
+        ).fetchone()
+        if closed:
+            raise PeriodClosed(closed["period"])
+        cur = c.execute(
+            "SELECT original_filename, stored_filename, stored_path, sha256 FROM student_documents WHERE student_id=?",
+            (student_id,),
+        )
+        removed = [dict(r) for r in cur.fetchall()]
         cur = c.execute(
             """
-            SELECT h.id, h.student_id, h.from_status_id, h.to_status_id, h.changed_by_user_id, h.changed_at,
-                   s_from.name AS from_status_name,
-                   s_to.name AS to_status_name
-            FROM student_status_history h
-            LEFT JOIN statuses s_from ON s_from.id = h.from_status_id
-            LEFT JOIN statuses s_to ON s_to.id = h.to_status_id
-            WHERE h.student_id=?
-            ORDER BY h.changed_at DESC
+            SELECT receipt_original_filename AS original_filename, receipt_stored_path AS stored_path, receipt_sha256 AS sha256
+            FROM payments
+            WHERE student_id=? AND receipt_stored_path IS NOT NULL
             """,
             (student_id,),
         )
-        return [dict(r) for r in cur.fetchall()]
+        removed.extend(dict(r) for r in cur.fetchall())
+
+        # logged before the student row goes, so the events still carry its name
+        now = _now_iso()
+        for p in c.execute(
+            "SELECT id, payment_type, amount, currency FROM payments WHERE student_id=? ORDER BY id", (student_id,)
+        ).fetchall():
+            record_event(
+                c,
+                type="payment_deleted",
+                occurred_at=now,
+                actor_user_id=deleted_by_user_id,
+                student_id=student_id,
+                from_val=p["payment_type"],
+                to_val=f"{int(p['amount'])} {p['currency']}",
+                ref_id=p["id"],
+            )
+
+        c.execute("DELETE FROM student_documents WHERE student_id=?", (student_id,))
+        c.execute("DELETE FROM payments WHERE student_id=?", (student_id,))
+        c.execute("DELETE FROM student_status_history WHERE student_id=?", (student_id,))
+        c.execute("DELETE FROM status_stays WHERE student_id=?", (student_id,))
+        c.execute("DELETE FROM students WHERE id=?", (student_id,))
+        c.commit()
+        return removed
+    except Exception:
+        c.rollback()
+        raise
     finally:
         c.close()
@@ -1,8 +1,15 @@
+import asyncio
 from typing import Any, List, Optional
 from datetime import datetime
 from app.core.config import settings
+from app.data.events import record_event
 from app.data.sqlite import conn
 
+# Overdue tasks handled per transaction by notify_overdue_tasks.
+OVERDUE_BATCH_SIZE = 200
+# Titles listed in one coalesced reminder before "…".
+REMINDER_MAX_TITLES = 5
+
 def _now_iso() -> str:
     return datetime.utcnow().isoformat(timespec="seconds")
 
@@ -63,7 +70,7 @@ async def create_task(
     finally:
         c.close()
 
-async def update_task_status(db: Any, task_id: int, status: str):
+async def update_task_status(db: Any, task_id: int, status: str, changed_by_user_id: Optional[int] = None):
     if settings.db_backend != "sqlite":
         return
 
@@ -71,9 +78,24 @@ async def update_task_status(db: Any, task_id: int, status: str):
     c = conn()
     try:
         if status == "completed":
-            c.execute("UPDATE tasks SET status=?, completed_at=? WHERE id=?", (status, now, task_id))
+            cur = c.execute(
+                "UPDATE tasks SET status=?, completed_at=? WHERE id=? AND status != 'completed'", (status, now, task_id)
+            )
+            if cur.rowcount:
+                row = c.execute("SELECT title, student_id, assigned_to_user_id FROM tasks WHERE id=?", (task_id,)).fetchone()
+                record_event(
+                    c,
+                    type="task",
+                    occurred_at=now,
+                    actor_user_id=changed_by_user_id or row["assigned_to_user_id"],
+                    student_id=row["student_id"],
+                    from_val=row["title"],
+                    to_val="Terminé",
+                    ref_id=task_id,
+                )
         else:
-            c.execute("UPDATE tasks SET status=?, completed_at=NULL WHERE id=?", (status, task_id))
+            # A reopened task gets a fresh overdue reminder.
+            c.execute("UPDATE tasks SET status=?, completed_at=NULL, overdue_notified_at=NULL WHERE id=?", (status, task_id))
         c.commit()
     finally:
         c.close()
@@ -88,3 +110,63 @@ async def delete_task(db: Any, task_id: int):
         c.commit()
     finally:
         c.close()
+
+def _reminder_message(titles: List[str]) -> str:
+    listed = ", ".join(titles[:REMINDER_MAX_TITLES])
+    more = "…" if len(titles) > REMINDER_MAX_TITLES else ""
+    return f"{len(titles)} tâche(s) en retard : {listed}{more}"
+
+async def notify_overdue_tasks(db: Any, *, today: Optional[str] = None, batch_size: int = OVERDUE_BATCH_SIZE) -> int:
+    """Remind users of their tasks that went overdue; returns the tasks handled.
+
+    Overdue pending tasks not reminded yet are read in batches through
+    idx_tasks_status_due. Each batch is marked reminded and its notifications
+    (one per assignee per batch, admins for unassigned tasks) are written in the
+    same transaction, so a task is never reminded twice.
+    """
+    if settings.db_backend != "sqlite":
+        return 0
+    return await asyncio.to_thread(_notify_overdue_tasks_sqlite, today or datetime.utcnow().strftime("%Y-%m-%d"), batch_size)
+
+
+def _notify_overdue_tasks_sqlite(today: str, batch_size: int) -> int:
+    handled = 0
+    c = conn()
+    try:
+        admin_ids = [r["id"] for r in c.execute("SELECT id FROM users WHERE role = 'admin' AND active = 1")]
+        while True:
+            c.execute("BEGIN IMMEDIATE")
+            rows = c.execute(
+                """
+                SELECT id, title, assigned_to_user_id
+                FROM tasks
+                WHERE status = 'pending' AND due_date > '' AND due_date < ? AND overdue_notified_at IS NULL
+                ORDER BY due_date
+                LIMIT ?
+                """,
+                (today, batch_size),
+            ).fetchall()
+            if not rows:
+                c.commit()
+                return handled
+
+            by_user: dict = {}
+            for r in rows:
+                for uid in [r["assigned_to_user_id"]] if r["assigned_to_user_id"] else admin_ids:
+                    by_user.setdefault(uid, []).append(r["title"])
+            now = _now_iso()
+            c.executemany(
+                """
+                INSERT INTO notifications (user_id, title, message, type, link, created_at)
+                VALUES (?, 'Tâches en retard', ?, 'warning', '/tasks', ?)
+                """,
+                [(uid, _reminder_message(titles), now) for uid, titles in by_user.items()],
+            )
+            c.executemany("UPDATE tasks SET overdue_notified_at = ? WHERE id = ?", [(now, r["id"]) for r in rows])
+            c.commit()
+            handled += len(rows)
+    except Exception:
+        c.rollback()
+        raise
+    finally:
+        c.close()
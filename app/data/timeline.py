@@ -0,0 +1,179 @@
+import asyncio
+import heapq
+from itertools import islice
+from typing import Any, Dict, List, Optional
+from bson import ObjectId
+
+from app.core.config import settings
+from app.data.catalog import get_catalog
+from app.data.sqlite import conn
+
+# One query per source, all shaped alike: (kind, id, ts, title, detail, actor). Each is
+# served newest-first by a (student_id, ts, id) index, so a page reads at most
+# limit + 1 rows per source whatever the size of the dossier.
+_SOURCES = {
+    "document": """
+        SELECT 'document' AS kind, d.id, d.uploaded_at AS ts, d.doc_type AS title, d.original_filename AS detail,
+               u.full_name AS actor
+        FROM student_documents d
+        LEFT JOIN users u ON u.id = d.uploaded_by_user_id
+        WHERE d.student_id = ? AND {cond}
+        ORDER BY d.uploaded_at DESC, d.id DESC
+        LIMIT ?
+    """,
+    "payment": """
+        SELECT 'payment' AS kind, p.id, p.created_at AS ts, p.payment_type AS title,
+               CAST(p.amount AS TEXT) || ' ' || p.currency AS detail, u.full_name AS actor, p.payment_status AS state
+        FROM payments p
+        LEFT JOIN users u ON u.id = p.created_by_user_id
+        WHERE p.student_id = ? AND {cond}
+        ORDER BY p.created_at DESC, p.id DESC
+        LIMIT ?
+    """,
+    "status": """
+        SELECT 'status' AS kind, h.id, h.changed_at AS ts, st_to.name AS title, st_from.name AS detail,
+               u.full_name AS actor
+        FROM student_status_history h
+        LEFT JOIN statuses st_from ON st_from.id = h.from_status_id
+        LEFT JOIN statuses st_to ON st_to.id = h.to_status_id
+        LEFT JOIN users u ON u.id = h.changed_by_user_id
+        WHERE h.student_id = ? AND {cond}
+        ORDER BY h.changed_at DESC, h.id DESC
+        LIMIT ?
+    """,
+    "task": """
+        SELECT 'task' AS kind, t.id, t.created_at AS ts, t.title, t.due_date AS detail, u.full_name AS actor,
+               t.status AS state
+        FROM tasks t
+        LEFT JOIN users u ON u.id = t.assigned_to_user_id
+        WHERE t.student_id = ? AND {cond}
+        ORDER BY t.created_at DESC, t.id DESC
+        LIMIT ?
+    """,
+}
+
+_TS_COLUMNS = {"document": "d.uploaded_at", "payment": "p.created_at", "status": "h.changed_at", "task": "t.created_at"}
+
+# Mongo has no tasks yet; the other sources are (collection, timestamp field).
+_MONGO_SOURCES = {
+    "document": ("student_documents", "uploaded_at"),
+    "payment": ("payments", "created_at"),
+    "status": ("student_status_history", "changed_at"),
+}
+
+
+def _sort_key(item: Dict[str, Any]) -> tuple:
+    return (item["ts"] or "", item["kind"], item["id"])
+
+
+def encode_cursor(item: Dict[str, Any]) -> str:
+    return f"{item['ts']}|{item['kind']}|{item['id']}"
+
+
+def decode_cursor(value: Optional[str]) -> Optional[tuple[str, str, int]]:
+    if not value:
+        return None
+    try:
+        ts, kind, item_id = value.rsplit("|", 2)
+        return ts, kind, int(item_id)
+    except ValueError:
+        return None
+
+
+def _source_filter(kind: str, before: Optional[tuple[str, str, int]]) -> tuple[str, list]:
+    """Translate the global (ts, kind, id) cursor into a range condition on one source."""
+    col = _TS_COLUMNS[kind]
+    alias = col.split(".")[0]
+    if before is None:
+        return "1=1", []
+    ts, cursor_kind, cursor_id = before
+    if kind < cursor_kind:
+        return f"{col} <= ?", [ts]
+    if kind == cursor_kind:
+        return f"({col}, {alias}.id) < (?, ?)", [ts, cursor_id]
+    return f"{col} < ?", [ts]
+
+
+async def student_timeline(
+    db: Any, student_id: int, *, before: Optional[str] = None, limit: int = 30
+) -> tuple[List[Dict[str, Any]], Optional[str]]:
+    """One page of a student's activity across documents, payments, status changes and tasks.
+
+    Each source is read newest-first up to ``limit + 1`` rows and the streams are
+    combined with a k-way merge. Returns the items and the cursor of the next page,
+    or None when there is nothing older.
+    """
+    if settings.db_backend != "sqlite":
+        return await _student_timeline_mongo(db, student_id, _decode_mongo_cursor(before), limit)
+    return await asyncio.to_thread(_student_timeline_sqlite, student_id, decode_cursor(before), limit)
+
+
+def _student_timeline_sqlite(student_id: int, cursor, limit: int) -> tuple[List[Dict[str, Any]], Optional[str]]:
+    c = conn()
+    try:
+        streams = []
+        for kind, sql in _SOURCES.items():
+            cond, params = _source_filter(kind, cursor)
+            rows = c.execute(sql.format(cond=cond), (student_id, *params, limit + 1)).fetchall()
+            streams.append([dict(r) for r in rows])
+    finally:
+        c.close()
+    return _merge_page(streams, limit)
+
+
+def _decode_mongo_cursor(value: Optional[str]) -> Optional[tuple[str, str, Any]]:
+    if not value:
+        return None
+    try:
+        ts, kind, item_id = value.rsplit("|", 2)
+    except ValueError:
+        return None
+    if ObjectId.is_valid(item_id):
+        return ts, kind, ObjectId(item_id)
+    try:
+        return ts, kind, int(item_id)
+    except ValueError:
+        return None
+
+
+def _mongo_filter(kind: str, field: str, before: Optional[tuple[str, str, Any]]) -> Dict[str, Any]:
+    """Same cursor translation as _source_filter, as a Mongo query."""
+    if before is None:
+        return {}
+    ts, cursor_kind, cursor_id = before
+    if kind < cursor_kind:
+        return {field: {"$lte": ts}}
+    if kind == cursor_kind:
+        return {"$or": [{field: {"$lt": ts}}, {field: ts, "_id": {"$lt": cursor_id}}]}
+    return {field: {"$lt": ts}}
+
+
+async def _student_timeline_mongo(db: Any, student_id: int, cursor, limit: int) -> tuple[List[Dict[str, Any]], Optional[str]]:
+    catalog = await get_catalog(db)
+    streams = []
+    for kind, (collection, field) in _MONGO_SOURCES.items():
+        q = {"student_id": student_id, **_mongo_filter(kind, field, cursor)}
+        cur = db[collection].find(q).sort([(field, -1), ("_id", -1)]).limit(limit + 1)
+        stream = []
+        async for d in cur:
+            item = {"kind": kind, "id": d["_id"], "ts": d.get(field)}
+            if kind == "document":
+                item.update(title=d.get("doc_type"), detail=d.get("original_filename"),
+                            actor=catalog.user_name(d.get("uploaded_by_user_id")))
+            elif kind == "payment":
+                item.update(title=d.get("payment_type"), detail=f"{d.get('amount')} {d.get('currency')}",
+                            actor=catalog.user_name(d.get("created_by_user_id")), state=d.get("payment_status"))
+            else:
+                item.update(title=catalog.status_name(d.get("to_status_id")), detail=catalog.status_name(d.get("from_status_id")),
+                            actor=catalog.user_name(d.get("changed_by_user_id")))
+            stream.append(item)
+        streams.append(stream)
+    return _merge_page(streams, limit)
+
+
+def _merge_page(streams: List[List[Dict[str, Any]]], limit: int) -> tuple[List[Dict[str, Any]], Optional[str]]:
+    items = list(islice(heapq.merge(*streams, key=_sort_key, reverse=True), limit + 1))
+    if len(items) > limit:
+        items = items[:limit]
+        return items, encode_cursor(items[-1])
+    return items, None
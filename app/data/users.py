@@ -1,9 +1,12 @@
 import sqlite3
+from datetime import datetime
 from typing import Any
 
 from bson import ObjectId
 
 from app.core.config import settings
+from app.data.catalog import bump_catalog_version, bump_catalog_version_mongo, get_catalog
+from app.data.events import record_event
 from app.data.sqlite import conn
 from app.security import hash_password
 
@@ -21,7 +24,9 @@ async def count_users(db: Any) -> int:
     return await db.users.count_documents({})
 
 
-async def create_user(db: Any, *, full_name: str, email: str, password: str, role: str) -> str:
+async def create_user(
+    db: Any, *, full_name: str, email: str, password: str, role: str, created_by_user_id: int | None = None
+) -> str:
     email_norm = email.lower().strip()
 
     if settings.db_backend == "sqlite":
@@ -31,6 +36,16 @@ async def create_user(db: Any, *, full_name: str, email: str, password: str, rol
                 "INSERT INTO users(full_name, email, password_hash, role, active) VALUES(?,?,?,?,1)",
                 (full_name.strip(), email_norm, hash_password(password), role),
             )
+            record_event(
+                c,
+                type="user",
+                occurred_at=datetime.utcnow().isoformat(timespec="seconds"),
+                actor_user_id=created_by_user_id,
+                from_val=role,
+                to_val=full_name.strip(),
+                ref_id=cur.lastrowid,
+            )
+            bump_catalog_version(c, "users")
             c.commit()
             return str(cur.lastrowid)
         finally:
@@ -45,6 +60,7 @@ async def create_user(db: Any, *, full_name: str, email: str, password: str, rol
             "active": True,
         }
     )
+    await bump_catalog_version_mongo(db, "users")
     return str(result.inserted_id)
 
 
@@ -106,13 +122,12 @@ async def ensure_bootstrap_admin(db: Any) -> None:
 
 
 async def list_users(db: Any):
-    if settings.db_backend == "sqlite":
-        c = conn()
-        try:
-            cur = c.execute("SELECT id, full_name, email, role, active FROM users WHERE active=1 ORDER BY full_name")
-            return [dict(r) for r in cur.fetchall()]
-        finally:
-            c.close()
+    """Active users by name, from the in-memory catalog (no password hashes)."""
+    return [u for u in (await get_catalog(db)).rows["users"] if u.get("active")]
+
 
-    cursor = db.users.find({"active": True}).sort("full_name", 1)
-    return [u async for u in cursor]
+async def search_users(db: Any, prefix: str, *, limit: int = 10):
+    """Active users with a name or email word starting with ``prefix``, for typeahead pickers."""
+    catalog = await get_catalog(db)
+    active = [u for u in catalog.rows["users"] if u.get("active")]
+    return catalog.search("users", prefix, ("full_name", "email"), limit=limit, rows=active)
@@ -1,5 +1,6 @@
 from motor.motor_asyncio import AsyncIOMotorClient
 from app.core.config import settings
+from app.profiler import MongoCommandProfiler
 
 
 _client: AsyncIOMotorClient | None = None
@@ -15,6 +16,7 @@ def get_client() -> AsyncIOMotorClient:
             socketTimeoutMS=20000,
             retryWrites=True,
             w="majority",
+            event_listeners=[MongoCommandProfiler()] if settings.sql_profiler else [],
         )
     return _client
 
@@ -41,3 +41,15 @@ def require_role(*roles: str):
         return user
 
     return _dep
+
+
+def agent_scope(user: dict):
+    """Id that agent-owned rows must match, or None for roles that see every record."""
+    if user.get("role") != "agent":
+        return None
+    return user.get("id") if "id" in user else str(user.get("_id"))
+
+
+def can_access_student(user: dict, student: dict) -> bool:
+    scope = agent_scope(user)
+    return scope is None or str(student.get("agent_user_id")) == str(scope)
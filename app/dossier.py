@@ -0,0 +1,71 @@
+import asyncio
+import csv
+import io
+import re
+from pathlib import Path
+from typing import Iterator
+
+from app.core.config import settings
+from app.storage import resolve_stored_path
+
+
+# Caps how many archives this worker process streams at once.
+_export_slots: asyncio.Semaphore | None = None
+
+
+def export_slots() -> asyncio.Semaphore:
+    global _export_slots
+    if _export_slots is None:
+        _export_slots = asyncio.Semaphore(settings.max_concurrent_exports)
+    return _export_slots
+
+
+def _clean(name: str) -> str:
+    name = re.sub(r"[\\/:*?\"<>|\x00-\x1f]+", "_", name or "").strip(" .")
+    return name or "fichier"
+
+
+def dossier_filename(student: dict) -> str:
+    return f"dossier_{student.get('id') or student.get('_id')}_{_clean(student.get('full_name') or '')}.zip".replace(" ", "_")
+
+
+def _index_csv(student: dict, rows: list[list]) -> bytes:
+    out = io.StringIO()
+    w = csv.writer(out, delimiter=";")
+    w.writerow(["Étudiant", student.get("full_name"), student.get("email"), student.get("phone")])
+    w.writerow([])
+    w.writerow(["Rubrique", "Fichier", "Type", "Nom d'origine", "Taille (octets)", "SHA-256", "Date", "Etat"])
+    w.writerows(rows)
+    return out.getvalue().encode("utf-8-sig")
+
+
+def dossier_entries(student: dict, documents: list[dict], payments: list[dict]) -> Iterator[tuple[str, bytes | Path]]:
+    """Build the archive layout: index.csv first, then documents/ and recus/."""
+    files: list[tuple[str, Path]] = []
+    rows: list[list] = []
+
+    for d in documents:
+        arcname = f"documents/{d.get('id') or d.get('_id')}_{_clean(d.get('doc_type'))}_{_clean(d.get('original_filename'))}"
+        path = resolve_stored_path(d.get("stored_path"))
+        rows.append([
+            "Document", arcname, d.get("doc_type"), d.get("original_filename"), d.get("size_bytes"),
+            d.get("sha256") or "", d.get("uploaded_at"), "OK" if path else "MANQUANT",
+        ])
+        if path:
+            files.append((arcname, path))
+
+    for p in payments:
+        if not p.get("receipt_stored_path"):
+            continue
+        arcname = f"recus/{p.get('id') or p.get('_id')}_{_clean(p.get('receipt_original_filename') or 'recu')}"
+        path = resolve_stored_path(p.get("receipt_stored_path"))
+        rows.append([
+            "Reçu", arcname, f"{p.get('payment_type')} {p.get('amount')} {p.get('currency')}",
+            p.get("receipt_original_filename"), path.stat().st_size if path else "",
+            p.get("receipt_sha256") or "", p.get("payment_date"), "OK" if path else "MANQUANT",
+        ])
+        if path:
+            files.append((arcname, path))
+
+    yield "index.csv", _index_csv(student, rows)
+    yield from files
@@ -0,0 +1,104 @@
+import csv
+import io
+import re
+from typing import Any, AsyncIterator
+from xml.sax.saxutils import escape
+
+from app.zipstream import ZipStreamWriter
+
+
+# Rows are buffered up to this size before a chunk is sent to the client.
+FLUSH_BYTES = 64 * 1024
+
+Columns = list[tuple[str, str]]  # (row key, header label)
+
+# C0 controls other than tab, LF and CR are not allowed in XML 1.0; Excel rejects the
+# whole workbook over a single one pasted into a note.
+_XML_INVALID = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+async def stream_csv(rows: AsyncIterator[dict], columns: Columns) -> AsyncIterator[bytes]:
+    """Semicolon-separated UTF-8 with BOM, which is what Excel expects in a French locale."""
+    buf = io.StringIO()
+    writer = csv.writer(buf, delimiter=";")
+    writer.writerow([label for _key, label in columns])
+    yield ("\ufeff" + buf.getvalue()).encode("utf-8")
+    buf.seek(0)
+    buf.truncate()
+
+    async for row in rows:
+        writer.writerow(["" if row.get(key) is None else row.get(key) for key, _label in columns])
+        if buf.tell() >= FLUSH_BYTES:
+            yield buf.getvalue().encode("utf-8")
+            buf.seek(0)
+            buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode("utf-8")
+
+
+_CONTENT_TYPES = b"""<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>
+<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>
+</Types>"""
+
+_ROOT_RELS = b"""<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>
+</Relationships>"""
+
+_WORKBOOK_RELS = b"""<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>
+</Relationships>"""
+
+
+def _workbook(sheet_name: str) -> bytes:
+    return (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        f'<sheets><sheet name="{escape(sheet_name[:31])}" sheetId="1" r:id="rId1"/></sheets></workbook>'
+    ).encode("utf-8")
+
+
+def _cell(value: Any) -> str:
+    if value is None or value == "":
+        return "<c/>"
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return f"<c t=\"n\"><v>{value}</v></c>"
+    text = escape(_XML_INVALID.sub("", str(value)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+async def stream_xlsx(rows: AsyncIterator[dict], columns: Columns, sheet_name: str = "Export") -> AsyncIterator[bytes]:
+    """Minimal single-sheet workbook with inline strings, written row by row into a streamed zip."""
+    zw = ZipStreamWriter()
+    yield zw.add("[Content_Types].xml", _CONTENT_TYPES)
+    yield zw.add("_rels/.rels", _ROOT_RELS)
+    yield zw.add("xl/workbook.xml", _workbook(sheet_name))
+    yield zw.add("xl/_rels/workbook.xml.rels", _WORKBOOK_RELS)
+
+    yield zw.open_entry("xl/worksheets/sheet1.xml")
+    header = "".join(_cell(label) for _key, label in columns)
+    parts = [
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+        f"<row>{header}</row>"
+    ]
+    size = 0
+    async for row in rows:
+        xml = "<row>" + "".join(_cell(row.get(key)) for key, _label in columns) + "</row>"
+        parts.append(xml)
+        size += len(xml)
+        if size >= FLUSH_BYTES:
+            data = zw.write("".join(parts).encode("utf-8"))
+            parts.clear()
+            size = 0
+            if data:
+                yield data
+    parts.append("</sheetData></worksheet>")
+    yield zw.write("".join(parts).encode("utf-8"))
+    yield zw.close()
@@ -0,0 +1,61 @@
+import os
+import threading
+from pathlib import Path
+from typing import Callable
+
+
+class DirectoryCache:
+    """A directory of derived files kept under a size budget.
+
+    A file's mtime doubles as its LRU clock: ``touch`` it when it is served and
+    report each new file to ``added``. When the running total goes over the
+    budget, the least recently served files are evicted down to 90% of it.
+    """
+
+    def __init__(self, root: Path, max_bytes: Callable[[], int]) -> None:
+        self.root = root
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._bytes: int | None = None
+
+    def touch(self, path: Path) -> None:
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def _entries(self) -> list[tuple[float, int, str]]:
+        entries = []
+        for root, _dirs, files in os.walk(self.root):
+            for name in files:
+                p = os.path.join(root, name)
+                try:
+                    st = os.stat(p)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, p))
+        return entries
+
+    def added(self, size: int) -> None:
+        limit = self._max_bytes()
+        with self._lock:
+            if self._bytes is None:
+                # first write of this process: the total already includes the new file
+                self._bytes = sum(e[1] for e in self._entries())
+            else:
+                self._bytes += size
+            if self._bytes <= limit:
+                return
+
+            entries = sorted(self._entries())
+            total = sum(e[1] for e in entries)
+            target = int(limit * 0.9)
+            for _mtime, file_size, p in entries:
+                if total <= target:
+                    break
+                try:
+                    os.unlink(p)
+                    total -= file_size
+                except OSError:
+                    pass
+            self._bytes = total
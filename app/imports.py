@@ -0,0 +1,416 @@
+import asyncio
+import csv
+import io
+import os
+import re
+import time
+import unicodedata
+import uuid
+import zipfile
+from datetime import datetime
+from itertools import islice
+from pathlib import Path
+from typing import Any, Iterator
+from xml.etree import ElementTree as ET
+
+from app.data.contacts import email_key, phone_key
+from app.data.import_jobs import get_import_job_row, prune_import_jobs, save_import_job
+from app.data.prospects import bulk_create_prospects, list_prospect_contacts
+from app.data.statuses import list_statuses
+from app.data.students import bulk_create_students, list_student_contacts
+from app.data.users import list_users
+from app.storage import UPLOADS_DIR
+
+
+# Rows validated and inserted per transaction.
+CHUNK_SIZE = 500
+# Only the first errors are kept for the report; the total is always counted.
+MAX_REPORTED_ERRORS = 500
+# Finished jobs kept for their report page.
+MAX_KEPT_JOBS = 50
+# A running job saves its progress after every chunk; one silent for this long lost
+# its worker (restart, crash) and is reported as interrupted.
+STALE_AFTER_SECONDS = 300
+
+# Uploaded files wait here between the dry run and the real import, where every
+# worker can reach them.
+IMPORTS_DIR = UPLOADS_DIR / ".imports"
+
+IMPORT_KINDS = ("students", "prospects")
+
+_XLSX_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+_EMAIL_RE = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+
+# Normalised header -> field. Accepts the labels of our own CSV/XLSX exports.
+_COMMON_ALIASES = {
+    "nom": "full_name", "nomcomplet": "full_name", "fullname": "full_name", "name": "full_name",
+    "etudiant": "full_name", "candidat": "full_name", "prospect": "full_name",
+    "telephone": "phone", "tel": "phone", "phone": "phone", "mobile": "phone", "whatsapp": "phone",
+    "email": "email", "mail": "email", "courriel": "email", "adresseemail": "email",
+    "agent": "agent", "agentassigne": "agent", "conseiller": "agent",
+    "notes": "notes", "note": "notes", "observations": "notes", "commentaire": "notes",
+}
+FIELD_ALIASES = {
+    "students": {
+        **_COMMON_ALIASES,
+        "pays": "country", "country": "country", "destination": "country",
+        "niveau": "study_level", "niveaudetudes": "study_level", "studylevel": "study_level",
+        "programme": "program_choice", "filiere": "program_choice", "formation": "program_choice", "programchoice": "program_choice",
+        "universite": "university", "ecole": "university", "etablissement": "university", "university": "university",
+        "statut": "status", "status": "status",
+        "totalcontrat": "total_amount", "montant": "total_amount", "total": "total_amount", "totalamount": "total_amount",
+        "devise": "currency", "currency": "currency",
+    },
+    "prospects": {
+        **_COMMON_ALIASES,
+        "paysvise": "country_interest", "pays": "country_interest", "country": "country_interest",
+        "countryinterest": "country_interest", "destination": "country_interest",
+        "source": "source", "origine": "source", "canal": "source",
+    },
+}
+REQUIRED_FIELDS = {"full_name": "Nom", "phone": "Téléphone"}
+
+# Job state lives in import_jobs so any worker can report on it; this only keeps
+# references to the tasks running in this one.
+_tasks: set = set()
+
+
+def _norm_header(value: str) -> str:
+    text = unicodedata.normalize("NFKD", value or "").encode("ascii", "ignore").decode("ascii")
+    return re.sub(r"[^a-z0-9]", "", text.lower())
+
+
+class _CountingReader(io.RawIOBase):
+    """Pass-through reader that records how many bytes were consumed, for progress."""
+
+    def __init__(self, raw) -> None:
+        self._raw = raw
+        self.count = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        data = self._raw.read(len(b))
+        n = len(data)
+        b[:n] = data
+        self.count += n
+        return n
+
+    def close(self) -> None:
+        self._raw.close()
+        super().close()
+
+
+def _iter_csv(path: Path, counter: list) -> Iterator[list[str]]:
+    with open(path, "rb") as probe:
+        head = probe.read(64 * 1024)
+    try:
+        head.decode("utf-8")
+        encoding = "utf-8-sig"
+    except UnicodeDecodeError:
+        # Excel in a French locale saves "CSV (séparateur: point-virgule)" as cp1252.
+        encoding = "cp1252"
+    sample = head.decode(encoding, errors="ignore")
+    try:
+        dialect = csv.Sniffer().sniff(sample.split("\n", 1)[0], delimiters=";,\t")
+        delimiter = dialect.delimiter
+    except csv.Error:
+        delimiter = ";"
+
+    reader = _CountingReader(open(path, "rb"))
+    counter.append(reader)
+    with io.TextIOWrapper(io.BufferedReader(reader), encoding=encoding, newline="") as f:
+        yield from csv.reader(f, delimiter=delimiter)
+
+
+def _xlsx_sheet_path(zf: zipfile.ZipFile) -> str:
+    try:
+        wb = ET.fromstring(zf.read("xl/workbook.xml"))
+        sheet = wb.find(f"{_XLSX_NS}sheets/{_XLSX_NS}sheet")
+        rid = sheet.get("{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id")
+        rels = ET.fromstring(zf.read("xl/_rels/workbook.xml.rels"))
+        for rel in rels:
+            if rel.get("Id") == rid:
+                target = rel.get("Target").lstrip("/")
+                return target if target.startswith("xl/") else f"xl/{target}"
+    except (KeyError, AttributeError, ET.ParseError):
+        pass
+    return "xl/worksheets/sheet1.xml"
+
+
+def _col_index(ref: str) -> int:
+    n = 0
+    for ch in ref:
+        if not ch.isalpha():
+            break
+        n = n * 26 + (ord(ch.upper()) - 64)
+    return n - 1
+
+
+def _iter_xlsx(path: Path, counter: list) -> Iterator[list[str]]:
+    """Rows of the first sheet, parsed incrementally so only one row is held at a time."""
+    with zipfile.ZipFile(path) as zf:
+        shared: list[str] = []
+        if "xl/sharedStrings.xml" in zf.namelist():
+            with zf.open("xl/sharedStrings.xml") as f:
+                for _ev, el in ET.iterparse(f):
+                    if el.tag == f"{_XLSX_NS}si":
+                        shared.append("".join(t.text or "" for t in el.iter(f"{_XLSX_NS}t")))
+                        el.clear()
+
+        reader = _CountingReader(zf.open(_xlsx_sheet_path(zf)))
+        counter.append(reader)
+        with reader:
+            for _ev, el in ET.iterparse(reader):
+                if el.tag != f"{_XLSX_NS}row":
+                    continue
+                cells: dict[int, str] = {}
+                for cell in el.iter(f"{_XLSX_NS}c"):
+                    ref = cell.get("r")
+                    col = _col_index(ref) if ref else len(cells)
+                    kind = cell.get("t")
+                    if kind == "inlineStr":
+                        value = "".join(t.text or "" for t in cell.iter(f"{_XLSX_NS}t"))
+                    else:
+                        v = cell.find(f"{_XLSX_NS}v")
+                        value = v.text or "" if v is not None else ""
+                        if kind == "s" and value:
+                            value = shared[int(value)]
+                        elif kind in (None, "n") and value.endswith(".0"):
+                            # Phone numbers typed into Excel come back as floats.
+                            value = value[:-2]
+                    cells[col] = value
+                el.clear()
+                yield [cells.get(i, "") for i in range(max(cells) + 1)] if cells else []
+
+
+def _total_size(path: Path, filename: str) -> int:
+    if filename.lower().endswith(".xlsx"):
+        with zipfile.ZipFile(path) as zf:
+            return zf.getinfo(_xlsx_sheet_path(zf)).file_size
+    return path.stat().st_size
+
+
+def _iter_table(path: Path, filename: str, counter: list) -> Iterator[list[str]]:
+    if filename.lower().endswith(".xlsx"):
+        return _iter_xlsx(path, counter)
+    return _iter_csv(path, counter)
+
+
+def _take(rows: Iterator, n: int) -> list:
+    return list(islice(rows, n))
+
+
+def _public(job: dict) -> dict:
+    return {k: v for k, v in job.items() if k not in ("path", "user", "updated_at")}
+
+
+async def get_import_job(db: Any, job_id: str) -> dict | None:
+    job = await get_import_job_row(db, job_id)
+    if not job:
+        return None
+    if job["status"] == "running" and job["updated_at"] < time.time() - STALE_AFTER_SECONDS:
+        job["status"] = "failed"
+        job["message"] = "Import interrompu: le serveur a redémarré, veuillez relancer l'import"
+        job["finished_at"] = datetime.utcnow().isoformat(timespec="seconds")
+        await save_import_job(db, job)
+    return _public(job)
+
+
+def _unlink(path: str) -> None:
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+async def start_import(db: Any, *, kind: str, path: str, filename: str, user: dict, dry_run: bool) -> str:
+    """Register a job and run it in the background; returns its id for the progress page."""
+    for old_path in await prune_import_jobs(db, MAX_KEPT_JOBS):
+        _unlink(old_path)
+    job_id = uuid.uuid4().hex
+    job = {
+        "id": job_id,
+        "kind": kind,
+        "filename": filename,
+        "dry_run": dry_run,
+        "status": "running",
+        "progress": 0.0,
+        "rows": 0,
+        "valid": 0,
+        "inserted": 0,
+        "duplicates": 0,
+        "error_count": 0,
+        "errors": [],
+        "message": None,
+        "owner_id": user.get("id") or str(user.get("_id")),
+        "started_at": datetime.utcnow().isoformat(timespec="seconds"),
+        "finished_at": None,
+        "path": path,
+        "user": user,
+    }
+    await save_import_job(db, job)
+    task = asyncio.create_task(_run_import(db, job))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return job_id
+
+
+async def run_dry_run_import(db: Any, job_id: str, user: dict) -> str | None:
+    """Start the real import of a dry-run job's file; None once that file has been cleaned up."""
+    job = await get_import_job_row(db, job_id)
+    if not job or not os.path.exists(job["path"]):
+        return None
+    return await start_import(db, kind=job["kind"], path=job["path"], filename=job["filename"], user=user, dry_run=False)
+
+
+def _error(job: dict, line: int, message: str) -> None:
+    job["error_count"] += 1
+    if len(job["errors"]) < MAX_REPORTED_ERRORS:
+        job["errors"].append({"line": line, "message": message})
+
+
+async def _run_import(db: Any, job: dict) -> None:
+    path = Path(job["path"])
+    try:
+        await _process(db, job, path)
+        job["status"] = "done"
+        job["progress"] = 1.0
+    except Exception as exc:
+        job["status"] = "failed"
+        job["message"] = job["message"] or f"Import interrompu: {exc}"
+    finally:
+        job["finished_at"] = datetime.utcnow().isoformat(timespec="seconds")
+        if not job["dry_run"]:
+            _unlink(str(path))
+        await save_import_job(db, job)
+
+
+async def _process(db: Any, job: dict, path: Path) -> None:
+    kind, user = job["kind"], job["user"]
+    aliases = FIELD_ALIASES[kind]
+
+    counter: list = []
+    total_size = await asyncio.to_thread(_total_size, path, job["filename"]) or 1
+    rows = _iter_table(path, job["filename"], counter)
+
+    header = await asyncio.to_thread(next, rows, None)
+    columns = {i: aliases.get(_norm_header(h)) for i, h in enumerate(header or [])}
+    missing = [label for f, label in REQUIRED_FIELDS.items() if f not in columns.values()]
+    if missing:
+        job["message"] = "Colonnes obligatoires manquantes: " + ", ".join(missing)
+        raise ValueError(job["message"])
+
+    statuses = {s["name"].strip().lower(): s["id"] for s in await list_statuses(db)}
+    users = await list_users(db)
+    users_by_key = {}
+    for u in users:
+        users_by_key[(u.get("full_name") or "").strip().lower()] = u
+        users_by_key[(u.get("email") or "").strip().lower()] = u
+
+    contacts = await (list_student_contacts(db) if kind == "students" else list_prospect_contacts(db))
+    seen_phones = {p for p, _e in contacts if p}
+    seen_emails = {e for _p, e in contacts if e}
+
+    line = 1
+    while True:
+        chunk = await asyncio.to_thread(_take, rows, CHUNK_SIZE)
+        if not chunk:
+            break
+        valid = []
+        for cells in chunk:
+            line += 1
+            if not any((c or "").strip() for c in cells):
+                continue
+            job["rows"] += 1
+            raw = {}
+            for i, value in enumerate(cells):
+                field = columns.get(i)
+                if field and field not in raw:
+                    raw[field] = (value or "").strip()
+            record = _validate(job, kind, line, raw, user, statuses, users_by_key)
+            if record is None:
+                continue
+
+            phone, email = phone_key(record["phone"]), email_key(record.get("email"))
+            if phone in seen_phones or (email and email in seen_emails):
+                job["duplicates"] += 1
+                _error(job, line, "Doublon: téléphone ou email déjà connu")
+                continue
+            seen_phones.add(phone)
+            if email:
+                seen_emails.add(email)
+            valid.append(record)
+
+        job["valid"] += len(valid)
+        if valid and not job["dry_run"]:
+            if kind == "students":
+                ids = await bulk_create_students(db, valid, changed_by_user_id=user.get("id"))
+                job["inserted"] += len(ids)
+            else:
+                job["inserted"] += await bulk_create_prospects(db, valid, created_by_user_id=user.get("id"))
+        if counter:
+            job["progress"] = min(counter[0].count / total_size, 0.99)
+        await save_import_job(db, job)
+
+
+def _validate(job: dict, kind: str, line: int, raw: dict, user: dict, statuses: dict, users_by_key: dict) -> dict | None:
+    problems = []
+    full_name = raw.get("full_name", "")
+    phone = raw.get("phone", "")
+    email = email_key(raw.get("email")) or ""
+    if not full_name:
+        problems.append("nom manquant")
+    if len(phone_key(phone) or "") < 6:
+        problems.append("téléphone invalide")
+    if email and not _EMAIL_RE.match(email):
+        problems.append("email invalide")
+
+    agent = None
+    if user.get("role") == "agent":
+        agent = user
+    elif raw.get("agent"):
+        agent = users_by_key.get(raw["agent"].lower())
+        if agent is None:
+            problems.append(f"agent inconnu « {raw['agent']} »")
+    elif kind == "students":
+        agent = user
+
+    record: dict = {"full_name": full_name, "phone": phone, "email": email, "notes": raw.get("notes") or ""}
+    if agent is not None:
+        record["agent_name"] = agent.get("full_name") or ""
+        record["agent_user_id"] = agent.get("id") or str(agent.get("_id"))
+
+    if kind == "students":
+        status_id = None
+        if raw.get("status"):
+            status_id = statuses.get(raw["status"].lower())
+            if status_id is None:
+                problems.append(f"statut inconnu « {raw['status']} »")
+        total_amount = 0
+        if raw.get("total_amount"):
+            try:
+                total_amount = int(float(raw["total_amount"].replace(" ", "").replace(",", ".")))
+            except ValueError:
+                problems.append("montant invalide")
+        record.update(
+            country=raw.get("country") or "Inconnu",
+            study_level=raw.get("study_level") or "À préciser",
+            program_choice=raw.get("program_choice") or "À préciser",
+            university=raw.get("university") or "À préciser",
+            status_id=status_id,
+            total_amount=total_amount,
+            currency=raw.get("currency") or "FCFA",
+        )
+    else:
+        record.update(
+            email=email or None,
+            country_interest=raw.get("country_interest") or None,
+            source=raw.get("source") or "Import",
+        )
+
+    if problems:
+        _error(job, line, ", ".join(problems))
+        return None
+    return record
@@ -1,11 +1,25 @@
+import logging
+
 from fastapi import FastAPI, HTTPException, Request
+from fastapi.exception_handlers import http_exception_handler
 from fastapi.responses import RedirectResponse
 from starlette.middleware.sessions import SessionMiddleware
 from app.routes import auth, students, payments, prospects, reports, admin, logs, pages
 from app.core.config import settings
+from app.data.catalog import get_catalog
+from app.data.contacts import backfill_mongo_contact_keys
+from app.data.ledger import backfill_mongo_ledger
+from app.data.students import backfill_agent_user_ids
 from app.data.users import ensure_bootstrap_admin
 from app.data.sqlite import init_sqlite
 from app.db import close_client, get_db, ping_mongo
+from app.metrics import MetricsMiddleware
+from app.profiler import SQLProfilerMiddleware
+from app.pdf import purge_pdf_cache, shutdown_pdf_pool
+from app.scheduler import start_scheduler, stop_scheduler
+from app.storage import purge_expired_upload_sessions
+
+log = logging.getLogger(__name__)
 
 
 def create_app() -> FastAPI:
@@ -15,11 +29,13 @@ def create_app() -> FastAPI:
     async def auth_exception_handler(request: Request, exc: HTTPException):
         if exc.status_code == 401:
             return RedirectResponse(url="/login", status_code=303)
-        raise exc
+        return await http_exception_handler(request, exc)
 
     @app.on_event("startup")
     async def _startup():
         init_sqlite()
+        purge_expired_upload_sessions()
+        purge_pdf_cache()
         db = get_db()
         # Skip ping for Atlas M0 free tier (ReplicaSetNoPrimary on startup)
         # if settings.db_backend != "sqlite":
@@ -28,9 +44,21 @@ def create_app() -> FastAPI:
             await ensure_bootstrap_admin(db)
         except Exception:
             pass
+        if settings.db_backend != "sqlite":
+            # SQLite rows are migrated by init_sqlite.
+            try:
+                await backfill_agent_user_ids(db)
+                await backfill_mongo_contact_keys(db)
+                await backfill_mongo_ledger(db)
+            except Exception:
+                log.exception("could not backfill student agent ids, contact keys and ledger totals")
+        await get_catalog(db)
+        start_scheduler(db)
 
     @app.on_event("shutdown")
     async def _shutdown():
+        await stop_scheduler()
+        shutdown_pdf_pool()
         if settings.db_backend != "sqlite":
             close_client()
 
@@ -40,8 +68,11 @@ def create_app() -> FastAPI:
         https_only=settings.cookie_https_only,
         same_site="lax",
     )
+    app.add_middleware(SQLProfilerMiddleware)
+    # Added last so it wraps everything else and times the whole request.
+    app.add_middleware(MetricsMiddleware)
 
-    from app.routes import auth, pages, students, payments, prospects, logs, reports, admin, tasks, partners, activity, accounting, notifications
+    from app.routes import auth, pages, students, payments, prospects, logs, reports, admin, tasks, partners, activity, accounting, notifications, exports, imports, lookup
 
     from fastapi.staticfiles import StaticFiles
     import os
@@ -64,6 +95,9 @@ def create_app() -> FastAPI:
     app.include_router(activity.router)
     app.include_router(accounting.router)
     app.include_router(notifications.router)
+    app.include_router(exports.router)
+    app.include_router(imports.router)
+    app.include_router(lookup.router)
 
     return app
 
@@ -0,0 +1,165 @@
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Tuple
+
+# In-process metrics in the Prometheus text format, without a client library or
+# an external collector: each worker exposes its own series on /metrics.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict[str, str]) -> Labels:
+    return tuple(sorted(labels.items()))
+
+
+def _fmt_labels(labels: Labels, extra: Iterable[Tuple[str, str]] = ()) -> str:
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _k, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _v), v in zip(pairs, escaped)) + "}"
+
+
+def _fmt_value(v: float) -> str:
+    return str(int(v)) if float(v).is_integer() else repr(float(v))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str) -> None:
+        self.name = name
+        self.help = help
+        self._lock = threading.Lock()
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}", *self._samples()]
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str) -> None:
+        super().__init__(name, help)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = _labels(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            return [f"{self.name}{_fmt_labels(k)} {_fmt_value(v)}" for k, v in sorted(self._values.items())]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        super().__init__(name, help)
+        self.buckets = buckets
+        # per label set: [count per bucket (non-cumulative, +Inf last), sum]
+        self._series: Dict[Labels, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = _labels(labels)
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._series.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[i] += 1
+            total[0] += value
+
+    def _samples(self) -> List[str]:
+        lines = []
+        with self._lock:
+            for key, (counts, total) in sorted(self._series.items()):
+                running = 0
+                for bound, n in zip((*self.buckets, float("inf")), counts):
+                    running += n
+                    le = "+Inf" if bound == float("inf") else _fmt_value(bound)
+                    lines.append(f"{self.name}_bucket{_fmt_labels(key, [('le', le)])} {running}")
+                lines.append(f"{self.name}_sum{_fmt_labels(key)} {_fmt_value(total[0])}")
+                lines.append(f"{self.name}_count{_fmt_labels(key)} {running}")
+        return lines
+
+
+http_requests = Counter("http_requests_total", "HTTP responses by route template, method and status code.")
+http_errors = Counter("http_request_errors_total", "Requests that raised or answered with a 5xx status.")
+http_latency = Histogram("http_request_duration_seconds", "Time to the end of the response, per route template.")
+http_in_flight = Gauge("http_requests_in_progress", "Requests being handled right now.")
+db_latency = Histogram("db_connection_duration_seconds", "SQLite connection lifetime per data-layer function.")
+
+REGISTRY: List[_Metric] = [http_requests, http_errors, http_latency, http_in_flight, db_latency]
+STARTED_AT = time.time()
+
+
+def render_metrics() -> str:
+    lines = [
+        "# HELP process_start_time_seconds Start time of this worker since the epoch.",
+        "# TYPE process_start_time_seconds gauge",
+        f"process_start_time_seconds {STARTED_AT:.3f}",
+    ]
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def _route_label(scope) -> str:
+    # The route template ("/students/{student_id}"), never the raw path, so ids do not
+    # turn into one series each.
+    route = scope.get("route")
+    if route is not None and getattr(route, "path", None):
+        return route.path
+    if scope.get("path", "").startswith("/static/"):
+        return "/static"
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, status codes, errors and concurrency per route."""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = {"code": 500}
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        http_in_flight.inc(method=method)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception:
+            status["code"] = 500
+            raise
+        finally:
+            http_in_flight.dec(method=method)
+            route = _route_label(scope)
+            code = status["code"]
+            http_latency.observe(time.perf_counter() - start, method=method, route=route)
+            http_requests.inc(method=method, route=route, status=str(code))
+            if code >= 500:
+                http_errors.inc(method=method, route=route)
@@ -0,0 +1,234 @@
+import asyncio
+import hashlib
+import io
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.lib.units import mm
+from reportlab.platypus import Image, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+from app.core.config import settings
+from app.filecache import DirectoryCache
+from app.storage import UPLOADS_DIR
+
+
+PDF_CACHE_DIR = UPLOADS_DIR / ".pdf_cache"
+LOGO_PATH = Path(__file__).resolve().parent / "static" / "img" / "logoafcalintravel.png"
+
+COMPANY_NAME = "AFCALINK TRAVEL"
+
+_pool: ProcessPoolExecutor | None = None
+# One render task per cache key, shared by concurrent downloads and never tied to
+# the request that started it.
+_inflight: dict[str, asyncio.Task] = {}
+# Every data change yields a new key, so without a budget the cache of a long-lived
+# worker only grows; the age-based purge at startup is not enough on its own.
+_cache = DirectoryCache(PDF_CACHE_DIR, lambda: settings.pdf_cache_max_mb * 1024 * 1024)
+
+
+def _fmt_amount(value) -> str:
+    return f"{int(value or 0):,}".replace(",", " ")
+
+
+def _header(title: str, subtitle: str) -> list:
+    styles = getSampleStyleSheet()
+    flow = []
+    if LOGO_PATH.exists():
+        flow.append(Image(str(LOGO_PATH), width=40 * mm, height=16 * mm, kind="proportional", hAlign="LEFT"))
+        flow.append(Spacer(1, 4 * mm))
+    flow.append(Paragraph(title, styles["Title"]))
+    flow.append(Paragraph(subtitle, styles["Normal"]))
+    flow.append(Spacer(1, 6 * mm))
+    return flow
+
+
+def _table(rows: list[list], widths: list[float]) -> Table:
+    t = Table(rows, colWidths=widths, repeatRows=1)
+    t.setStyle(
+        TableStyle(
+            [
+                ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#1e293b")),
+                ("TEXTCOLOR", (0, 0), (-1, 0), colors.white),
+                ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+                ("FONTSIZE", (0, 0), (-1, -1), 8),
+                ("ROWBACKGROUNDS", (0, 1), (-1, -1), [colors.white, colors.HexColor("#f1f5f9")]),
+                ("GRID", (0, 0), (-1, -1), 0.25, colors.HexColor("#cbd5e1")),
+                ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+            ]
+        )
+    )
+    return t
+
+
+def render_daily_report(report: dict) -> bytes:
+    styles = getSampleStyleSheet()
+    buf = io.BytesIO()
+    doc = SimpleDocTemplate(buf, pagesize=A4, leftMargin=15 * mm, rightMargin=15 * mm, topMargin=15 * mm, bottomMargin=15 * mm)
+    width = A4[0] - 30 * mm
+
+    flow = _header("Rapport d'Activité", f"Bilan des opérations du {report.get('date')}")
+    flow.append(
+        _table(
+            [
+                ["Nouveaux étudiants", "Recettes encaissées", "Changements de statut"],
+                [len(report.get("students") or []), _fmt_amount(report.get("total_received")), len(report.get("status_changes") or [])],
+            ],
+            [width / 3] * 3,
+        )
+    )
+
+    flow += [Spacer(1, 6 * mm), Paragraph("Nouveaux étudiants", styles["Heading2"])]
+    rows = [["Nom", "Email", "Pays", "Agent"]]
+    rows += [[s.get("full_name"), s.get("email"), s.get("country"), s.get("agent_name")] for s in report.get("students") or []]
+    flow.append(_table(rows, [width * 0.3, width * 0.3, width * 0.15, width * 0.25]))
+
+    flow += [Spacer(1, 6 * mm), Paragraph("Paiements encaissés", styles["Heading2"])]
+    rows = [["Étudiant", "Type", "Mode", "Montant"]]
+    rows += [
+        [p.get("student_name"), p.get("payment_type"), p.get("payment_mode"), f"{_fmt_amount(p.get('amount'))} {p.get('currency')}"]
+        for p in report.get("payments") or []
+    ]
+    flow.append(_table(rows, [width * 0.35, width * 0.25, width * 0.15, width * 0.25]))
+
+    flow += [Spacer(1, 6 * mm), Paragraph("Changements de statut", styles["Heading2"])]
+    rows = [["Heure", "Étudiant", "Ancien statut", "Nouveau statut"]]
+    rows += [
+        [(h.get("changed_at") or "")[11:16], h.get("student_name"), h.get("from_name") or "N/A", h.get("to_name")]
+        for h in report.get("status_changes") or []
+    ]
+    flow.append(_table(rows, [width * 0.1, width * 0.4, width * 0.25, width * 0.25]))
+
+    doc.build(flow)
+    return buf.getvalue()
+
+
+def render_payment_receipt(data: dict) -> bytes:
+    payment = data["payment"]
+    student = data["student"]
+    styles = getSampleStyleSheet()
+    buf = io.BytesIO()
+    doc = SimpleDocTemplate(buf, pagesize=A4, leftMargin=20 * mm, rightMargin=20 * mm, topMargin=20 * mm, bottomMargin=20 * mm)
+    width = A4[0] - 40 * mm
+
+    number = f"REC-{(payment.get('payment_date') or '')[:4]}-{str(payment.get('id') or 0).zfill(6)}"
+    flow = _header("Reçu de paiement", f"{COMPANY_NAME} — N° {number}")
+    flow.append(
+        _table(
+            [
+                ["Étudiant", student.get("full_name") or ""],
+                ["Email / Téléphone", f"{student.get('email') or ''} / {student.get('phone') or ''}"],
+                ["Objet", payment.get("payment_type") or ""],
+                ["Montant", f"{_fmt_amount(payment.get('amount'))} {payment.get('currency') or ''}"],
+                ["Mode de règlement", payment.get("payment_mode") or ""],
+                ["Date du paiement", payment.get("payment_date") or ""],
+                ["Total du contrat", f"{_fmt_amount(student.get('total_amount'))} {student.get('currency') or ''}"],
+            ],
+            [width * 0.35, width * 0.65],
+        )
+    )
+    flow.append(Spacer(1, 8 * mm))
+    if payment.get("payment_status") == "received":
+        flow.append(Paragraph("Paiement validé par la comptabilité.", styles["Normal"]))
+    else:
+        flow.append(Paragraph("<b>EN ATTENTE DE VALIDATION</b> — ce reçu n'a pas de valeur comptable.", styles["Normal"]))
+    flow.append(Spacer(1, 20 * mm))
+    flow.append(Paragraph("Cachet et signature", styles["Normal"]))
+
+    doc.build(flow)
+    return buf.getvalue()
+
+
+_RENDERERS = {
+    "daily_report": render_daily_report,
+    "payment_receipt": render_payment_receipt,
+}
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=settings.pdf_workers)
+    return _pool
+
+
+def shutdown_pdf_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _cache_key(kind: str, data: dict) -> str:
+    # The key covers the full input, so any change to the underlying rows yields a new version.
+    payload = json.dumps(data, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(f"{kind}\n{payload}".encode("utf-8")).hexdigest()
+
+
+def _write_atomic(path: Path, content: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    tmp.write_bytes(content)
+    os.replace(tmp, path)
+
+
+def _read_cached(path: Path) -> bytes | None:
+    try:
+        content = path.read_bytes()
+    except OSError:
+        return None
+    _cache.touch(path)
+    return content
+
+
+async def render_pdf(kind: str, data: dict) -> tuple[bytes, str]:
+    """Render ``data`` with the ``kind`` template in the process pool, reusing a cached copy when unchanged.
+
+    Returns the PDF and its cache key (usable as an ETag). The bytes are returned
+    rather than the cached path, which a concurrent write may already have evicted.
+    """
+    key = _cache_key(kind, data)
+    path = PDF_CACHE_DIR / key[:2] / f"{kind}-{key}.pdf"
+    content = await asyncio.to_thread(_read_cached, path)
+    if content is not None:
+        return content, key
+
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.create_task(_render_to_cache(kind, data, path))
+        _inflight[key] = task
+        task.add_done_callback(lambda _t: _inflight.pop(key, None))
+    return await asyncio.shield(task), key
+
+
+async def _render_to_cache(kind: str, data: dict, path: Path) -> bytes:
+    content = await asyncio.get_running_loop().run_in_executor(_get_pool(), _RENDERERS[kind], data)
+    await asyncio.to_thread(_store, path, content)
+    return content
+
+
+def _store(path: Path, content: bytes) -> None:
+    _write_atomic(path, content)
+    _cache.added(len(content))
+
+
+def purge_pdf_cache(max_age_days: int = 30) -> int:
+    if not PDF_CACHE_DIR.exists():
+        return 0
+    cutoff = time.time() - max_age_days * 86400
+    removed = 0
+    for root, _dirs, files in os.walk(PDF_CACHE_DIR):
+        for name in files:
+            p = os.path.join(root, name)
+            try:
+                if os.stat(p).st_mtime < cutoff:
+                    os.unlink(p)
+                    removed += 1
+            except OSError:
+                pass
+    return removed
@@ -0,0 +1,129 @@
+import logging
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+from pymongo import monitoring
+
+from app.core.config import settings
+
+log = logging.getLogger(__name__)
+
+# The same statement run this many times in one request is reported as a likely N+1.
+N_PLUS_ONE_MIN_REPEATS = 5
+SLOWEST_KEPT = 5
+# Profiles kept in memory for the admin panel, newest first.
+RECENT_KEPT = 100
+_SKIPPED_PREFIXES = ("/static/", "/metrics")
+
+
+class RequestProfile:
+    """Statements run while handling one request, with their durations in milliseconds."""
+
+    def __init__(self, method: str, path: str) -> None:
+        self.method = method
+        self.path = path
+        self.started_at = time.time()
+        self.status = 0
+        self.duration_ms = 0.0
+        self.queries: List[tuple[str, float]] = []
+        self._lock = threading.Lock()
+
+    def record(self, statement: str, ms: float) -> None:
+        # Data functions may run in worker threads (concurrent page sections).
+        with self._lock:
+            self.queries.append((" ".join(statement.split()), ms))
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            queries = list(self.queries)
+        repeats = Counter(sql for sql, _ms in queries)
+        return {
+            "method": self.method,
+            "path": self.path,
+            "status": self.status,
+            "started_at": self.started_at,
+            "duration_ms": self.duration_ms,
+            "query_count": len(queries),
+            "db_ms": sum(ms for _sql, ms in queries),
+            "slowest": sorted(queries, key=lambda q: q[1], reverse=True)[:SLOWEST_KEPT],
+            "repeated": [(sql, n) for sql, n in repeats.most_common() if n >= N_PLUS_ONE_MIN_REPEATS],
+        }
+
+
+current_profile: ContextVar[Optional[RequestProfile]] = ContextVar("current_profile", default=None)
+recent_profiles: deque = deque(maxlen=RECENT_KEPT)
+
+
+def record_query(statement: str, ms: float) -> None:
+    profile = current_profile.get()
+    if profile is not None:
+        profile.record(statement, ms)
+
+
+class MongoCommandProfiler(monitoring.CommandListener):
+    """Feeds Motor commands into the profile of the request that issued them.
+
+    Motor copies the caller's context into its executor threads, so the context
+    variable set by the middleware is visible here.
+    """
+
+    def __init__(self) -> None:
+        self._started: Dict[tuple, str] = {}
+
+    def started(self, event) -> None:
+        if current_profile.get() is not None:
+            target = event.command.get(event.command_name)
+            label = f"{event.command_name} {target}" if isinstance(target, str) else event.command_name
+            self._started[(event.connection_id, event.request_id)] = label
+
+    def _finish(self, event) -> None:
+        label = self._started.pop((event.connection_id, event.request_id), None)
+        if label is not None:
+            record_query(label, event.duration_micros / 1000)
+
+    def succeeded(self, event) -> None:
+        self._finish(event)
+
+    def failed(self, event) -> None:
+        self._finish(event)
+
+
+class SQLProfilerMiddleware:
+    """ASGI middleware collecting the queries of each request when SQL_PROFILER is on.
+
+    Every profile goes to the admin panel; requests with a likely N+1 are also logged.
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if (
+            not settings.sql_profiler
+            or scope["type"] != "http"
+            or scope["path"].startswith(_SKIPPED_PREFIXES)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(scope["method"], scope["path"])
+        token = current_profile.set(profile)
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                profile.status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_profile.reset(token)
+            profile.duration_ms = (time.perf_counter() - start) * 1000
+            summary = profile.summary()
+            recent_profiles.appendleft(summary)
+            for sql, n in summary["repeated"]:
+                log.warning("possible N+1 on %s %s: %d x %s", profile.method, profile.path, n, sql)
@@ -0,0 +1,149 @@
+import asyncio
+import hashlib
+import os
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, AsyncIterator, Iterator
+
+from app.core.config import settings
+from app.data.sqlite import conn
+from app.storage import UPLOADS_DIR, resolve_stored_path
+
+
+# (table, id column, path column, checksum column) for every place that references a stored file.
+_REFERENCES = (
+    ("student_documents", "id", "stored_path", "sha256"),
+    ("payments", "id", "receipt_stored_path", "receipt_sha256"),
+)
+
+
+@dataclass
+class ReconcileReport:
+    files_scanned: int = 0
+    rows_scanned: int = 0
+    orphans: list[Path] = field(default_factory=list)
+    dangling: list[tuple[str, Any, str]] = field(default_factory=list)
+    checksum_mismatches: list[tuple[str, Any, str]] = field(default_factory=list)
+    deleted: int = 0
+    deleted_bytes: int = 0
+
+
+async def iter_references(db: Any, batch_size: int = 500) -> AsyncIterator[dict]:
+    """Yield every stored-file reference, one short read per batch so writers are never blocked for long."""
+    if settings.db_backend != "sqlite":
+        for table, _id_col, path_col, sum_col in _REFERENCES:
+            cur = db[table].find({path_col: {"$ne": None}}, {path_col: 1, sum_col: 1}).batch_size(batch_size)
+            async for row in cur:
+                yield {"table": table, "id": row.get("_id"), "path": row.get(path_col), "sha256": row.get(sum_col)}
+        return
+
+    for table, id_col, path_col, sum_col in _REFERENCES:
+        last_id = 0
+        while True:
+            c = conn()
+            try:
+                rows = c.execute(
+                    f"""
+                    SELECT {id_col} AS id, {path_col} AS path, {sum_col} AS sha256
+                    FROM {table}
+                    WHERE {id_col} > ? AND {path_col} IS NOT NULL
+                    ORDER BY {id_col}
+                    LIMIT ?
+                    """,
+                    (last_id, batch_size),
+                ).fetchall()
+            finally:
+                c.close()
+            if not rows:
+                break
+            last_id = rows[-1]["id"]
+            for r in rows:
+                yield {"table": table, "id": r["id"], "path": r["path"], "sha256": r["sha256"]}
+
+
+def iter_stored_files(root: Path = UPLOADS_DIR) -> Iterator[os.DirEntry]:
+    """Walk the upload store lazily, skipping internal dot-directories (thumbnails, partial uploads)."""
+    if not root.exists():
+        return
+    stack = [str(root)]
+    while stack:
+        with os.scandir(stack.pop()) as it:
+            for entry in it:
+                if entry.name.startswith("."):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    yield entry
+
+
+def _sha256_of(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+async def reconcile(
+    db: Any,
+    *,
+    verify_checksums: bool = False,
+    delete_orphans: bool = False,
+    grace_seconds: int = 3600,
+    batch_size: int = 500,
+    pause_seconds: float = 0.5,
+) -> ReconcileReport:
+    """Compare the upload store with the tables that reference it.
+
+    Orphans are files no row points to; dangling references are rows whose file is gone.
+    Files younger than ``grace_seconds`` are never treated as orphans, since an upload in
+    progress writes its file before inserting its row.
+    """
+    report = ReconcileReport()
+
+    # Stored names are uuid-prefixed and unique, so the basename identifies a file in either layout.
+    referenced: set[str] = set()
+    async for ref in iter_references(db, batch_size):
+        report.rows_scanned += 1
+        referenced.add(os.path.basename(ref["path"]))
+        path = resolve_stored_path(ref["path"])
+        if path is None:
+            report.dangling.append((ref["table"], ref["id"], ref["path"]))
+        elif verify_checksums and ref["sha256"] and _sha256_of(path) != ref["sha256"]:
+            report.checksum_mismatches.append((ref["table"], ref["id"], ref["path"]))
+
+    cutoff = time.time() - grace_seconds
+    batch: list[os.DirEntry] = []
+    for entry in iter_stored_files():
+        report.files_scanned += 1
+        if entry.name in referenced:
+            continue
+        try:
+            if entry.stat().st_mtime > cutoff:
+                continue
+        except FileNotFoundError:
+            continue
+        report.orphans.append(Path(entry.path))
+        if delete_orphans:
+            batch.append(entry)
+            if len(batch) >= batch_size:
+                _delete_batch(batch, report)
+                batch = []
+                await asyncio.sleep(pause_seconds)
+    if batch:
+        _delete_batch(batch, report)
+
+    return report
+
+
+def _delete_batch(batch: list[os.DirEntry], report: ReconcileReport) -> None:
+    for entry in batch:
+        try:
+            size = entry.stat().st_size
+            os.unlink(entry.path)
+        except FileNotFoundError:
+            continue
+        report.deleted += 1
+        report.deleted_bytes += size
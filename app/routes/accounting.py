@@ -1,23 +1,44 @@
-from fastapi import APIRouter, Depends, Request, HTTPException
+from datetime import datetime, timedelta
+from urllib.parse import urlencode
+
+from fastapi import APIRouter, Depends, Form, Request, HTTPException
+from fastapi.responses import RedirectResponse
 from app.deps import db_dep, require_role
-from app.data.payments import list_pending_payments, count_pending_payments
+from app.data.closings import cash_totals, close_period, list_closed_periods, period_bounds
+from app.data.notifications import create_notifications
+from app.data.payments import confirm_payments, list_pending_payments, count_pending_payments
 from app.data.users import list_users
+from app.flash import flash_error, flash_success
 from app.templating import templates
 
 router = APIRouter(prefix="/accounting", tags=["accounting"])
 
+PENDING_PAGE_SIZE = 50
+
+
+def _queue_url(agent_id: int | None, filter_date: str | None, page: int = 1) -> str:
+    params = {k: v for k, v in (("agent_id", agent_id), ("filter_date", filter_date), ("page", page if page > 1 else None)) if v}
+    return "/accounting/pending" + (f"?{urlencode(params)}" if params else "")
+
+
 @router.get("/pending")
 async def pending_payments_view(
     request: Request,
     agent_id: int | None = None,
     filter_date: str | None = None,
+    page: int = 1,
     user=Depends(require_role("admin", "secretary")),
     db=Depends(db_dep)
 ):
     users_list = await list_users(db)
-    pending = await list_pending_payments(db, agent_id=agent_id, filter_date=filter_date)
-    pending_count = await count_pending_payments(db)
-    
+    total = await count_pending_payments(db, agent_id=agent_id, filter_date=filter_date)
+    pages = max(1, -(-total // PENDING_PAGE_SIZE))
+    page = min(max(page, 1), pages)
+    pending = await list_pending_payments(
+        db, agent_id=agent_id, filter_date=filter_date, limit=PENDING_PAGE_SIZE, offset=(page - 1) * PENDING_PAGE_SIZE
+    )
+    pending_count = await count_pending_payments(db) if agent_id or filter_date else total
+
     return templates.TemplateResponse(
         "accounting/pending.html",
         {
@@ -26,7 +47,108 @@ async def pending_payments_view(
             "payments": pending,
             "users_list": users_list,
             "pending_count": pending_count,
+            "queue_total": total,
+            "page": page,
+            "pages": pages,
+            "prev_url": _queue_url(agent_id, filter_date, page - 1) if page > 1 else None,
+            "next_url": _queue_url(agent_id, filter_date, page + 1) if page < pages else None,
             "current_agent_id": agent_id,
             "current_filter_date": filter_date
         }
     )
+
+
+@router.post("/pending/confirm")
+async def pending_payments_confirm(
+    request: Request,
+    payment_ids: list[int] = Form([]),
+    agent_id: str = Form(""),
+    filter_date: str = Form(""),
+    page: int = Form(1),
+    user=Depends(require_role("admin", "secretary")),
+    db=Depends(db_dep),
+):
+    if not payment_ids:
+        raise HTTPException(status_code=400, detail="Aucun paiement sélectionné")
+    # The queue's agent filter is posted back as "" when unset; checked before anything is confirmed.
+    try:
+        agent_filter = int(agent_id) if agent_id else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Agent invalide")
+    confirmed, failures = await confirm_payments(db, payment_ids, confirmed_by_user_id=user.get("id"))
+
+    # One notification per creator, however many of their payments were confirmed.
+    by_creator: dict = {}
+    for p in confirmed:
+        if p.get("created_by_user_id"):
+            by_creator.setdefault(p["created_by_user_id"], []).append(p)
+    notifications = []
+    for creator_id, payments in by_creator.items():
+        if len(payments) == 1:
+            p = payments[0]
+            message = f"Le versement de {p['amount']} {p['currency']} pour {p['student_name']} a été validé par la comptabilité."
+            link = f"/payments/student/{p['student_id']}"
+        else:
+            names = ", ".join(dict.fromkeys(p["student_name"] for p in payments[:5]))
+            more = "…" if len(payments) > 5 else ""
+            message = f"{len(payments)} versements ont été validés par la comptabilité ({names}{more})."
+            link = "/payments"
+        notifications.append(
+            {"user_id": creator_id, "title": "Paiement Confirmé", "message": message, "type": "success", "link": link}
+        )
+    await create_notifications(db, notifications)
+
+    if confirmed:
+        flash_success(request, f"{len(confirmed)} paiement(s) confirmé(s)")
+    if failures:
+        details = ", ".join(f"#REC-{f['payment_id']} ({f['reason']})" for f in failures[:20])
+        more = f" et {len(failures) - 20} autre(s)" if len(failures) > 20 else ""
+        flash_error(request, f"Non confirmés: {details}{more}")
+    return RedirectResponse(url=_queue_url(agent_filter, filter_date or None, page), status_code=303)
+
+
+@router.get("/closings")
+async def closings_view(
+    request: Request,
+    period: str | None = None,
+    user=Depends(require_role("admin", "secretary")),
+    db=Depends(db_dep),
+):
+    period = period or (datetime.utcnow().date() - timedelta(days=1)).isoformat()
+    try:
+        totals = await cash_totals(db, period)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Période invalide (AAAA-MM-JJ ou AAAA-MM)")
+    closings = await list_closed_periods(db)
+    pending_count = await count_pending_payments(db)
+    return templates.TemplateResponse(
+        "accounting/closings.html",
+        {
+            "request": request,
+            "user": user,
+            "totals": totals,
+            "closings": closings,
+            "can_close": totals["closing"] is None and totals["date_to"] < datetime.utcnow().strftime("%Y-%m-%d"),
+            "pending_count": pending_count,
+        },
+    )
+
+
+@router.post("/closings")
+async def closings_close(
+    request: Request,
+    period: str = Form(...),
+    user=Depends(require_role("admin", "secretary")),
+    db=Depends(db_dep),
+):
+    try:
+        period_bounds(period)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Période invalide (AAAA-MM-JJ ou AAAA-MM)")
+    try:
+        await close_period(db, period, closed_by_user_id=user.get("id"))
+    except ValueError as e:
+        flash_error(request, str(e))
+    else:
+        flash_success(request, f"Période {period} clôturée")
+    return RedirectResponse(url=f"/accounting/closings?{urlencode({'period': period})}", status_code=303)
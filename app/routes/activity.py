@@ -37,9 +37,8 @@ async def daily_report_page(
         today_payments = 0   
     else:
         reports = await list_user_reports(db, user["id"])
-        agent_name = user.get("full_name", "")
-        today_prospects = await get_daily_prospect_count(db, agent_name)
-        today_payments = await get_daily_payment_count(db, agent_name)
+        today_prospects = await get_daily_prospect_count(db, user["id"])
+        today_payments = await get_daily_payment_count(db, user["id"])
     
     return templates.TemplateResponse(
         "activity/daily.html",
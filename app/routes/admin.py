@@ -3,7 +3,11 @@ from fastapi.responses import RedirectResponse
 from app.deps import db_dep, require_role
 from app.templating import templates
 from app.data.users import list_users, create_user, get_user_by_email
+from app.data.analytics import funnel_analytics
+from app.data.contacts import duplicate_report
 from app.flash import flash_success, flash_error
+from app.profiler import N_PLUS_ONE_MIN_REPEATS, recent_profiles
+from app.core.config import settings
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 
@@ -35,6 +39,45 @@ async def admin_user_create(
         flash_error(request, "Cet email est déjà utilisé")
         return RedirectResponse(url="/admin/users", status_code=303)
     
-    await create_user(db, full_name=full_name, email=email, password=password, role=role)
+    await create_user(db, full_name=full_name, email=email, password=password, role=role, created_by_user_id=user.get("id"))
     flash_success(request, f"Utilisateur {full_name} créé avec succès")
     return RedirectResponse(url="/admin/users", status_code=303)
+
+@router.get("/duplicates")
+async def admin_duplicates(request: Request, user=Depends(require_role("admin")), db=Depends(db_dep)):
+    groups = await duplicate_report(db)
+    pending_count = await count_pending_payments(db)
+    return templates.TemplateResponse(
+        "admin/duplicates.html", {"request": request, "user": user, "groups": groups, "pending_count": pending_count}
+    )
+
+
+@router.get("/funnel")
+async def admin_funnel(request: Request, user=Depends(require_role("admin")), db=Depends(db_dep)):
+    funnel = await funnel_analytics(db)
+    pending_count = await count_pending_payments(db)
+    return templates.TemplateResponse(
+        "admin/funnel.html", {"request": request, "user": user, "funnel": funnel, "pending_count": pending_count}
+    )
+
+
+@router.post("/funnel/refresh")
+async def admin_funnel_refresh(user=Depends(require_role("admin")), db=Depends(db_dep)):
+    await funnel_analytics(db, force=True)
+    return RedirectResponse(url="/admin/funnel", status_code=303)
+
+
+@router.get("/profiler")
+async def admin_profiler(request: Request, user=Depends(require_role("admin")), db=Depends(db_dep)):
+    pending_count = await count_pending_payments(db)
+    return templates.TemplateResponse(
+        "admin/profiler.html",
+        {
+            "request": request,
+            "user": user,
+            "enabled": settings.sql_profiler,
+            "profiles": list(recent_profiles),
+            "n_plus_one_min": N_PLUS_ONE_MIN_REPEATS,
+            "pending_count": pending_count,
+        },
+    )
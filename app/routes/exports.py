@@ -0,0 +1,116 @@
+from datetime import datetime
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+
+from app.deps import agent_scope, db_dep, require_role
+from app.data.payments import iter_payments
+from app.data.prospects import iter_prospects
+from app.data.students import iter_students
+from app.exports import stream_csv, stream_xlsx
+
+router = APIRouter(prefix="/exports", tags=["exports"])
+
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+PAYMENT_COLUMNS = [
+    ("id", "ID"),
+    ("payment_date", "Date"),
+    ("student_name", "Étudiant"),
+    ("agent_name", "Agent"),
+    ("payment_type", "Type"),
+    ("amount", "Montant"),
+    ("currency", "Devise"),
+    ("payment_mode", "Mode"),
+    ("payment_status", "Statut"),
+    ("created_at", "Enregistré le"),
+]
+
+STUDENT_COLUMNS = [
+    ("id", "ID"),
+    ("full_name", "Nom"),
+    ("phone", "Téléphone"),
+    ("email", "Email"),
+    ("country", "Pays"),
+    ("study_level", "Niveau"),
+    ("program_choice", "Programme"),
+    ("university", "Université"),
+    ("status_name", "Statut"),
+    ("agent_name", "Agent"),
+    ("total_amount", "Total contrat"),
+    ("currency", "Devise"),
+    ("created_at", "Créé le"),
+]
+
+PROSPECT_COLUMNS = [
+    ("id", "ID"),
+    ("full_name", "Nom"),
+    ("phone", "Téléphone"),
+    ("email", "Email"),
+    ("country_interest", "Pays visé"),
+    ("source", "Source"),
+    ("status", "Statut"),
+    ("agent_name", "Agent"),
+    ("created_at", "Créé le"),
+]
+
+
+def _check_date(value: str | None) -> str | None:
+    if not value:
+        return None
+    try:
+        datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Date invalide (AAAA-MM-JJ)")
+    return value
+
+
+def _export_response(name: str, fmt: str, rows, columns) -> StreamingResponse:
+    stamp = datetime.utcnow().strftime("%Y%m%d")
+    if fmt == "csv":
+        body, media_type = stream_csv(rows, columns), "text/csv; charset=utf-8"
+    elif fmt == "xlsx":
+        body, media_type = stream_xlsx(rows, columns, sheet_name=name), XLSX_MEDIA_TYPE
+    else:
+        raise HTTPException(status_code=404, detail="Not found")
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{name}_{stamp}.{fmt}"', "Cache-Control": "no-store"},
+    )
+
+
+@router.get("/payments.{fmt}")
+async def export_payments(
+    fmt: str,
+    date_from: str | None = None,
+    date_to: str | None = None,
+    user=Depends(require_role("admin", "agent", "secretary")),
+    db=Depends(db_dep),
+):
+    rows = iter_payments(db, agent_user_id=agent_scope(user), date_from=_check_date(date_from), date_to=_check_date(date_to))
+    return _export_response("paiements", fmt, rows, PAYMENT_COLUMNS)
+
+
+@router.get("/students.{fmt}")
+async def export_students(
+    fmt: str,
+    date_from: str | None = None,
+    date_to: str | None = None,
+    user=Depends(require_role("admin", "agent", "secretary", "admission_director")),
+    db=Depends(db_dep),
+):
+    rows = iter_students(db, agent_user_id=agent_scope(user), date_from=_check_date(date_from), date_to=_check_date(date_to))
+    return _export_response("etudiants", fmt, rows, STUDENT_COLUMNS)
+
+
+@router.get("/prospects.{fmt}")
+async def export_prospects(
+    fmt: str,
+    date_from: str | None = None,
+    date_to: str | None = None,
+    user=Depends(require_role("admin", "agent", "secretary", "admission_director", "operation_director")),
+    db=Depends(db_dep),
+):
+    rows = iter_prospects(db, agent_user_id=agent_scope(user), date_from=_check_date(date_from), date_to=_check_date(date_to))
+    return _export_response("prospects", fmt, rows, PROSPECT_COLUMNS)
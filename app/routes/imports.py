@@ -0,0 +1,104 @@
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+from fastapi import APIRouter, Depends, File, Form, HTTPException, Request, UploadFile
+from fastapi.responses import JSONResponse, RedirectResponse
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.deps import db_dep, require_role
+from app.imports import IMPORT_KINDS, IMPORTS_DIR, get_import_job, run_dry_run_import, start_import
+from app.templating import templates
+
+router = APIRouter(prefix="/imports", tags=["imports"])
+
+# Same roles as creating each kind of record by hand.
+KIND_ROLES = {
+    "students": ("admin", "agent", "admission_director"),
+    "prospects": ("admin", "agent", "secretary", "admission_director", "operation_director"),
+}
+ANY_IMPORT_ROLE = tuple(sorted(set(KIND_ROLES["students"]) | set(KIND_ROLES["prospects"])))
+
+
+def _check_kind(user: dict, kind: str) -> None:
+    if kind not in IMPORT_KINDS:
+        raise HTTPException(status_code=404, detail="Not found")
+    if user.get("role") not in KIND_ROLES[kind]:
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+
+async def _owned_job(db, user: dict, job_id: str) -> dict:
+    job = await get_import_job(db, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Import introuvable")
+    if user.get("role") != "admin" and job["owner_id"] != (user.get("id") or str(user.get("_id"))):
+        raise HTTPException(status_code=403, detail="Forbidden")
+    return job
+
+
+def _save_to_temp(upload: UploadFile, suffix: str) -> tuple[str, int]:
+    IMPORTS_DIR.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(prefix="import-", suffix=suffix, dir=IMPORTS_DIR, delete=False) as out:
+        shutil.copyfileobj(upload.file, out, 1024 * 1024)
+        return out.name, out.tell()
+
+
+@router.get("")
+async def import_form(request: Request, kind: str = "students", user=Depends(require_role(*ANY_IMPORT_ROLE))):
+    _check_kind(user, kind)
+    return templates.TemplateResponse(
+        "imports/form.html",
+        {"request": request, "user": user, "kind": kind, "kind_roles": KIND_ROLES},
+    )
+
+
+@router.post("")
+async def import_start(
+    kind: str = Form(...),
+    dry_run: bool = Form(False),
+    file: UploadFile = File(...),
+    user=Depends(require_role(*ANY_IMPORT_ROLE)),
+    db=Depends(db_dep),
+):
+    _check_kind(user, kind)
+    filename = file.filename or ""
+    suffix = Path(filename).suffix.lower()
+    if suffix not in (".csv", ".xlsx"):
+        raise HTTPException(status_code=400, detail="Format non pris en charge (CSV ou XLSX)")
+
+    path, size = await run_in_threadpool(_save_to_temp, file, suffix)
+    if size > settings.import_max_mb * 1024 * 1024:
+        os.unlink(path)
+        raise HTTPException(status_code=400, detail=f"Fichier trop volumineux (max {settings.import_max_mb}MB)")
+
+    job_id = await start_import(db, kind=kind, path=path, filename=filename, user=user, dry_run=dry_run)
+    return RedirectResponse(url=f"/imports/{job_id}", status_code=303)
+
+
+@router.get("/{job_id}")
+async def import_job_page(request: Request, job_id: str, user=Depends(require_role(*ANY_IMPORT_ROLE)), db=Depends(db_dep)):
+    job = await _owned_job(db, user, job_id)
+    return templates.TemplateResponse(
+        "imports/job.html",
+        {"request": request, "user": user, "job": job},
+    )
+
+
+@router.get("/{job_id}/status")
+async def import_job_status(job_id: str, user=Depends(require_role(*ANY_IMPORT_ROLE)), db=Depends(db_dep)):
+    return JSONResponse(await _owned_job(db, user, job_id))
+
+
+@router.post("/{job_id}/run")
+async def import_job_run(job_id: str, user=Depends(require_role(*ANY_IMPORT_ROLE)), db=Depends(db_dep)):
+    """Run the real import of a file that went through a successful dry run."""
+    job = await _owned_job(db, user, job_id)
+    if not job["dry_run"] or job["status"] != "done":
+        raise HTTPException(status_code=400, detail="Seul un test terminé peut être importé")
+    _check_kind(user, job["kind"])
+    new_id = await run_dry_run_import(db, job_id, user)
+    if new_id is None:
+        raise HTTPException(status_code=410, detail="Fichier expiré, veuillez le renvoyer")
+    return RedirectResponse(url=f"/imports/{new_id}", status_code=303)
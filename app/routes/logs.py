@@ -1,14 +1,48 @@
+from urllib.parse import urlencode
+
 from fastapi import APIRouter, Depends, Request
 from app.deps import db_dep, require_role
-from app.data.logs import list_global_history
+from app.data.events import EVENT_TYPES, list_events
+from app.data.users import list_users
 from app.templating import templates
 
 router = APIRouter(prefix="/logs", tags=["logs"])
 
+PAGE_SIZE = 50
+
+
 @router.get("")
-async def logs_list(request: Request, user=Depends(require_role("admin", "agent")), db=Depends(db_dep)):
-    history = await list_global_history(db)
+async def logs_list(
+    request: Request,
+    type: str | None = None,
+    actor: int | None = None,
+    student_id: int | None = None,
+    before_ts: str | None = None,
+    before_id: int | None = None,
+    user=Depends(require_role("admin", "agent")),
+    db=Depends(db_dep),
+):
+    if type not in EVENT_TYPES:
+        type = None
+    before = (before_ts, before_id) if before_ts and before_id is not None else None
+    history, next_cursor = await list_events(
+        db, limit=PAGE_SIZE, before=before, type=type, actor_user_id=actor, student_id=student_id
+    )
+
+    filters = {k: v for k, v in {"type": type, "actor": actor, "student_id": student_id}.items() if v is not None}
+    next_url = None
+    if next_cursor:
+        next_url = "/logs?" + urlencode({**filters, "before_ts": next_cursor[0], "before_id": next_cursor[1]})
+
     return templates.TemplateResponse(
-        "logs/list.html", 
-        {"request": request, "user": user, "history": history}
+        "logs/list.html",
+        {
+            "request": request,
+            "user": user,
+            "history": history,
+            "users": await list_users(db),
+            "filters": filters,
+            "next_url": next_url,
+            "is_first_page": before is None,
+        }
     )
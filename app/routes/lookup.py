@@ -0,0 +1,56 @@
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import JSONResponse
+from app.deps import agent_scope, db_dep, require_role
+from app.data.partners import search_partners
+from app.data.students import search_students_by_prefix
+from app.data.users import search_users
+
+router = APIRouter(prefix="/lookup", tags=["lookup"])
+
+MAX_LIMIT = 20
+# Typeahead fields fire one request per pause in typing; a short private cache lets
+# backspacing over a prefix already asked for be answered by the browser.
+CACHE_CONTROL = "private, max-age=30"
+
+
+def _suggestions(items: list) -> JSONResponse:
+    return JSONResponse(items, headers={"Cache-Control": CACHE_CONTROL, "Vary": "Cookie"})
+
+
+@router.get("/students")
+async def lookup_students(
+    q: str = "",
+    limit: int = Query(10, ge=1, le=MAX_LIMIT),
+    user=Depends(require_role("admin", "agent", "operation_director", "secretary")),
+    db=Depends(db_dep),
+):
+    rows = await search_students_by_prefix(db, q, agent_user_id=agent_scope(user), limit=limit)
+    return _suggestions(
+        [{"id": s["id"], "label": s["full_name"], "detail": s.get("phone") or ""} for s in rows]
+    )
+
+
+@router.get("/users")
+async def lookup_users(
+    q: str = "",
+    limit: int = Query(10, ge=1, le=MAX_LIMIT),
+    user=Depends(require_role("admin", "agent", "operation_director")),
+    db=Depends(db_dep),
+):
+    rows = await search_users(db, q, limit=limit)
+    return _suggestions(
+        [{"id": u.get("id", str(u.get("_id"))), "label": u["full_name"], "detail": u.get("role") or ""} for u in rows]
+    )
+
+
+@router.get("/partners")
+async def lookup_partners(
+    q: str = "",
+    limit: int = Query(10, ge=1, le=MAX_LIMIT),
+    user=Depends(require_role("admin", "agent")),
+    db=Depends(db_dep),
+):
+    rows = await search_partners(db, q, limit=limit)
+    return _suggestions(
+        [{"id": p["id"], "label": p["name"], "detail": p.get("country") or ""} for p in rows]
+    )
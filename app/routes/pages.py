@@ -1,11 +1,18 @@
-from fastapi import APIRouter, Depends, Request
-from fastapi.responses import RedirectResponse
+import asyncio
+from hmac import compare_digest
+from time import perf_counter
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, RedirectResponse
 
 from app.deps import db_dep, get_current_user
 from app.data.dashboard import dashboard_stats
+from app.data.users import get_user_by_id
 from app.templating import templates
 from app.core.config import settings
+from app.data.sqlite import check_sqlite
 from app.db import ping_mongo
+from app.metrics import render_metrics
 
 router = APIRouter()
 
@@ -15,14 +22,39 @@ from app.data.payments import count_pending_payments
 
 @router.get("/health/db")
 async def health_db():
-    if settings.db_backend == "sqlite":
-        return {"ok": True, "backend": "sqlite"}
-
+    start = perf_counter()
     try:
-        await ping_mongo()
-        return {"ok": True, "backend": "mongo"}
+        if settings.db_backend == "sqlite":
+            await asyncio.to_thread(check_sqlite)
+        else:
+            await ping_mongo()
     except Exception as e:
-        return {"ok": False, "backend": "mongo", "error": str(e)}
+        return JSONResponse({"ok": False, "backend": settings.db_backend, "error": str(e)}, status_code=503)
+    return {"ok": True, "backend": settings.db_backend, "latency_ms": round((perf_counter() - start) * 1000, 1)}
+
+
+async def _is_admin_session(request: Request, db) -> bool:
+    user_id = request.session.get("user_id")
+    if not user_id:
+        return False
+    user = await get_user_by_id(db, user_id)
+    return bool(user) and user.get("role") == "admin" and user.get("active") not in (0, False)
+
+
+@router.get("/metrics")
+async def metrics(request: Request, db=Depends(db_dep)):
+    """Scraped with the METRICS_TOKEN bearer token, or viewed from an admin session.
+
+    Without a token configured the endpoint does not exist for anyone but admins.
+    """
+    token_ok = bool(settings.metrics_token) and compare_digest(
+        request.headers.get("authorization", ""), f"Bearer {settings.metrics_token}"
+    )
+    if not token_ok and not await _is_admin_session(request, db):
+        if not settings.metrics_token:
+            raise HTTPException(status_code=404, detail="Not Found")
+        raise HTTPException(status_code=403, detail="Forbidden")
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
 
 @router.get("/")
 async def home(request: Request, user=Depends(get_current_user), db=Depends(db_dep)):
@@ -1,13 +1,15 @@
 from fastapi import APIRouter, Depends, File, Form, HTTPException, Request, UploadFile
-from fastapi.responses import FileResponse, RedirectResponse
+from fastapi.responses import RedirectResponse
 from pathlib import Path
 
-from app.deps import db_dep, require_role
-from app.data.payments import create_payment, get_payment, list_payments, list_payments_by_student, totals_by_student, confirm_payment
+from app.deps import agent_scope, can_access_student, db_dep, require_role
+from app.data.closings import PeriodClosed, is_period_closed
+from app.data.payments import create_payment, get_payment, list_payments, list_payments_by_student, confirm_payment
 from app.data.notifications import notify_admins, notify_role, create_notification
 from app.data.students import get_student, set_student_financial
-from app.flash import flash_success
-from app.storage import save_upload
+from app.flash import flash_error, flash_success
+from app.pdf import render_pdf
+from app.storage import content_response, delete_stored_file, resolve_stored_path, save_upload, stored_file_response, stored_path_for
 from app.templating import templates
 
 router = APIRouter(prefix="/payments", tags=["payments"])
@@ -15,8 +17,7 @@ router = APIRouter(prefix="/payments", tags=["payments"])
 
 @router.get("")
 async def payments_list(request: Request, user=Depends(require_role("admin", "agent", "secretary")), db=Depends(db_dep)):
-    agent_name = user.get("full_name") if user.get("role") == "agent" else None
-    payments = await list_payments(db, agent_name=agent_name)
+    payments = await list_payments(db, agent_user_id=agent_scope(user))
     return templates.TemplateResponse(
         "payments/list.html",
         {"request": request, "user": user, "payments": payments},
@@ -28,13 +29,12 @@ async def payments_by_student(request: Request, student_id: int, user=Depends(re
     student = await get_student(db, student_id)
     if not student:
         return RedirectResponse(url="/students", status_code=303)
-    if user.get("role") == "agent" and student.get("agent_name") != user.get("full_name"):
+    if not can_access_student(user, student):
         raise HTTPException(status_code=403, detail="Forbidden")
     payments = await list_payments_by_student(db, student_id)
-    totals = await totals_by_student(db, student_id)
     total_amount = int(student.get("total_amount") or 0)
-    paid = int(totals.get("paid") or 0)
-    balance = total_amount - paid
+    paid = int(student.get("paid_total") or 0)
+    balance = int(student.get("balance") or 0)
     return templates.TemplateResponse(
         "payments/student.html",
         {
@@ -54,7 +54,7 @@ async def payment_new_get(request: Request, student_id: int, user=Depends(requir
     student = await get_student(db, student_id)
     if not student:
         return RedirectResponse(url="/students", status_code=303)
-    if user.get("role") == "agent" and student.get("agent_name") != user.get("full_name"):
+    if not can_access_student(user, student):
         raise HTTPException(status_code=403, detail="Forbidden")
     return templates.TemplateResponse(
         "payments/form.html",
@@ -63,7 +63,7 @@ async def payment_new_get(request: Request, student_id: int, user=Depends(requir
 
 
 @router.get("/receipts/{payment_id}")
-async def payment_receipt_download(payment_id: int, user=Depends(require_role("admin", "agent", "secretary")), db=Depends(db_dep)):
+async def payment_receipt_download(request: Request, payment_id: int, user=Depends(require_role("admin", "agent", "secretary")), db=Depends(db_dep)):
     payment = await get_payment(db, payment_id)
     if not payment:
         raise HTTPException(status_code=404, detail="Payment not found")
@@ -72,7 +72,7 @@ async def payment_receipt_download(payment_id: int, user=Depends(require_role("a
         student = await get_student(db, int(payment.get("student_id") or 0))
         if not student:
             raise HTTPException(status_code=404, detail="Not found")
-        if student.get("agent_name") != user.get("full_name"):
+        if not can_access_student(user, student):
             raise HTTPException(status_code=403, detail="Forbidden")
 
     stored_path = payment.get("receipt_stored_path")
@@ -80,10 +80,32 @@ async def payment_receipt_download(payment_id: int, user=Depends(require_role("a
     if not stored_path:
         raise HTTPException(status_code=404, detail="Receipt not found")
 
-    path = Path(stored_path)
-    if not path.exists():
+    path = resolve_stored_path(stored_path)
+    if path is None:
         raise HTTPException(status_code=404, detail="File missing")
-    return FileResponse(path, filename=original_filename, media_type="application/octet-stream")
+    return stored_file_response(
+        request, path, filename=original_filename, media_type="application/octet-stream", digest=payment.get("receipt_sha256")
+    )
+
+
+@router.get("/{payment_id}/receipt.pdf")
+async def payment_receipt_pdf(request: Request, payment_id: int, user=Depends(require_role("admin", "agent", "secretary")), db=Depends(db_dep)):
+    payment = await get_payment(db, payment_id)
+    if not payment:
+        raise HTTPException(status_code=404, detail="Payment not found")
+    student = await get_student(db, int(payment.get("student_id") or 0))
+    if not student:
+        raise HTTPException(status_code=404, detail="Not found")
+    if not can_access_student(user, student):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+    data = {
+        "payment": {k: payment.get(k) for k in ("id", "payment_type", "amount", "currency", "payment_mode", "payment_date", "payment_status")},
+        "student": {k: student.get(k) for k in ("full_name", "email", "phone", "total_amount", "currency")},
+    }
+    data["payment"]["id"] = payment.get("id") or str(payment.get("_id"))
+    content, key = await render_pdf("payment_receipt", data)
+    return content_response(request, content, media_type="application/pdf", filename=f"recu_{payment_id}.pdf", digest=key, inline=True)
 
 
 @router.post("/student/{student_id}/new")
@@ -104,11 +126,15 @@ async def payment_new_post(
     student = await get_student(db, student_id)
     if not student:
         return RedirectResponse(url="/students", status_code=303)
-    if user.get("role") == "agent" and student.get("agent_name") != user.get("full_name"):
+    if not can_access_student(user, student):
         raise HTTPException(status_code=403, detail="Forbidden")
+    if await is_period_closed(db, payment_date):
+        flash_error(request, f"La période comptable du {payment_date} est clôturée")
+        return RedirectResponse(url=f"/payments/student/{student_id}/new", status_code=303)
 
     receipt_original = None
     receipt_path = None
+    receipt_sha256 = None
     if receipt is not None and receipt.filename:
         allowed_exts = {".pdf", ".doc", ".docx", ".png", ".jpg", ".jpeg"}
         ext = Path((receipt.filename or "").lower()).suffix
@@ -125,26 +151,35 @@ async def payment_new_post(
         if receipt.content_type and receipt.content_type not in allowed_ct:
             raise HTTPException(status_code=400, detail="Type de fichier non autorisé")
 
-        receipt_original, stored, size = await save_upload(receipt)
+        receipt_original, stored, size, receipt_sha256 = await save_upload(receipt)
         if size > 10 * 1024 * 1024:
-            Path("uploads").joinpath(stored).unlink(missing_ok=True)
+            delete_stored_file(str(stored_path_for(stored)))
             raise HTTPException(status_code=400, detail="File too large (max 10MB)")
-        receipt_path = str(Path("uploads") / stored)
+        receipt_path = str(stored_path_for(stored))
 
     created_by = user.get("id") if "id" in user else None
-    await create_payment(
-        db,
-        student_id=student_id,
-        payment_type=payment_type,
-        amount=amount,
-        currency=currency,
-        payment_mode=payment_mode,
-        payment_date=payment_date,
-        payment_status=payment_status,
-        receipt_original_filename=receipt_original,
-        receipt_stored_path=receipt_path,
-        created_by_user_id=created_by,
-    )
+    try:
+        await create_payment(
+            db,
+            student_id=student_id,
+            payment_type=payment_type,
+            amount=amount,
+            currency=currency,
+            payment_mode=payment_mode,
+            payment_date=payment_date,
+            payment_status=payment_status,
+            receipt_original_filename=receipt_original,
+            receipt_stored_path=receipt_path,
+            created_by_user_id=created_by,
+            receipt_sha256=receipt_sha256,
+        )
+    except PeriodClosed:
+        delete_stored_file(receipt_path)
+        flash_error(request, f"La période comptable du {payment_date} est clôturée")
+        return RedirectResponse(url=f"/payments/student/{student_id}/new", status_code=303)
+    except Exception:
+        delete_stored_file(receipt_path)
+        raise
 
     # update student's total amount/currency if provided
     try:
@@ -172,7 +207,11 @@ async def payment_confirm(request: Request, payment_id: int, user=Depends(requir
     if not payment:
         raise HTTPException(status_code=404, detail="Payment not found")
     
-    await confirm_payment(db, payment_id)
+    try:
+        await confirm_payment(db, payment_id, confirmed_by_user_id=user.get("id"))
+    except PeriodClosed:
+        flash_error(request, "Ce paiement appartient à une période comptable clôturée")
+        return RedirectResponse(url=f"/payments/student/{payment['student_id']}", status_code=303)
     
     # Notify creator of the payment
     if payment.get("created_by_user_id"):
@@ -1,9 +1,10 @@
 from fastapi import APIRouter, Depends, Form, Request, HTTPException
 from fastapi.responses import RedirectResponse
-from app.deps import db_dep, require_role
+from app.deps import agent_scope, db_dep, require_role
 from app.data.prospects import list_prospects, create_prospect, update_prospect_status, delete_prospect, get_prospect
 from app.templating import templates
-from app.flash import flash_success
+from app.data.contacts import find_contact_duplicates
+from app.flash import flash_info, flash_success
 
 router = APIRouter(prefix="/prospects", tags=["prospects"])
 
@@ -14,10 +15,9 @@ async def prospects_list(
     db=Depends(db_dep),
     search: str | None = None
 ):
-    # Admins and Secretaries see everything (agent_name=None fetches all)
-    # Agents see their own + NULL prospects
-    agent_filter = user.get("full_name") if user.get("role") == "agent" else None
-    prospects = await list_prospects(db, agent_name=agent_filter, search=search)
+    # Admins and Secretaries see everything (no agent scope fetches all)
+    # Agents see their own + unassigned prospects
+    prospects = await list_prospects(db, agent_user_id=agent_scope(user), search=search)
     return templates.TemplateResponse(
         "prospects/list.html", 
         {"request": request, "user": user, "prospects": prospects, "current_search": search or ""}
@@ -40,7 +40,8 @@ async def prospect_new(
     # If secretary or admin registers, agent_name is None (Global)
     # If agent registers, it's assigned to them
     agent_name = user.get("full_name") if user.get("role") == "agent" else None
-    
+    duplicates = await find_contact_duplicates(db, phone=phone, email=email, agent_user_id=agent_scope(user))
+
     await create_prospect(
         db,
         full_name=full_name,
@@ -49,7 +50,9 @@ async def prospect_new(
         country_interest=country_interest,
         source=source or ("Visite Bureau" if user.get("role") == "secretary" else None),
         agent_name=agent_name,
-        notes=notes
+        notes=notes,
+        agent_user_id=agent_scope(user),
+        created_by_user_id=user.get("id"),
     )
     
     # Notify Agents if it's a global prospect
@@ -64,6 +67,14 @@ async def prospect_new(
         )
     
     flash_success(request, "Prospect enregistré" + (" (Global)" if not agent_name else ""))
+    if duplicates:
+        names = ", ".join(
+            f"{d['full_name']} ({'étudiant' if d['kind'] == 'student' else 'prospect'})"
+            if not d.get("other_agent")
+            else f"suivi par un autre agent ({'étudiant' if d['kind'] == 'student' else 'prospect'})"
+            for d in duplicates[:5]
+        )
+        flash_info(request, f"Contact peut-être déjà connu (même téléphone ou email) : {names}")
     return RedirectResponse(url="/prospects", status_code=303)
 
 @router.post("/{prospect_id}/status")
@@ -111,6 +122,7 @@ async def prospect_convert(
         program_choice="À préciser",
         university="À préciser",
         agent_name=p["agent_name"] or user.get("full_name"),
+        agent_user_id=p.get("agent_user_id") if p.get("agent_name") else user.get("id"),
         status_id=2, # Dossier en préparation
         notes=p.get("notes"),
         changed_by_user_id=user.get("id")
@@ -1,18 +1,59 @@
-from fastapi import APIRouter, Depends, Request
+from fastapi import APIRouter, Depends, Form, HTTPException, Request
+from fastapi.responses import RedirectResponse
 from app.deps import db_dep, require_role
-from app.data.reports import daily_report_data
+from app.data.reports import MAX_REPORT_DAYS, delete_report_snapshots, report_range_data
+from app.pdf import render_pdf
+from app.storage import content_response
 from app.templating import templates
-from datetime import datetime
+from datetime import date as date_cls, datetime, timedelta
 
 router = APIRouter(prefix="/reports", tags=["reports"])
 
+
+def _resolve_range(date: str | None, period: str, date_from: str | None, date_to: str | None) -> tuple[str, str]:
+    try:
+        if period == "custom" and date_from and date_to:
+            start, end = date_cls.fromisoformat(date_from), date_cls.fromisoformat(date_to)
+        else:
+            day = date_cls.fromisoformat(date) if date else datetime.utcnow().date()
+            if period == "week":
+                start = day - timedelta(days=day.weekday())
+                end = start + timedelta(days=6)
+            elif period == "month":
+                start = day.replace(day=1)
+                end = (start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+            else:
+                start = end = day
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Date invalide (AAAA-MM-JJ)")
+    if end < start:
+        start, end = end, start
+    if (end - start).days >= MAX_REPORT_DAYS:
+        raise HTTPException(status_code=400, detail=f"Période limitée à {MAX_REPORT_DAYS} jours")
+    return start.isoformat(), end.isoformat()
+
+
 @router.get("")
-async def reports_list(request: Request, date: str | None = None, user=Depends(require_role("admin", "agent", "admission_director", "operation_director")), db=Depends(db_dep)):
-    if not date:
-        date = datetime.utcnow().strftime("%Y-%m-%d")
-    
-    report = await daily_report_data(db, date)
+async def reports_list(request: Request, date: str | None = None, period: str = "day", date_from: str | None = None, date_to: str | None = None, user=Depends(require_role("admin", "agent", "admission_director", "operation_director")), db=Depends(db_dep)):
+    start, end = _resolve_range(date, period, date_from, date_to)
+    report = await report_range_data(db, start, end)
     return templates.TemplateResponse(
-        "reports/list.html", 
-        {"request": request, "user": user, "report": report, "current_date": date}
+        "reports/list.html",
+        {"request": request, "user": user, "report": report, "current_date": date or start, "period": period}
     )
+
+
+@router.get("/pdf")
+async def reports_pdf(request: Request, date: str | None = None, period: str = "day", date_from: str | None = None, date_to: str | None = None, user=Depends(require_role("admin", "agent", "admission_director", "operation_director")), db=Depends(db_dep)):
+    start, end = _resolve_range(date, period, date_from, date_to)
+    report = await report_range_data(db, start, end)
+    content, key = await render_pdf("daily_report", report)
+    name = start if start == end else f"{start}_{end}"
+    return content_response(request, content, media_type="application/pdf", filename=f"rapport_{name}.pdf", digest=key, inline=True)
+
+
+@router.post("/snapshots/refresh")
+async def refresh_snapshots(date_from: str = Form(...), date_to: str = Form(...), user=Depends(require_role("admin")), db=Depends(db_dep)):
+    start, end = _resolve_range(None, "custom", date_from, date_to)
+    await delete_report_snapshots(db, start, end)
+    return RedirectResponse(url=f"/reports?period=custom&date_from={start}&date_to={end}", status_code=303)
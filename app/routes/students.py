@@ -1,30 +1,52 @@
-from fastapi import APIRouter, Depends, Form, Request
-from fastapi.responses import RedirectResponse
+from fastapi import APIRouter, BackgroundTasks, Depends, Form, Request
+from fastapi.responses import RedirectResponse, StreamingResponse
+from starlette.concurrency import iterate_in_threadpool
 from fastapi import UploadFile, File, HTTPException
-from fastapi.responses import FileResponse
 from pathlib import Path
+from urllib.parse import quote
 
 from app.deps import db_dep
-from app.deps import require_role
+from app.deps import agent_scope, can_access_student, require_role
+from app.data.closings import PeriodClosed
+from app.data.contacts import find_contact_duplicates
 from app.data.documents import (
     add_student_document,
     delete_student_document,
     get_student_document,
     list_student_documents,
 )
-from app.data.statuses import list_statuses
+from app.data.statuses import get_status_by_id, list_statuses
 from app.data.students import (
+    bulk_set_student_status,
     create_student,
     delete_student,
     get_student,
-    list_student_history,
     list_students,
     set_student_status,
     update_student,
 )
-from app.flash import flash_success
-from app.storage import save_upload
+from app.data.payments import list_payments_by_student
+from app.data.timeline import student_timeline
+from app.data.users import get_user_by_id, list_users
+from app.dossier import dossier_entries, dossier_filename, export_slots
+from app.flash import flash_error, flash_success
+from app.sections import load_sections, server_timing_headers
+from app.storage import (
+    UploadOffsetMismatch,
+    append_upload_chunk,
+    create_upload_session,
+    delete_stored_file,
+    discard_upload_session,
+    finalize_upload_session,
+    get_upload_session,
+    resolve_stored_path,
+    save_upload,
+    stored_file_response,
+    stored_path_for,
+)
 from app.templating import templates
+from app.thumbnails import delete_thumbnail, get_thumbnail, warm_thumbnail
+from app.zipstream import iter_zip
 
 router = APIRouter(prefix="/students", tags=["students"])
 
@@ -35,10 +57,13 @@ async def students_list(
     user=Depends(require_role("admin", "agent", "secretary", "admission_director")),
     db=Depends(db_dep),
     search: str | None = None,
-    status_id: int | None = None
+    status_id: int | None = None,
+    balance: str | None = None,
 ):
-    agent_name = user.get("full_name") if user.get("role") == "agent" else None
-    students = await list_students(db, agent_name=agent_name, search=search, status_id=status_id)
+    balance_due = balance == "due"
+    students = await list_students(
+        db, agent_user_id=agent_scope(user), search=search, status_id=status_id, balance_due=balance_due
+    )
     statuses = await list_statuses(db)
     
     return templates.TemplateResponse(
@@ -49,7 +74,8 @@ async def students_list(
             "students": students,
             "statuses": statuses,
             "current_search": search or "",
-            "current_status_id": status_id
+            "current_status_id": status_id,
+            "current_balance": "due" if balance_due else "",
         },
     )
 
@@ -57,12 +83,25 @@ async def students_list(
 @router.get("/new")
 async def student_new_get(request: Request, user=Depends(require_role("admin", "agent", "admission_director")), db=Depends(db_dep)):
     statuses = await list_statuses(db)
+    agents = await list_users(db)
     return templates.TemplateResponse(
         "students/form.html",
-        {"request": request, "user": user, "student": None, "statuses": statuses},
+        {"request": request, "user": user, "student": None, "statuses": statuses, "agents": agents},
     )
 
 
+async def _assigned_agent(db, user: dict, agent_user_id: str) -> dict | None:
+    """The account a student is assigned to: agents always get their own, others pick one."""
+    if user.get("role") == "agent":
+        return user
+    if not agent_user_id:
+        return None
+    agent = await get_user_by_id(db, agent_user_id)
+    if not agent:
+        raise HTTPException(status_code=400, detail="Agent inconnu")
+    return agent
+
+
 @router.post("/new")
 async def student_new_post(
     request: Request,
@@ -75,14 +114,44 @@ async def student_new_post(
     program_choice: str = Form(...),
     university: str = Form(...),
     status_id: str = Form(""),
-    agent_name: str = Form(...),
+    agent_user_id: str = Form(""),
     notes: str = Form(""),
+    confirm_duplicate: bool = Form(False),
     db=Depends(db_dep),
 ):
-    if user.get("role") == "agent":
-        agent_name = user.get("full_name")
+    agent = await _assigned_agent(db, user, agent_user_id)
+    if not agent:
+        raise HTTPException(status_code=400, detail="Agent requis")
 
     sid = int(status_id) if status_id else None
+    if not confirm_duplicate:
+        duplicates = await find_contact_duplicates(db, phone=phone, email=email, agent_user_id=agent_scope(user))
+        if duplicates:
+            form = {
+                "full_name": full_name,
+                "phone": phone,
+                "email": email,
+                "country": country,
+                "study_level": study_level,
+                "program_choice": program_choice,
+                "university": university,
+                "status_id": sid,
+                "agent_user_id": agent.get("id") or str(agent.get("_id")),
+                "notes": notes,
+            }
+            return templates.TemplateResponse(
+                "students/form.html",
+                {
+                    "request": request,
+                    "user": user,
+                    "student": None,
+                    "form": form,
+                    "duplicates": duplicates,
+                    "statuses": await list_statuses(db),
+                    "agents": await list_users(db),
+                },
+                status_code=409,
+            )
     changed_by = user.get("id") if "id" in user else None
     await create_student(
         db,
@@ -94,7 +163,8 @@ async def student_new_post(
         program_choice=program_choice,
         university=university,
         status_id=sid,
-        agent_name=agent_name,
+        agent_name=agent["full_name"],
+        agent_user_id=agent.get("id") or str(agent.get("_id")),
         notes=notes,
         changed_by_user_id=changed_by,
     )
@@ -104,20 +174,120 @@ async def student_new_post(
 
 @router.get("/{student_id}")
 async def student_view(request: Request, student_id: int, user=Depends(require_role("admin", "agent", "secretary", "admission_director")), db=Depends(db_dep)):
-    student = await get_student(db, student_id)
+    # The sections only depend on the id, so they are fetched alongside the student
+    # and discarded if the access check fails.
+    sections, timings = await load_sections(
+        student=lambda: get_student(db, student_id),
+        timeline=lambda: student_timeline(db, student_id),
+        documents=lambda: list_student_documents(db, student_id),
+        statuses=lambda: list_statuses(db),
+    )
+    student = sections["student"]
     if not student:
         return RedirectResponse(url="/students", status_code=303)
-    if user.get("role") == "agent" and student.get("agent_name") != user.get("full_name"):
+    if not can_access_student(user, student):
         raise HTTPException(status_code=403, detail="Forbidden")
-    history = await list_student_history(db, student_id)
-    documents = await list_student_documents(db, student_id)
-    statuses = await list_statuses(db)
+    timeline, timeline_next = sections["timeline"]
+    documents = sections["documents"]
+    statuses = sections["statuses"]
     return templates.TemplateResponse(
         "students/view.html",
-        {"request": request, "user": user, "student": student, "history": history, "documents": documents, "statuses": statuses},
+        {
+            "request": request,
+            "user": user,
+            "student": student,
+            "timeline": timeline,
+            "timeline_next": timeline_next,
+            "documents": documents,
+            "statuses": statuses,
+        },
+        headers=server_timing_headers(timings),
+    )
+
+
+@router.get("/{student_id}/timeline")
+async def student_timeline_page(
+    request: Request,
+    student_id: int,
+    before: str | None = None,
+    user=Depends(require_role("admin", "agent", "secretary", "admission_director")),
+    db=Depends(db_dep),
+):
+    student = await get_student(db, student_id)
+    if not student:
+        raise HTTPException(status_code=404, detail="Not found")
+    if not can_access_student(user, student):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+    timeline, timeline_next = await student_timeline(db, student_id, before=before)
+    headers = {"X-Next-Cursor": timeline_next} if timeline_next else {}
+    return templates.TemplateResponse(
+        "students/timeline_items.html", {"request": request, "timeline": timeline}, headers=headers
     )
 
 
+@router.get("/{student_id}/dossier.zip")
+async def student_dossier_export(student_id: int, user=Depends(require_role("admin", "agent", "secretary", "admission_director")), db=Depends(db_dep)):
+    student = await get_student(db, student_id)
+    if not student:
+        raise HTTPException(status_code=404, detail="Not found")
+    if not can_access_student(user, student):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+    sections, _timings = await load_sections(
+        documents=lambda: list_student_documents(db, student_id),
+        payments=lambda: list_payments_by_student(db, student_id),
+    )
+    entries = dossier_entries(student, sections["documents"], sections["payments"])
+
+    slots = export_slots()
+    if slots.locked():
+        raise HTTPException(status_code=503, detail="Trop d'exports en cours, réessayez dans un instant")
+
+    async def body():
+        # The slot is taken once streaming starts: a client gone before the first
+        # chunk never runs this generator, so nothing would release it otherwise.
+        async with slots:
+            async for chunk in iterate_in_threadpool(iter_zip(entries)):
+                yield chunk
+
+    filename = dossier_filename(student)
+    return StreamingResponse(
+        body(),
+        media_type="application/zip",
+        headers={"Content-Disposition": f"attachment; filename*=utf-8''{quote(filename)}", "Cache-Control": "no-store"},
+    )
+
+
+@router.post("/status/bulk")
+async def students_bulk_status_post(
+    request: Request,
+    user=Depends(require_role("admin", "agent", "admission_director")),
+    student_ids: list[int] = Form([]),
+    status_id: str = Form(""),
+    db=Depends(db_dep),
+):
+    to_status_id = int(status_id) if status_id else None
+    if to_status_id is not None and not await get_status_by_id(db, to_status_id):
+        raise HTTPException(status_code=400, detail="Statut inconnu")
+
+    changed_by = user.get("id") if "id" in user else None
+    updated, failures = await bulk_set_student_status(
+        db,
+        student_ids=student_ids,
+        to_status_id=to_status_id,
+        changed_by_user_id=changed_by,
+        agent_user_id=agent_scope(user),
+    )
+    if updated:
+        flash_success(request, f"Statut mis à jour pour {len(updated)} dossier(s)")
+    if failures:
+        details = ", ".join(f"{f['full_name'] or '#' + str(f['student_id'])} ({f['reason']})" for f in failures[:20])
+        more = f" et {len(failures) - 20} autre(s)" if len(failures) > 20 else ""
+        flash_error(request, f"Non modifiés: {details}{more}")
+    return RedirectResponse(url="/students", status_code=303)
+
+
 @router.post("/{student_id}/status")
 async def student_status_post(
     request: Request,
@@ -129,7 +299,7 @@ async def student_status_post(
     student = await get_student(db, student_id)
     if not student:
         return RedirectResponse(url="/students", status_code=303)
-    if user.get("role") == "agent" and student.get("agent_name") != user.get("full_name"):
+    if not can_access_student(user, student):
         raise HTTPException(status_code=403, detail="Forbidden")
 
     to_status_id = int(status_id) if status_id else None
@@ -143,6 +313,7 @@ async def student_status_post(
 async def student_document_upload(
     request: Request,
     student_id: int,
+    background_tasks: BackgroundTasks,
     user=Depends(require_role("admin", "agent", "secretary", "admission_director")),
     doc_type: str = Form(...),
     file: UploadFile = File(...),
@@ -151,7 +322,7 @@ async def student_document_upload(
     student = await get_student(db, student_id)
     if not student:
         return RedirectResponse(url="/students", status_code=303)
-    if user.get("role") == "agent" and student.get("agent_name") != user.get("full_name"):
+    if not can_access_student(user, student):
         raise HTTPException(status_code=403, detail="Forbidden")
 
     if not file:
@@ -173,47 +344,156 @@ async def student_document_upload(
     if file.content_type and file.content_type not in allowed_ct:
         raise HTTPException(status_code=400, detail="Type de fichier non autorisé (PDF/DOC/DOCX/PNG/JPG)")
 
-    original, stored, size = await save_upload(file)
+    original, stored, size, sha256 = await save_upload(file)
     if size > 10 * 1024 * 1024:
-        try:
-            Path("uploads").joinpath(stored).unlink(missing_ok=True)
-        except Exception:
-            pass
+        delete_stored_file(str(stored_path_for(stored)))
         raise HTTPException(status_code=400, detail="File too large (max 10MB)")
 
     uploaded_by = user.get("id") if "id" in user else None
-    await add_student_document(
-        db,
-        student_id=student_id,
-        doc_type=doc_type,
-        original_filename=original,
-        stored_filename=stored,
-        stored_path=str(Path("uploads") / stored),
-        size_bytes=size,
-        uploaded_by_user_id=uploaded_by,
+    try:
+        await add_student_document(
+            db,
+            student_id=student_id,
+            doc_type=doc_type,
+            original_filename=original,
+            stored_filename=stored,
+            stored_path=str(stored_path_for(stored)),
+            size_bytes=size,
+            uploaded_by_user_id=uploaded_by,
+            sha256=sha256,
+        )
+    except Exception:
+        delete_stored_file(str(stored_path_for(stored)))
+        raise
+    background_tasks.add_task(
+        warm_thumbnail,
+        {"original_filename": original, "stored_filename": stored, "stored_path": str(stored_path_for(stored)), "sha256": sha256},
     )
     flash_success(request, "Document uploadé avec succès")
     return RedirectResponse(url=f"/students/{student_id}", status_code=303)
 
 
+@router.post("/{student_id}/uploads")
+async def student_upload_session_create(
+    student_id: int,
+    user=Depends(require_role("admin", "agent", "secretary", "admission_director")),
+    doc_type: str = Form(...),
+    filename: str = Form(...),
+    size: int = Form(...),
+    db=Depends(db_dep),
+):
+    student = await get_student(db, student_id)
+    if not student:
+        raise HTTPException(status_code=404, detail="Not found")
+    if not can_access_student(user, student):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+    allowed_exts = {".pdf", ".doc", ".docx", ".png", ".jpg", ".jpeg"}
+    if Path(filename.lower()).suffix not in allowed_exts:
+        raise HTTPException(status_code=400, detail="Type de fichier non autorisé (PDF/DOC/DOCX/PNG/JPG)")
+    if size <= 0 or size > 10 * 1024 * 1024:
+        raise HTTPException(status_code=400, detail="File too large (max 10MB)")
+
+    session = create_upload_session(
+        filename=filename,
+        size=size,
+        meta={"student_id": student_id, "doc_type": doc_type.strip(), "user_id": str(user.get("id") or user.get("_id"))},
+    )
+    return {"upload_id": session["upload_id"], "offset": 0, "size": session["size"]}
+
+
+def _owned_upload_session(upload_id: str, user: dict) -> dict:
+    session = get_upload_session(upload_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Upload session not found or expired")
+    if str(session.get("user_id")) != str(user.get("id") or user.get("_id")):
+        raise HTTPException(status_code=403, detail="Forbidden")
+    return session
+
+
+@router.get("/uploads/{upload_id}")
+async def student_upload_session_status(upload_id: str, user=Depends(require_role("admin", "agent", "secretary", "admission_director"))):
+    session = _owned_upload_session(upload_id, user)
+    return {"upload_id": upload_id, "offset": session["offset"], "size": session["size"]}
+
+
+@router.put("/uploads/{upload_id}")
+async def student_upload_session_chunk(
+    request: Request,
+    upload_id: str,
+    offset: int,
+    user=Depends(require_role("admin", "agent", "secretary", "admission_director")),
+):
+    session = _owned_upload_session(upload_id, user)
+    try:
+        new_offset = await append_upload_chunk(upload_id, offset, request.stream())
+    except UploadOffsetMismatch as exc:
+        raise HTTPException(status_code=409, detail={"offset": exc.expected})
+    return {"upload_id": upload_id, "offset": new_offset, "size": session["size"]}
+
+
+@router.post("/uploads/{upload_id}/finalize")
+async def student_upload_session_finalize(
+    upload_id: str,
+    background_tasks: BackgroundTasks,
+    user=Depends(require_role("admin", "agent", "secretary", "admission_director")),
+    db=Depends(db_dep),
+):
+    session = _owned_upload_session(upload_id, user)
+    try:
+        original, stored, size, sha256 = finalize_upload_session(upload_id)
+    except UploadOffsetMismatch as exc:
+        raise HTTPException(status_code=409, detail={"offset": exc.expected})
+
+    try:
+        document_id = await add_student_document(
+            db,
+            student_id=session["student_id"],
+            doc_type=session["doc_type"],
+            original_filename=original,
+            stored_filename=stored,
+            stored_path=str(stored_path_for(stored)),
+            size_bytes=size,
+            uploaded_by_user_id=session.get("user_id"),
+            sha256=sha256,
+        )
+    except Exception:
+        delete_stored_file(str(stored_path_for(stored)))
+        raise
+    background_tasks.add_task(
+        warm_thumbnail,
+        {"original_filename": original, "stored_filename": stored, "stored_path": str(stored_path_for(stored)), "sha256": sha256},
+    )
+    return {"document_id": document_id, "student_id": session["student_id"]}
+
+
+@router.delete("/uploads/{upload_id}")
+async def student_upload_session_cancel(upload_id: str, user=Depends(require_role("admin", "agent", "secretary", "admission_director"))):
+    _owned_upload_session(upload_id, user)
+    discard_upload_session(upload_id)
+    return {"upload_id": upload_id, "cancelled": True}
+
+
 @router.get("/documents/{document_id}/download")
-async def student_document_download(document_id: int, user=Depends(require_role("admin", "agent", "secretary", "admission_director")), db=Depends(db_dep)):
+async def student_document_download(request: Request, document_id: int, user=Depends(require_role("admin", "agent", "secretary", "admission_director")), db=Depends(db_dep)):
     doc = await get_student_document(db, document_id)
     if not doc:
         raise HTTPException(status_code=404, detail="Not found")
     student = await get_student(db, int(doc["student_id"]))
     if not student:
         raise HTTPException(status_code=404, detail="Not found")
-    if user.get("role") == "agent" and student.get("agent_name") != user.get("full_name"):
+    if not can_access_student(user, student):
         raise HTTPException(status_code=403, detail="Forbidden")
-    path = Path(doc["stored_path"])
-    if not path.exists():
+    path = resolve_stored_path(doc["stored_path"])
+    if path is None:
         raise HTTPException(status_code=404, detail="File missing")
-    return FileResponse(path, filename=doc["original_filename"], media_type="application/octet-stream")
+    return stored_file_response(
+        request, path, filename=doc["original_filename"], media_type="application/octet-stream", digest=doc.get("sha256")
+    )
 
 
 @router.get("/documents/{document_id}/preview")
-async def student_document_preview(document_id: int, user=Depends(require_role("admin", "agent", "secretary", "admission_director")), db=Depends(db_dep)):
+async def student_document_preview(request: Request, document_id: int, user=Depends(require_role("admin", "agent", "secretary", "admission_director")), db=Depends(db_dep)):
     doc = await get_student_document(db, document_id)
     if not doc:
         raise HTTPException(status_code=404, detail="Not found")
@@ -221,11 +501,11 @@ async def student_document_preview(document_id: int, user=Depends(require_role("
     student = await get_student(db, student_id)
     if not student:
         raise HTTPException(status_code=404, detail="Not found")
-    if user.get("role") == "agent" and student.get("agent_name") != user.get("full_name"):
+    if not can_access_student(user, student):
         raise HTTPException(status_code=403, detail="Forbidden")
     
-    path = Path(doc["stored_path"])
-    if not path.exists():
+    path = resolve_stored_path(doc["stored_path"])
+    if path is None:
         raise HTTPException(status_code=404, detail="File missing")
         
     ext = path.suffix.lower()
@@ -237,7 +517,24 @@ async def student_document_preview(document_id: int, user=Depends(require_role("
     elif ext == ".png":
         media_type = "image/png"
         
-    return FileResponse(path, media_type=media_type)
+    return stored_file_response(request, path, media_type=media_type, digest=doc.get("sha256"), inline=True)
+
+
+@router.get("/documents/{document_id}/thumb")
+async def student_document_thumb(request: Request, document_id: int, user=Depends(require_role("admin", "agent", "secretary", "admission_director")), db=Depends(db_dep)):
+    doc = await get_student_document(db, document_id)
+    if not doc:
+        raise HTTPException(status_code=404, detail="Not found")
+    student = await get_student(db, int(doc["student_id"]))
+    if not student:
+        raise HTTPException(status_code=404, detail="Not found")
+    if not can_access_student(user, student):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+    path = await get_thumbnail(doc)
+    if path is None:
+        raise HTTPException(status_code=404, detail="No thumbnail")
+    return stored_file_response(request, path, media_type="image/webp", digest=f"thumb-{path.stem}", inline=True)
 
 
 @router.post("/documents/{document_id}/delete")
@@ -248,13 +545,11 @@ async def student_document_delete(request: Request, document_id: int, user=Depen
     student = await get_student(db, int(doc["student_id"]))
     if not student:
         raise HTTPException(status_code=404, detail="Not found")
-    if user.get("role") == "agent" and student.get("agent_name") != user.get("full_name"):
+    if not can_access_student(user, student):
         raise HTTPException(status_code=403, detail="Forbidden")
-    try:
-        Path(doc["stored_path"]).unlink(missing_ok=True)
-    except Exception:
-        pass
-    await delete_student_document(db, document_id)
+    delete_stored_file(doc["stored_path"])
+    delete_thumbnail(doc)
+    await delete_student_document(db, document_id, deleted_by_user_id=user.get("id"))
     flash_success(request, "Document supprimé")
     return RedirectResponse(url=f"/students/{doc['student_id']}", status_code=303)
 
@@ -264,12 +559,13 @@ async def student_edit_get(request: Request, student_id: int, user=Depends(requi
     student = await get_student(db, student_id)
     if not student:
         return RedirectResponse(url="/students", status_code=303)
-    if user.get("role") == "agent" and student.get("agent_name") != user.get("full_name"):
+    if not can_access_student(user, student):
         raise HTTPException(status_code=403, detail="Forbidden")
     statuses = await list_statuses(db)
+    agents = await list_users(db)
     return templates.TemplateResponse(
         "students/form.html",
-        {"request": request, "user": user, "student": student, "statuses": statuses},
+        {"request": request, "user": user, "student": student, "statuses": statuses, "agents": agents},
     )
 
 
@@ -286,10 +582,20 @@ async def student_edit_post(
     program_choice: str = Form(...),
     university: str = Form(...),
     status_id: str = Form(""),
-    agent_name: str = Form(...),
+    agent_user_id: str = Form(""),
     notes: str = Form(""),
     db=Depends(db_dep),
 ):
+    student = await get_student(db, student_id)
+    if not student:
+        return RedirectResponse(url="/students", status_code=303)
+    agent = await _assigned_agent(db, user, agent_user_id)
+    if agent:
+        agent_name, agent_id = agent["full_name"], agent.get("id") or str(agent.get("_id"))
+    else:
+        # Left unset on a legacy row whose agent matches no account: keep it as it was.
+        agent_name, agent_id = student.get("agent_name") or "", student.get("agent_user_id")
+
     sid = int(status_id) if status_id else None
     changed_by = user.get("id") if "id" in user else None
     await update_student(
@@ -304,6 +610,7 @@ async def student_edit_post(
         university=university,
         status_id=sid,
         agent_name=agent_name,
+        agent_user_id=agent_id,
         notes=notes,
         changed_by_user_id=changed_by,
     )
@@ -316,8 +623,15 @@ async def student_delete_post(request: Request, student_id: int, user=Depends(re
     student = await get_student(db, student_id)
     if not student:
         return RedirectResponse(url="/students", status_code=303)
-    if user.get("role") == "agent" and student.get("agent_name") != user.get("full_name"):
+    if not can_access_student(user, student):
         raise HTTPException(status_code=403, detail="Forbidden")
-    await delete_student(db, student_id)
+    try:
+        removed = await delete_student(db, student_id, deleted_by_user_id=user.get("id"))
+    except PeriodClosed:
+        flash_error(request, "Suppression impossible : des paiements de cet étudiant sont dans une période comptable clôturée")
+        return RedirectResponse(url=f"/students/{student_id}", status_code=303)
+    for f in removed:
+        delete_stored_file(f.get("stored_path"))
+        delete_thumbnail(f)
     flash_success(request, "Étudiant supprimé")
     return RedirectResponse(url="/students", status_code=303)
@@ -1,9 +1,7 @@
-from fastapi import APIRouter, Depends, Form, Request
+from fastapi import APIRouter, Depends, Form, HTTPException, Request
 from fastapi.responses import RedirectResponse
 from app.deps import db_dep, require_role, get_current_user
 from app.data.tasks import list_tasks, create_task, update_task_status, delete_task
-from app.data.students import list_students
-from app.data.users import list_users
 from app.templating import templates
 from app.flash import flash_success
 
@@ -13,14 +11,21 @@ router = APIRouter(prefix="/tasks", tags=["tasks"])
 async def tasks_list(request: Request, user=Depends(require_role("admin", "agent", "operation_director")), db=Depends(db_dep)):
     user_id = user.get("id") if user.get("role") == "agent" else None
     tasks = await list_tasks(db, user_id=user_id)
-    students = await list_students(db)
-    users = await list_users(db)
-    
+    # Student and assignee pickers are filled on demand from /lookup.
     return templates.TemplateResponse(
-        "tasks/list.html", 
-        {"request": request, "user": user, "tasks": tasks, "students": students, "users": users}
+        "tasks/list.html",
+        {"request": request, "user": user, "tasks": tasks}
     )
 
+def _optional_id(value: str, label: str) -> int | None:
+    # Typeahead pickers left empty post "" rather than omitting the field.
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"{label} invalide")
+
 @router.post("/new")
 async def task_new(
     request: Request,
@@ -28,8 +33,8 @@ async def task_new(
     description: str = Form(None),
     due_date: str = Form(None),
     priority: str = Form("medium"),
-    assigned_to_user_id: int = Form(None),
-    student_id: int = Form(None),
+    assigned_to_user_id: str = Form(""),
+    student_id: str = Form(""),
     user=Depends(require_role("admin", "agent", "operation_director")),
     db=Depends(db_dep)
 ):
@@ -39,8 +44,8 @@ async def task_new(
         description=description,
         due_date=due_date,
         priority=priority,
-        assigned_to_user_id=assigned_to_user_id,
-        student_id=student_id
+        assigned_to_user_id=_optional_id(assigned_to_user_id, "Utilisateur"),
+        student_id=_optional_id(student_id, "Étudiant")
     )
     flash_success(request, "Tâche créée avec succès")
     return RedirectResponse(url="/tasks", status_code=303)
@@ -52,7 +57,7 @@ async def task_status_update(
     user=Depends(require_role("admin", "agent", "operation_director")),
     db=Depends(db_dep)
 ):
-    await update_task_status(db, task_id, status)
+    await update_task_status(db, task_id, status, changed_by_user_id=user.get("id"))
     return RedirectResponse(url="/tasks", status_code=303)
 
 @router.post("/{task_id}/delete")
@@ -0,0 +1,58 @@
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List
+
+from app.core.config import settings
+from app.data.locks import release_lock, try_acquire_lock
+from app.data.tasks import notify_overdue_tasks
+
+log = logging.getLogger(__name__)
+
+Job = Callable[[Any], Awaitable[Any]]
+
+# Identifies this worker in scheduler_locks; every uvicorn worker runs the loop but
+# only the lease holder does the work.
+OWNER = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+_tasks: List[asyncio.Task] = []
+
+
+def _jobs() -> Dict[str, tuple[float, Job]]:
+    jobs: Dict[str, tuple[float, Job]] = {}
+    if settings.task_reminder_interval_seconds > 0:
+        jobs["overdue_tasks"] = (settings.task_reminder_interval_seconds, notify_overdue_tasks)
+    return jobs
+
+
+async def _loop(db: Any, name: str, interval: float, job: Job) -> None:
+    # The lease outlives one interval so a slow run does not hand the job to another
+    # worker mid-way, and a dead leader is replaced after at most two intervals.
+    ttl = interval * 2
+    while True:
+        try:
+            if await asyncio.to_thread(try_acquire_lock, name, OWNER, ttl):
+                await job(db)
+        except Exception:
+            log.exception("scheduled job %s failed", name)
+        await asyncio.sleep(interval)
+
+
+def start_scheduler(db: Any) -> None:
+    """Start the periodic jobs of this worker (SQLite only: the jobs and the lock table live there)."""
+    if settings.db_backend != "sqlite" or _tasks:
+        return
+    for name, (interval, job) in _jobs().items():
+        _tasks.append(asyncio.create_task(_loop(db, name, interval, job), name=f"scheduler:{name}"))
+
+
+async def stop_scheduler() -> None:
+    for t in _tasks:
+        t.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
+    _tasks.clear()
+    if settings.db_backend == "sqlite":
+        for name in _jobs():
+            release_lock(name, OWNER)
@@ -0,0 +1,36 @@
+import asyncio
+from time import perf_counter
+from typing import Any, Awaitable, Callable
+
+from app.core.config import settings
+
+Section = Callable[[], Awaitable[Any]]
+
+
+async def _timed(section: Section) -> tuple[Any, float]:
+    start = perf_counter()
+    result = await section()
+    return result, (perf_counter() - start) * 1000
+
+
+async def load_sections(**sections: Section) -> tuple[dict[str, Any], dict[str, float]]:
+    """Run independent page sections concurrently, on the event loop.
+
+    The data functions used as sections read SQLite in a worker thread (each with
+    its own connection), so their queries overlap; in-memory sections such as the
+    catalog stay on the loop.
+
+    Returns the results and the duration of each section in milliseconds, keyed
+    by the keyword each section was passed under.
+    """
+    outcomes = await asyncio.gather(*(_timed(s) for s in sections.values()))
+    results = {name: result for name, (result, _ms) in zip(sections, outcomes)}
+    timings = {name: ms for name, (_result, ms) in zip(sections, outcomes)}
+    return results, timings
+
+
+def server_timing_headers(timings: dict[str, float]) -> dict[str, str]:
+    """``Server-Timing`` header with the section breakdown, only in debug mode."""
+    if not settings.debug:
+        return {}
+    return {"Server-Timing": ", ".join(f"{name};dur={ms:.1f}" for name, ms in timings.items())}
@@ -1,11 +1,29 @@
+import fcntl
+import hashlib
+import json
 import os
+import shutil
+import time
 import uuid
 from pathlib import Path
+from typing import AsyncIterator
+from urllib.parse import quote
 
-from fastapi import UploadFile
+from fastapi import Request, UploadFile
+from fastapi.responses import FileResponse, Response
+
+from app.core.config import settings
 
 
 UPLOADS_DIR = Path("uploads")
+PARTIAL_DIR = UPLOADS_DIR / ".partial"
+
+# Two levels of 256 buckets keep every directory small even with millions of files.
+SHARD_DEPTH = 2
+SHARD_WIDTH = 2
+
+# Stored files are never rewritten after upload, so clients may keep them for a year.
+IMMUTABLE_CACHE_CONTROL = "private, max-age=31536000, immutable"
 
 
 def ensure_uploads_dir() -> None:
@@ -18,20 +36,246 @@ def safe_filename(original: str) -> str:
     return name or "file"
 
 
-async def save_upload(file: UploadFile) -> tuple[str, str, int]:
+def shard_dir(stored: str) -> Path:
+    digest = hashlib.md5(stored.encode("utf-8")).hexdigest()
+    parts = [digest[i * SHARD_WIDTH:(i + 1) * SHARD_WIDTH] for i in range(SHARD_DEPTH)]
+    return UPLOADS_DIR.joinpath(*parts)
+
+
+def stored_path_for(stored: str) -> Path:
+    return shard_dir(stored) / stored
+
+
+def resolve_stored_path(stored_path: str | None) -> Path | None:
+    """Locate a stored file whether it still sits in the flat layout or was already sharded."""
+    if not stored_path:
+        return None
+    path = Path(stored_path)
+    if path.exists():
+        return path
+    sharded = stored_path_for(path.name)
+    if sharded.exists():
+        return sharded
+    flat = UPLOADS_DIR / path.name
+    if flat.exists():
+        return flat
+    return None
+
+
+def delete_stored_file(stored_path: str | None) -> None:
+    path = resolve_stored_path(stored_path)
+    if path is None:
+        return
+    try:
+        path.unlink(missing_ok=True)
+    except OSError:
+        pass
+
+
+class StoredFileResponse(FileResponse):
+    # Larger reads than Starlette's 64 KiB default: fewer event-loop round trips per file.
+    chunk_size = 1024 * 1024
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [t.strip() for t in if_none_match.split(",")]
+    return etag in candidates or f"W/{etag}" in candidates
+
+
+def stored_file_response(
+    request: Request,
+    path: Path,
+    *,
+    media_type: str,
+    filename: str | None = None,
+    digest: str | None = None,
+    inline: bool = False,
+    cache_control: str = IMMUTABLE_CACHE_CONTROL,
+) -> Response:
+    """Serve a stored upload with a strong ETag, long-lived private caching and byte ranges."""
+    st = path.stat()
+    etag = f'"{digest}"' if digest else f'"{st.st_size:x}-{st.st_mtime_ns:x}"'
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    return StoredFileResponse(
+        path,
+        headers=headers,
+        media_type=media_type,
+        filename=filename,
+        stat_result=st,
+        content_disposition_type="inline" if inline else "attachment",
+    )
+
+
+def content_response(
+    request: Request,
+    content: bytes,
+    *,
+    media_type: str,
+    filename: str,
+    digest: str,
+    inline: bool = False,
+    cache_control: str = "private, no-cache",
+) -> Response:
+    """Serve generated bytes (e.g. a rendered PDF) with the same ETag handling as stored files."""
+    etag = f'"{digest}"'
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    disposition = "inline" if inline else "attachment"
+    quoted = quote(filename)
+    if quoted != filename:
+        headers["Content-Disposition"] = f"{disposition}; filename*=utf-8''{quoted}"
+    else:
+        headers["Content-Disposition"] = f'{disposition}; filename="{filename}"'
+    return Response(content, media_type=media_type, headers=headers)
+
+
+async def save_upload(file: UploadFile) -> tuple[str, str, int, str]:
     ensure_uploads_dir()
 
     original = safe_filename(file.filename or "file")
     stored = f"{uuid.uuid4().hex}_{original}"
-    path = UPLOADS_DIR / stored
+    path = stored_path_for(stored)
+    path.parent.mkdir(parents=True, exist_ok=True)
 
     size = 0
+    digest = hashlib.sha256()
     with path.open("wb") as f:
         while True:
             chunk = await file.read(1024 * 1024)
             if not chunk:
                 break
             size += len(chunk)
+            digest.update(chunk)
             f.write(chunk)
 
-    return original, stored, size
+    return original, stored, size, digest.hexdigest()
+
+
+class UploadOffsetMismatch(ValueError):
+    def __init__(self, expected: int):
+        super().__init__(f"expected offset {expected}")
+        self.expected = expected
+
+
+def _session_dir(upload_id: str) -> Path | None:
+    if not upload_id or len(upload_id) != 32 or any(ch not in "0123456789abcdef" for ch in upload_id):
+        return None
+    return PARTIAL_DIR / upload_id
+
+
+def purge_expired_upload_sessions() -> int:
+    """Remove partial uploads that were not touched within UPLOAD_SESSION_TTL_HOURS."""
+    if not PARTIAL_DIR.exists():
+        return 0
+    cutoff = time.time() - settings.upload_session_ttl_hours * 3600
+    removed = 0
+    with os.scandir(PARTIAL_DIR) as it:
+        for entry in it:
+            if not entry.is_dir():
+                continue
+            try:
+                last_write = os.stat(os.path.join(entry.path, "data")).st_mtime
+            except FileNotFoundError:
+                last_write = 0
+            if last_write < cutoff:
+                shutil.rmtree(entry.path, ignore_errors=True)
+                removed += 1
+    return removed
+
+
+def create_upload_session(*, filename: str, size: int, meta: dict) -> dict:
+    purge_expired_upload_sessions()
+
+    upload_id = uuid.uuid4().hex
+    session = PARTIAL_DIR / upload_id
+    session.mkdir(parents=True, exist_ok=True)
+    info = {"filename": safe_filename(filename), "size": int(size), "created_at": int(time.time()), **meta}
+    (session / "meta.json").write_text(json.dumps(info), encoding="utf-8")
+    (session / "data").touch()
+    return {"upload_id": upload_id, "offset": 0, **info}
+
+
+def get_upload_session(upload_id: str) -> dict | None:
+    session = _session_dir(upload_id)
+    if session is None or not (session / "meta.json").exists():
+        return None
+    info = json.loads((session / "meta.json").read_text(encoding="utf-8"))
+    data = session / "data"
+    offset = data.stat().st_size if data.exists() else 0
+    return {"upload_id": upload_id, "offset": offset, **info}
+
+
+def _lock_session_data(f, current_offset: int) -> None:
+    # An exclusive lock on the data file, held from the offset check to the last write,
+    # serialises requests for one upload across workers. A second request does not
+    # wait: it gets the usual mismatch and resumes from the offset it then reads.
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        raise UploadOffsetMismatch(current_offset)
+
+
+async def append_upload_chunk(upload_id: str, offset: int, chunks: AsyncIterator[bytes]) -> int:
+    """Append a chunk at ``offset``; the offset must equal the bytes already received."""
+    info = get_upload_session(upload_id)
+    if info is None:
+        raise FileNotFoundError(upload_id)
+
+    data = PARTIAL_DIR / upload_id / "data"
+    with data.open("r+b") as f:
+        _lock_session_data(f, info["offset"])
+        written = os.fstat(f.fileno()).st_size
+        if offset != written:
+            raise UploadOffsetMismatch(written)
+        f.seek(written)
+        async for chunk in chunks:
+            if not chunk:
+                continue
+            if written + len(chunk) > info["size"]:
+                # never keep more than was announced; the client resumes from the truncated offset
+                f.truncate(written)
+                raise UploadOffsetMismatch(written)
+            f.write(chunk)
+            written += len(chunk)
+    return written
+
+
+def finalize_upload_session(upload_id: str) -> tuple[str, str, int, str]:
+    """Move a complete upload into the store; returns the same tuple as save_upload()."""
+    info = get_upload_session(upload_id)
+    if info is None:
+        raise FileNotFoundError(upload_id)
+    if info["offset"] != info["size"]:
+        raise UploadOffsetMismatch(info["offset"])
+
+    session = PARTIAL_DIR / upload_id
+    data = session / "data"
+    digest = hashlib.sha256()
+    original = info["filename"]
+    stored = f"{uuid.uuid4().hex}_{original}"
+    path = stored_path_for(stored)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with data.open("rb") as f:
+        _lock_session_data(f, info["offset"])
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+        os.replace(data, path)
+    shutil.rmtree(session, ignore_errors=True)
+    return original, stored, info["size"], digest.hexdigest()
+
+
+def discard_upload_session(upload_id: str) -> None:
+    session = _session_dir(upload_id)
+    if session is not None:
+        shutil.rmtree(session, ignore_errors=True)
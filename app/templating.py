@@ -1,5 +1,6 @@
 from fastapi import Request
 from fastapi.templating import Jinja2Templates
+from app.data.catalog import catalog
 from app.flash import pop_flashes
 
 
@@ -33,3 +34,5 @@ class FlashTemplates(Jinja2Templates):
 
 
 templates = FlashTemplates(directory="templates")
+# O(1) id -> name lookups in templates, e.g. {{ catalog.user_name(s.agent_user_id) }}
+templates.env.globals["catalog"] = catalog
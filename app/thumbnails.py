@@ -0,0 +1,133 @@
+import asyncio
+import hashlib
+import os
+from pathlib import Path
+
+from app.core.config import settings
+from app.filecache import DirectoryCache
+from app.storage import UPLOADS_DIR, resolve_stored_path
+
+try:
+    from PIL import Image
+except ImportError:  # thumbnails are disabled without Pillow
+    Image = None
+
+try:
+    import pymupdf
+except ImportError:  # PDFs fall back to the generic icon without PyMuPDF
+    pymupdf = None
+
+
+THUMBS_DIR = UPLOADS_DIR / ".thumbs"
+THUMB_SIZE = (320, 320)
+
+IMAGE_EXTS = {".png", ".jpg", ".jpeg"}
+PDF_EXTS = {".pdf"}
+
+_render_slots = asyncio.Semaphore(2)
+# Renders run as their own tasks so a disconnecting client cannot abandon the
+# requests waiting on the same key.
+_inflight: dict[str, asyncio.Task] = {}
+
+_cache = DirectoryCache(THUMBS_DIR, lambda: settings.thumb_cache_max_mb * 1024 * 1024)
+
+
+def thumbnail_key(doc: dict) -> str:
+    return doc.get("sha256") or hashlib.sha256(str(doc.get("stored_filename") or doc.get("stored_path")).encode("utf-8")).hexdigest()
+
+
+def thumbnail_path(key: str) -> Path:
+    return THUMBS_DIR / key[:2] / f"{key}.webp"
+
+
+def _failure_marker(key: str) -> Path:
+    # Empty file left when a render fails; the key is the content hash, so a broken
+    # file stays broken and is not re-rendered on every page view.
+    return THUMBS_DIR / key[:2] / f"{key}.failed"
+
+
+def can_thumbnail(filename: str) -> bool:
+    ext = Path(filename or "").suffix.lower()
+    if ext in IMAGE_EXTS:
+        return Image is not None
+    if ext in PDF_EXTS:
+        return Image is not None and pymupdf is not None
+    return False
+
+
+def _render(src: Path, dest: Path) -> int:
+    ext = src.suffix.lower()
+    if ext in PDF_EXTS:
+        with pymupdf.open(src) as pdf:
+            page = pdf[0]
+            zoom = min(THUMB_SIZE[0] / page.rect.width, THUMB_SIZE[1] / page.rect.height)
+            pix = page.get_pixmap(matrix=pymupdf.Matrix(zoom, zoom), alpha=False)
+            img = Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+    else:
+        img = Image.open(src)
+        img.draft("RGB", THUMB_SIZE)  # lets the JPEG decoder downscale while decoding
+        img = img.convert("RGB")
+    img.thumbnail(THUMB_SIZE)
+
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dest.with_suffix(".tmp")
+    img.save(tmp, "WEBP", quality=70, method=4)
+    os.replace(tmp, dest)
+    return dest.stat().st_size
+
+
+def _generate(src: Path, dest: Path) -> None:
+    _cache.added(_render(src, dest))
+
+
+async def get_thumbnail(doc: dict) -> Path | None:
+    if not can_thumbnail(doc.get("original_filename") or ""):
+        return None
+
+    key = thumbnail_key(doc)
+    dest = thumbnail_path(key)
+    if dest.exists():
+        _cache.touch(dest)
+        return dest
+    if _failure_marker(key).exists():
+        return None
+
+    src = resolve_stored_path(doc.get("stored_path"))
+    if src is None:
+        return None
+
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.create_task(_render_once(src, dest, _failure_marker(key)))
+        _inflight[key] = task
+        task.add_done_callback(lambda _t: _inflight.pop(key, None))
+    ok = await asyncio.shield(task)
+    return dest if ok and dest.exists() else None
+
+
+async def _render_once(src: Path, dest: Path, failure_marker: Path) -> bool:
+    try:
+        async with _render_slots:
+            await asyncio.to_thread(_generate, src, dest)
+        return True
+    except Exception:
+        try:
+            failure_marker.parent.mkdir(parents=True, exist_ok=True)
+            failure_marker.touch()
+        except OSError:
+            pass
+        return False
+
+
+async def warm_thumbnail(doc: dict) -> None:
+    """Background hook run after an upload so the first listing already has its thumbnail."""
+    await get_thumbnail(doc)
+
+
+def delete_thumbnail(doc: dict) -> None:
+    key = thumbnail_key(doc)
+    for p in (thumbnail_path(key), _failure_marker(key)):
+        try:
+            p.unlink(missing_ok=True)
+        except OSError:
+            pass
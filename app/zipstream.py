@@ -0,0 +1,104 @@
+import io
+import time
+import zipfile
+from pathlib import Path
+from typing import Iterable, Iterator
+
+
+# Formats that are already compressed gain nothing from deflate; store them as-is.
+_STORED_EXTS = {".pdf", ".png", ".jpg", ".jpeg", ".docx", ".xlsx", ".zip", ".webp"}
+
+CHUNK_SIZE = 256 * 1024
+
+
+class _Sink(io.RawIOBase):
+    """Write-only, non-seekable buffer that the zip writer fills and the caller drains."""
+
+    def __init__(self) -> None:
+        self._buf = bytearray()
+        self._pos = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self._buf += b
+        self._pos += len(b)
+        return len(b)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = bytes(self._buf)
+        self._buf.clear()
+        return data
+
+
+def _compress_type(name: str) -> int:
+    return zipfile.ZIP_STORED if Path(name).suffix.lower() in _STORED_EXTS else zipfile.ZIP_DEFLATED
+
+
+class ZipStreamWriter:
+    """Push-style zip writer: every call returns the archive bytes produced so far.
+
+    Lets sync and async producers alike emit an archive without a temp file or
+    a full in-memory copy.
+    """
+
+    def __init__(self) -> None:
+        self._sink = _Sink()
+        self._zf = zipfile.ZipFile(self._sink, mode="w", allowZip64=True)
+        self._entry = None
+
+    def open_entry(self, arcname: str) -> bytes:
+        pending = self.close_entry()
+        info = zipfile.ZipInfo(arcname, date_time=time.localtime()[:6])
+        info.compress_type = _compress_type(arcname)
+        self._entry = self._zf.open(info, mode="w", force_zip64=True)
+        return pending + self._sink.drain()
+
+    def write(self, data: bytes) -> bytes:
+        self._entry.write(data)
+        return self._sink.drain()
+
+    def close_entry(self) -> bytes:
+        if self._entry is not None:
+            self._entry.close()
+            self._entry = None
+        return self._sink.drain()
+
+    def add(self, arcname: str, data: bytes) -> bytes:
+        return self.open_entry(arcname) + self.write(data) + self.close_entry()
+
+    def close(self) -> bytes:
+        pending = self.close_entry()
+        self._zf.close()
+        return pending + self._sink.drain()
+
+
+def iter_zip(entries: Iterable[tuple[str, bytes | Path]]) -> Iterator[bytes]:
+    """Yield a zip archive piece by piece.
+
+    Each entry is ``(arcname, content)`` where content is either bytes or a path
+    read in chunks, so memory stays bounded by CHUNK_SIZE whatever the archive size.
+    """
+    zw = ZipStreamWriter()
+    for arcname, content in entries:
+        if isinstance(content, (bytes, bytearray)):
+            yield zw.add(arcname, content)
+            continue
+        yield zw.open_entry(arcname)
+        with open(content, "rb") as src:
+            while True:
+                chunk = src.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                data = zw.write(chunk)
+                if data:
+                    yield data
+        yield zw.close_entry()
+    yield zw.close()
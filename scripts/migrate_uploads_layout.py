@@ -0,0 +1,155 @@
+"""Move files from the flat uploads/ directory into the sharded layout.
+
+Safe to run while the app is serving traffic and safe to interrupt: files are
+moved with an atomic rename, and the download routes resolve both layouts, so a
+row pointing at the old location keeps working until its path is rewritten.
+Re-running the script picks up where the previous run stopped.
+
+    python scripts/migrate_uploads_layout.py --batch-size 500 --sleep 0.2
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.config import settings
+from app.data.sqlite import conn
+from app.storage import UPLOADS_DIR, stored_path_for
+
+
+def _flat_files(limit: int) -> list[str]:
+    names = []
+    with os.scandir(UPLOADS_DIR) as it:
+        for entry in it:
+            if entry.is_file(follow_symlinks=False) and not entry.name.startswith("."):
+                names.append(entry.name)
+                if len(names) >= limit:
+                    break
+    return names
+
+
+# The path columns are not indexed by the app; without these every rewritten file
+# would scan both tables. They only live for the duration of the migration.
+_PATH_INDEXES = (
+    ("tmp_migrate_documents_path", "student_documents", "stored_path"),
+    ("tmp_migrate_payments_receipt", "payments", "receipt_stored_path"),
+)
+
+
+def _path_indexes(create: bool) -> None:
+    if settings.db_backend != "sqlite":
+        return
+    c = conn()
+    try:
+        for name, table, column in _PATH_INDEXES:
+            if create:
+                c.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table}({column})")
+            else:
+                c.execute(f"DROP INDEX IF EXISTS {name}")
+        c.commit()
+    finally:
+        c.close()
+
+
+def _rewrite_paths(pairs: list[tuple[str, str]]) -> None:
+    if settings.db_backend != "sqlite" or not pairs:
+        return
+    c = conn()
+    try:
+        c.executemany("UPDATE student_documents SET stored_path=? WHERE stored_path=?", pairs)
+        c.executemany("UPDATE payments SET receipt_stored_path=? WHERE receipt_stored_path=?", pairs)
+        c.commit()
+    finally:
+        c.close()
+
+
+def move_batch(batch_size: int, dry_run: bool) -> int:
+    names = _flat_files(batch_size)
+    pairs = []
+    for name in names:
+        src = UPLOADS_DIR / name
+        dst = stored_path_for(name)
+        if dry_run:
+            print(f"[dry-run] {src} -> {dst}")
+            continue
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(src, dst)
+        pairs.append((str(dst), str(src)))
+    _rewrite_paths(pairs)
+    return len(names)
+
+
+def repair_rows(batch_size: int) -> int:
+    """Rewrite rows still pointing at the flat layout (e.g. after an interrupted run)."""
+    if settings.db_backend != "sqlite":
+        return 0
+
+    fixed = 0
+    for table, column in (("student_documents", "stored_path"), ("payments", "receipt_stored_path")):
+        last_id = 0
+        while True:
+            c = conn()
+            try:
+                rows = c.execute(
+                    f"SELECT id, {column} AS p FROM {table} WHERE id > ? AND {column} IS NOT NULL ORDER BY id LIMIT ?",
+                    (last_id, batch_size),
+                ).fetchall()
+            finally:
+                c.close()
+            if not rows:
+                break
+            last_id = rows[-1]["id"]
+
+            updates = []
+            for r in rows:
+                name = os.path.basename(r["p"])
+                target = stored_path_for(name)
+                if r["p"] != str(target) and target.exists():
+                    updates.append((str(target), r["id"]))
+            if updates:
+                c = conn()
+                try:
+                    c.executemany(f"UPDATE {table} SET {column}=? WHERE id=?", updates)
+                    c.commit()
+                finally:
+                    c.close()
+            fixed += len(updates)
+    return fixed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--sleep", type=float, default=0.2, help="pause between batches, in seconds")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    if not UPLOADS_DIR.exists():
+        print(f"{UPLOADS_DIR} not found, nothing to migrate.")
+        return
+
+    total = 0
+    if not args.dry_run:
+        _path_indexes(create=True)
+    try:
+        while True:
+            moved = move_batch(args.batch_size, args.dry_run)
+            total += moved
+            if moved:
+                print(f"moved {total} files so far")
+            if moved < args.batch_size or args.dry_run:
+                break
+            time.sleep(args.sleep)
+    finally:
+        if not args.dry_run:
+            _path_indexes(create=False)
+
+    if not args.dry_run:
+        fixed = repair_rows(args.batch_size)
+        print(f"done: {total} files moved, {fixed} stale rows rewritten")
+
+
+if __name__ == "__main__":
+    main()
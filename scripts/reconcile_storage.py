@@ -0,0 +1,56 @@
+"""Reconcile uploads/ with student_documents and payments.
+
+Reports orphaned files (no row references them) and dangling references
+(rows whose file is missing). Nothing is deleted unless --delete is given.
+
+    python scripts/reconcile_storage.py                 # report only
+    python scripts/reconcile_storage.py --verify        # also check SHA-256 of referenced files
+    python scripts/reconcile_storage.py --delete --batch-size 200 --sleep 1
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.db import get_db
+from app.reconcile import reconcile
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--verify", action="store_true", help="verify checksums of referenced files")
+    parser.add_argument("--delete", action="store_true", help="delete orphaned files")
+    parser.add_argument("--grace", type=int, default=3600, help="ignore files younger than this many seconds")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--sleep", type=float, default=0.5, help="pause between delete batches, in seconds")
+    args = parser.parse_args()
+
+    report = await reconcile(
+        get_db(),
+        verify_checksums=args.verify,
+        delete_orphans=args.delete,
+        grace_seconds=args.grace,
+        batch_size=args.batch_size,
+        pause_seconds=args.sleep,
+    )
+
+    print(f"rows scanned:  {report.rows_scanned}")
+    print(f"files scanned: {report.files_scanned}")
+    print(f"orphaned files: {len(report.orphans)}")
+    for p in report.orphans[:50]:
+        print(f"  {p}")
+    print(f"dangling references: {len(report.dangling)}")
+    for table, row_id, path in report.dangling[:50]:
+        print(f"  {table}#{row_id} -> {path}")
+    if args.verify:
+        print(f"checksum mismatches: {len(report.checksum_mismatches)}")
+        for table, row_id, path in report.checksum_mismatches[:50]:
+            print(f"  {table}#{row_id} -> {path}")
+    if args.delete:
+        print(f"deleted {report.deleted} files ({report.deleted_bytes // 1024} KiB)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
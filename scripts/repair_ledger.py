@@ -0,0 +1,28 @@
+"""Recompute every student's paid_total and balance from the payments table.
+
+The columns are maintained on each payment write; this repairs them after manual
+edits to the database or an interrupted migration. Only drifted rows are rewritten.
+
+    python scripts/repair_ledger.py
+"""
+import asyncio
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.config import settings
+from app.data.ledger import repair_ledger
+from app.data.sqlite import init_sqlite
+from app.db import get_db
+
+
+async def main() -> None:
+    if settings.db_backend == "sqlite":
+        init_sqlite()
+    fixed = await repair_ledger(get_db())
+    print(f"students corrected: {fixed}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())